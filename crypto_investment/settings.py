@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'investment_app.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'investment_app.middleware.AsOfClockMiddleware',
 ]
 
 ROOT_URLCONF = 'crypto_investment.urls'
@@ -77,6 +79,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock up front and wait for it, instead of failing
+        # with "database is locked" when concurrent requests write
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file rather than the shared in-memory database, which ignores the
+        # timeout, so the threaded tests' writers queue for the lock too
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -129,6 +140,57 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Covering-index columns (Index.include) only apply on PostgreSQL
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Maximum number of SQL queries per view (by URL name). Requests over budget
+# are logged by QueryInstrumentationMiddleware and fail
+# investment_app.testing.assert_query_budget in tests.
+QUERY_BUDGETS = {
+    'index': 3,
+    'home': 3,
+    'investment_plans': 3,
+    'about': 2,
+    'terms': 2,
+    'privacy': 2,
+    'dashboard': 15,
+    'profile': 3,
+    # POST: investment, Transaction, wallet debit, ledger entry and principal rollup, plus
+    # reloading the plan catalog and refilling the reference code block now and then
+    'invest': 16,
+    'withdraw': 6,  # POST: balance check and the pending Transaction (plus a code block refill)
+    'transactions': 5,
+    'deposit': 3,
+    'deposit_history': 3,
+    'admin_deposit_list': 4,
+    'referrals': 7,
+    'liability_forecast': 5,
+    # Admin changelists
+    'investment_app_deposit_changelist': 5,
+    'investment_app_investment_changelist': 6,
+    'investment_app_transaction_changelist': 5,
+    'investment_app_referral_changelist': 5,
+    'investment_app_userprofile_changelist': 5,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # Requests over their query budget are logged as warnings. Set
+        # QUERY_LOG_LEVEL=INFO (with DEBUG off) for one JSON line per request
+        # with query count, SQL time and duplicates.
+        'investment_app.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 # Add to the bottom of settings.py
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'index'
@@ -138,3 +200,53 @@ LOGIN_URL = 'login'
 # SESSION_COOKIE_SECURE = True
 # CSRF_COOKIE_SECURE = True
 # SECURE_SSL_REDIRECT = True  # If using SSL
+
+# Celery
+# Set CELERY_TASK_ALWAYS_EAGER=1 to run tasks (including the sharded
+# accrual fan-out) inline without a broker, e.g. for local testing.
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1'
+CELERY_BROKER_URL = os.environ.get(
+    'CELERY_BROKER_URL', 'memory://' if CELERY_TASK_ALWAYS_EAGER else 'amqp://guest@localhost//'
+)
+CELERY_TASK_EAGER_PROPAGATES = CELERY_TASK_ALWAYS_EAGER
+
+# Number of user-id shards the nightly accrual is fanned out to
+ACCRUAL_SHARDS = int(os.environ.get('ACCRUAL_SHARDS', 8))
+
+# Cache
+# CACHE_BACKEND selects the backend: 'locmem' (default; per process, fine
+# for tests and a single worker), 'file' (shared by the workers on one
+# machine, the local stand-in for Redis) or 'redis' (any Redis-compatible
+# server at CACHE_LOCATION).
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', '/var/tmp/crypto_investment_cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'crypto_investment',
+        }
+    }
+CACHES['default']['KEY_PREFIX'] = 'crypto_investment'
+
+# Seconds a dashboard fragment may be served from cache; changes to the
+# user's data expire it sooner (see investment_app/caching.py)
+DASHBOARD_FRAGMENT_TIMEOUT = 300
+
+# Deposit references and referral codes are numbered from counter rows;
+# each process reserves this many numbers per round trip (see
+# investment_app/codes.py). 1 gives consecutive codes at one UPDATE each.
+CODE_BLOCK_SIZE = int(os.environ.get('CODE_BLOCK_SIZE', 20))
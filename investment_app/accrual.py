@@ -0,0 +1,131 @@
+"""
+Set-based daily earnings accrual.
+
+Instead of loading every Investment and saving its owner's profile one by
+one, active investments are streamed as plain tuples, summed per user in
+memory and written back with one bulk INSERT and one batched UPDATE per
+chunk of users.
+"""
+from decimal import Decimal
+from django.db import transaction
+from .models import DailyEarning, Transaction
+from . import wallet
+from .rollups import add_lifetime_earnings, refresh_earning_windows
+from .utils import bulk_increment
+
+# Number of users whose accruals are written per round trip
+CHUNK_SIZE = 2000
+
+
+def daily_return(amount, daily_rate):
+    """Same arithmetic as Investment.calculate_daily_return()"""
+    return ((amount * daily_rate) / 100).quantize(Decimal('0.01'))
+
+
+def accrual_rows(investments):
+    """
+    Yield (user_id, investment_id, daily_return) for every investment,
+    ordered by user so one user's investments always arrive together.
+    """
+    rows = investments.order_by('user_id', 'pk').values_list(
+        'user_id', 'pk', 'amount', 'plan__daily_return'
+    )
+    for user_id, investment_id, amount, daily_rate in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield user_id, investment_id, daily_return(amount, daily_rate)
+
+
+def write_accruals(run_date, accruals, record_transactions=False):
+    """
+    Persist one chunk of accruals.
+
+    `accruals` maps user_id -> (investment id, total daily return).
+    Adds to the user's DailyEarning for `run_date` (creating it if needed),
+    credits total_earnings and wallet_balance (creating missing profiles). With `record_transactions` a completed 'return'
+    Transaction is written per user as well. Runs in a single transaction.
+    """
+    user_ids = list(accruals)
+    amounts = {user_id: amount for user_id, (_, amount) in accruals.items()}
+    with transaction.atomic():
+        earnings_today = DailyEarning.objects.filter(date=run_date)
+        existing = set(
+            earnings_today.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        DailyEarning.objects.bulk_create([
+            DailyEarning(user_id=user_id, amount=amount, date=run_date, investment_id=investment_id)
+            for user_id, (investment_id, amount) in accruals.items() if user_id not in existing
+        ])
+        if existing:
+            bulk_increment(
+                earnings_today, 'user_id',
+                {user_id: amounts[user_id] for user_id in existing}, ['amount'],
+            )
+
+        if record_transactions:
+            Transaction.objects.bulk_create([
+                Transaction(
+                    user_id=user_id,
+                    transaction_type='return',
+                    amount=amount,
+                    status='completed',
+                    investment_id=investment_id,
+                )
+                for user_id, (investment_id, amount) in accruals.items()
+            ])
+
+        wallet.credit_many(amounts, 'earnings', memo=f'Daily return {run_date}', counters=['total_earnings'])
+
+        if record_transactions:
+            add_lifetime_earnings(amounts)
+        refresh_earning_windows(user_ids, run_date)
+
+
+def accrue_daily_earnings(run_date, investments, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """
+    Credit one day of returns for `investments`.
+
+    A user with several active investments gets a single DailyEarning for
+    the day (the table is unique on user and date) holding the sum of the
+    per-investment returns, linked to their oldest investment.
+
+    `on_chunk(last_user_id, users, investments, total)` is called inside
+    each chunk's transaction, so callers can checkpoint progress atomically
+    with the credits.
+
+    Returns a dict with the number of investments and users credited and
+    the total amount.
+    """
+    stats = {'investments': 0, 'users': 0, 'total': Decimal('0.00')}
+    pending = {}
+    chunk = {'investments': 0, 'total': Decimal('0.00')}
+
+    def flush():
+        if pending:
+            with transaction.atomic():
+                write_accruals(run_date, pending)
+                if on_chunk:
+                    on_chunk(max(pending), len(pending), chunk['investments'], chunk['total'])
+            stats['users'] += len(pending)
+            stats['investments'] += chunk['investments']
+            stats['total'] += chunk['total']
+            pending.clear()
+            chunk.update(investments=0, total=Decimal('0.00'))
+
+    current_user = None
+    for user_id, investment_id, amount in accrual_rows(investments):
+        if amount <= 0:
+            continue
+        # Only flush on a user boundary so a user is never split across chunks
+        if user_id != current_user and len(pending) >= chunk_size:
+            flush()
+        current_user = user_id
+
+        if user_id in pending:
+            first_id, total = pending[user_id]
+            pending[user_id] = (first_id, total + amount)
+        else:
+            pending[user_id] = (investment_id, amount)
+        chunk['investments'] += 1
+        chunk['total'] += amount
+    flush()
+
+    return stats
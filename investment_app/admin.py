@@ -1,10 +1,11 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
 from django.urls import reverse
 from django.shortcuts import redirect
 from django.urls import path
 from decimal import Decimal
 from .models import InvestmentPlan, Investment, Transaction, Referral, UserProfile, CryptoWallet, Deposit
+from . import approvals, deposits, lifecycle
 
 
 @admin.register(CryptoWallet)
@@ -16,39 +17,15 @@ class CryptoWalletAdmin(admin.ModelAdmin):
 @admin.register(Deposit)
 class DepositAdmin(admin.ModelAdmin):
     list_display = ['user', 'crypto_wallet', 'amount', 'status', 'created_at', 'confirmed_by']
+    list_select_related = ['user', 'crypto_wallet', 'confirmed_by']
     list_filter = ['status', 'crypto_wallet__network', 'created_at']
     search_fields = ['user__username', 'transaction_hash', 'reference_id']
     readonly_fields = ['reference_id', 'created_at', 'updated_at', 'confirmed_by']
     actions = ['confirm_deposits', 'reject_deposits']
     
     def confirm_deposits(self, request, queryset):
-        confirmed_count = 0
-        for deposit in queryset:
-            if deposit.status != 'confirmed':
-                deposit.status = 'confirmed'
-                deposit.confirmed_by = request.user
-                deposit.save()
-                
-                # Add to user's wallet balance - try both approaches
-                try:
-                    # First approach: UserProfile model
-                    profile = deposit.user.userprofile
-                    profile.wallet_balance += deposit.amount
-                    profile.save()
-                except AttributeError:
-                    try:
-                        # Second approach: UserBalance model
-                        user_balance, created = CryptoWallet.objects.get_or_create(
-                            user=deposit.user,
-                            defaults={'balance': Decimal('0.00')}
-                        )
-                        user_balance.balance += deposit.amount
-                        user_balance.save()
-                    except NameError:
-                        # If neither model exists, just update the deposit status
-                        pass
-                
-                confirmed_count += 1
+        # Statuses, Transactions and wallet credits are written in bulk
+        confirmed_count = deposits.confirm_deposits(queryset, request.user)
         
         if confirmed_count > 0:
             self.message_user(
@@ -102,6 +79,7 @@ class InvestmentPlanAdmin(admin.ModelAdmin):
 @admin.register(Investment)
 class InvestmentAdmin(admin.ModelAdmin):
     list_display = ['user', 'plan', 'is_confirmed', 'amount', 'start_date', 'end_date', 'status']
+    list_select_related = ['user', 'plan']
     list_filter = ['status', 'plan', 'start_date', 'is_confirmed']
     search_fields = ['user__username']
     actions = ['confirm_payments']
@@ -119,9 +97,32 @@ class InvestmentAdmin(admin.ModelAdmin):
     confirm_payment.short_description = 'Payment Confirmation'
     
     def confirm_payments(self, request, queryset):
-        queryset.update(is_confirmed=True)
-        self.message_user(request, "Selected investments have been confirmed.")
+        confirmed = lifecycle.confirm_many(queryset)
+        self.message_user(request, f"{confirmed} investment(s) have been confirmed.")
     confirm_payments.short_description = "Mark selected investments as confirmed"
+
+    def save_model(self, request, obj, form, change):
+        # Status and confirmation changes go through the lifecycle, which
+        # also keeps the principal rollup and the owner's wallet in step
+        if not change or not {'status', 'is_confirmed'} & set(form.changed_data):
+            return super().save_model(request, obj, form, change)
+
+        status, is_confirmed = obj.status, obj.is_confirmed
+        obj.status, obj.is_confirmed = form.initial['status'], form.initial['is_confirmed']
+        super().save_model(request, obj, form, change)
+        try:
+            if is_confirmed != obj.is_confirmed:
+                if not is_confirmed:
+                    raise lifecycle.InvalidTransition(f'Investment #{obj.pk} is confirmed and can\'t be unconfirmed')
+                lifecycle.confirm(obj)
+            if status != obj.status:
+                transitions = {'active': lifecycle.confirm, 'completed': lifecycle.complete,
+                               'cancelled': lifecycle.cancel}
+                if status not in transitions:
+                    raise lifecycle.InvalidTransition(f'Investment #{obj.pk} can\'t go back to {status}')
+                transitions[status](obj)
+        except lifecycle.InvalidTransition as e:
+            self.message_user(request, str(e), level=messages.WARNING)
     
     # Add this to your urls.py as well
     def get_urls(self):
@@ -137,61 +138,46 @@ class InvestmentAdmin(admin.ModelAdmin):
     
     def confirm_investment(self, request, object_id, *args, **kwargs):
         investment = Investment.objects.get(id=object_id)
-        investment.is_confirmed = True
-        investment.save()
-        self.message_user(request, f"Investment #{object_id} has been confirmed.")
+        try:
+            lifecycle.confirm(investment)
+        except lifecycle.InvalidTransition as e:
+            self.message_user(request, str(e), level=messages.WARNING)
+        else:
+            self.message_user(request, f"Investment #{object_id} has been confirmed.")
         return redirect(reverse('admin:investment_app_investment_changelist'))
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['user', 'transaction_type', 'amount', 'status', 'created_at', 'reference_id']
+    list_select_related = ['user']
     list_filter = ['transaction_type', 'status', 'created_at']
     search_fields = ['user__username', 'reference_id']
     actions = ['approve_transactions', 'reject_transactions']
     
     def approve_transactions(self, request, queryset):
-        for transaction in queryset:
-            if transaction.status == 'pending':
-                transaction.status = 'completed'
-                transaction.save()
-                
-                # If it's a deposit, create investment
-                if transaction.transaction_type == 'deposit':
-                    # Find appropriate plan based on amount
-                    plans = InvestmentPlan.objects.all().order_by('min_deposit')
-                    selected_plan = None
-                    for plan in plans:
-                        if transaction.amount >= plan.min_deposit:
-                            selected_plan = plan
-                    
-                    if selected_plan:
-                        investment = Investment.objects.create(
-                            user=transaction.user,
-                            plan=selected_plan,
-                            amount=transaction.amount,
-                            status='active'
-                        )
-                        transaction.investment = investment
-                        transaction.save()
-                
-                # If it's a withdrawal, deduct from wallet
-                elif transaction.transaction_type == 'withdrawal':
-                    profile = UserProfile.objects.get(user=transaction.user)
-                    profile.wallet_balance -= transaction.amount
-                    profile.save()
+        # Plans are looked up once and the batch is written in bulk
+        approved, insufficient_funds = approvals.approve_transactions(queryset)
         
-        self.message_user(request, "Selected transactions have been approved.")
+        self.message_user(request, f"{approved} transaction(s) have been approved.")
+        if insufficient_funds:
+            self.message_user(
+                request,
+                f"{insufficient_funds} withdrawal(s) were left pending because the wallet balance is too low.",
+                level=messages.WARNING,
+            )
     
     def reject_transactions(self, request, queryset):
-        queryset.update(status='rejected')
+        approvals.reject_transactions(queryset)
         self.message_user(request, "Selected transactions have been rejected.")
 
 @admin.register(Referral)
 class ReferralAdmin(admin.ModelAdmin):
     list_display = ['referrer', 'referred_user', 'created_at', 'bonus_paid']
+    list_select_related = ['referrer', 'referred_user']
     list_filter = ['bonus_paid', 'created_at']
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'referral_code', 'wallet_balance', 'total_earnings', 'total_referral_bonus']
+    list_select_related = ['user']
     search_fields = ['user__username']
\ No newline at end of file
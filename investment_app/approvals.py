@@ -0,0 +1,96 @@
+"""
+Bulk approval and rejection of transactions.
+
+Approving transactions one at a time re-reads the plan list for every
+deposit and saves each row several times. `approve_transactions` reads the
+plans from the catalog and handles the whole batch with one status UPDATE, one
+Investment INSERT and one aggregated debit per user for withdrawals.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from .models import Investment, Transaction
+from .plans import get_catalog
+from .caching import invalidate_dashboards
+from .rollups import EARNING_TRANSACTION_TYPES, refresh_invested_principal, refresh_lifetime_earnings
+from . import wallet
+
+
+def approve_transactions(queryset):
+    """
+    Approve every pending transaction in `queryset`.
+
+    Deposits become an active investment in the best plan for their
+    amount. Withdrawals are approved oldest first while the user's balance
+    covers them and the rest are left pending. Returns (approved, left
+    pending for insufficient funds).
+    """
+    with db_transaction.atomic():
+        rows = list(
+            queryset.filter(status='pending').select_for_update().order_by('created_at', 'id')
+            .values_list('pk', 'user_id', 'transaction_type', 'amount')
+        )
+        withdrawals = [row for row in rows if row[2] == 'withdrawal']
+        balances = wallet.lock_balances({user_id for _, user_id, _, _ in withdrawals})
+
+        approved = [row for row in rows if row[2] != 'withdrawal']
+        debits = defaultdict(Decimal)
+        for row in withdrawals:
+            _, user_id, _, amount = row
+            if balances.get(user_id, 0) - debits[user_id] >= amount:
+                debits[user_id] += amount
+                approved.append(row)
+        debits = {user_id: amount for user_id, amount in debits.items() if amount}
+
+        now = timezone.now()
+        Transaction.objects.filter(pk__in=[row[0] for row in approved]).update(
+            status='completed', updated_at=now
+        )
+
+        pick_plan = get_catalog().pick
+        deposits = [(row, pick_plan(row[3])) for row in approved if row[2] == 'deposit']
+        deposits = [(row, plan) for row, plan in deposits if plan is not None]
+        investments = Investment.objects.bulk_create([
+            Investment(user_id=user_id, plan=plan, amount=amount, status='active',
+                       start_date=now, end_date=now + timezone.timedelta(days=plan.duration_days))
+            for (_, user_id, _, amount), plan in deposits
+        ])
+        Transaction.objects.bulk_update([
+            Transaction(pk=pk, investment_id=investment.pk)
+            for ((pk, _, _, _), _), investment in zip(deposits, investments)
+        ], ['investment'], batch_size=500)
+        if investments:
+            refresh_invested_principal(list({investment.user_id for investment in investments}))
+
+        if debits:
+            wallet.debit_many(debits, 'withdrawals', memo='Withdrawal')
+
+        invalidate_dashboards([user_id for _, user_id, _, _ in approved])
+        earners = {user_id for _, user_id, kind, _ in approved if kind in EARNING_TRANSACTION_TYPES}
+        if earners:
+            refresh_lifetime_earnings(list(earners))
+    return len(approved), len(rows) - len(approved)
+
+
+def reject_transactions(queryset):
+    """
+    Reject every transaction in `queryset` with one status UPDATE. Lifetime
+    earnings are recomputed for users who lose a completed return or
+    referral bonus, and their dashboards expire once the UPDATE commits.
+    Returns the number rejected.
+    """
+    with db_transaction.atomic():
+        rows = list(queryset.select_for_update().values_list('pk', 'user_id', 'transaction_type', 'status'))
+        Transaction.objects.filter(pk__in=[row[0] for row in rows]).update(
+            status='rejected', updated_at=timezone.now()
+        )
+
+        invalidate_dashboards([user_id for _, user_id, _, _ in rows])
+        earners = {
+            user_id for _, user_id, kind, status in rows
+            if kind in EARNING_TRANSACTION_TYPES and status == 'completed'
+        }
+        if earners:
+            refresh_lifetime_earnings(list(earners))
+    return len(rows)
@@ -0,0 +1,725 @@
+"""
+Benchmark scenarios for `manage.py bench`.
+
+Each scenario runs against a throwaway test database, prints its
+measurements and returns False if a check failed. Correctness is tested
+in tests.py; the checks here are the ones that only show at scale or
+under concurrency (query counts that must stay flat, concurrent writers).
+"""
+import re
+import tracemalloc
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .models import (Investment, Transaction, UserProfile, Deposit,
+                     CryptoWallet, Referral, CodeSequence)
+from . import (approvals, codes, deposits, exports, forecast, ledger, lifecycle, projection, referral_graph,
+               referrals, wallet)
+from .instrumentation import query_budget, record_queries
+from .seeding import hot_queries, make_plan, make_tiered_plans, make_users, seed_history
+from .testing import run_threads
+from .pagination import KeysetPaginator, encode_cursor
+from .utils import INCREMENT_BATCH_SIZE
+from . import views
+
+SCENARIOS = {}
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+@scenario
+def wallet_contention(stdout, requests=200, **options):
+    """
+    Fire concurrent invest requests and wallet credits at one user and
+    check the final balance is exact.
+    """
+    plan = make_plan()
+    user = User.objects.create_user('bench_wallet')
+    UserProfile.objects.create(user=user)
+    opening = Decimal('50.00') * (requests // 4)
+    wallet.credit(user, opening, 'deposits', memo='Benchmark opening balance')
+
+    invest_url = reverse('invest')
+
+    def hit(index):
+        if index % 2:
+            # Half of the workers spend through the invest view...
+            client = Client()
+            client.force_login(user)
+            client.post(invest_url, {'plan_id': plan.pk, 'amount': '50.00'})
+        else:
+            # ...while the other half credit the same wallet
+            wallet.credit(user, Decimal('10.00'), 'deposits', memo='Benchmark credit')
+
+    elapsed, errors = run_threads(requests, hit)
+
+    invested = user.investment_set.count()
+    expected = opening + Decimal('10.00') * (requests - requests // 2) - Decimal('50.00') * invested
+    profile_balance = UserProfile.objects.get(user=user).wallet_balance
+    ledger_balance = ledger.balance(user)
+
+    stdout.write(f'{requests} concurrent requests in {elapsed:.2f}s ({requests / elapsed:.0f} req/s)')
+    stdout.write(f'{invested} investments made, {len(errors)} errors')
+    stdout.write(f'expected {expected}, profile {profile_balance}, ledger {ledger_balance}')
+    return not errors and profile_balance == expected == ledger_balance and profile_balance >= 0
+
+
+@scenario
+def query_plans(stdout, sizes=None, **options):
+    """
+    Seed a large history and time every hot view query against it.
+    QueryPlanTests checks they are answered by an index.
+    """
+    rows = (sizes or [1000000])[0]
+    started = time.perf_counter()
+    user = seed_history(rows)
+    stdout.write(f'Seeded {rows} rows per table in {time.perf_counter() - started:.1f}s')
+
+    for name, queryset in hot_queries(user).items():
+        stdout.write(f'{name:<40} {time_call(lambda: list(queryset.all()), runs=5):8.2f}ms')
+    return True
+
+
+def time_call(func, runs=20):
+    """Best wall time of `func()` over `runs` calls, in milliseconds"""
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+@scenario
+def keyset_pages(stdout, sizes=None, **options):
+    """
+    Compare the first and a deep page of the admin deposit queue under
+    OFFSET and keyset pagination, and check both return the same rows.
+    """
+    rows = (sizes or [200000])[0]
+    seed_history(rows)
+    per_page = 20
+    queryset = Deposit.objects.all()
+    deep = rows - rows % per_page - per_page
+
+    def offset_page(start):
+        return list(queryset.order_by('-created_at', '-id')[start:start + per_page])
+
+    # The cursor a user would hold after paging down to `deep`
+    last = queryset.order_by('-created_at', '-id')[deep - 1]
+    cursor = encode_cursor(last.created_at, last.pk)
+    paginator = KeysetPaginator(queryset, per_page)
+
+    passed = list(paginator.page(after=cursor)) == offset_page(deep)
+    stdout.write(f'{rows} deposits, deep page starts at row {deep}')
+    stdout.write(f'OFFSET: first page {time_call(lambda: offset_page(0)):.2f}ms, '
+                 f'deep page {time_call(lambda: offset_page(deep)):.2f}ms')
+    stdout.write(f'keyset: first page {time_call(lambda: list(paginator.page())):.2f}ms, '
+                 f'deep page {time_call(lambda: list(paginator.page(after=cursor))):.2f}ms')
+    stdout.write(f'approximate count {paginator.approximate_count}'
+                 f'{"+" if paginator.count_is_capped else ""}')
+    return passed
+
+
+@scenario
+def deposit_confirmation(stdout, sizes=None, **options):
+    """
+    Confirm batches of pending deposits and report the query count per
+    batch size; checks balances and Transactions add up, and that apart
+    from the bulk INSERTs the query count doesn't grow with the batch.
+    """
+    crypto_wallet = CryptoWallet.objects.create(network='BTC', wallet_address='bench')
+    admin = User.objects.create_user('bench_admin', is_staff=True)
+    CodeSequence.objects.get_or_create(name=codes.REFERRAL_CODE)  # Not part of the first batch's count
+    passed = True
+    flat = None
+    for size in sizes or [10, 100, 1000, 5000]:
+        users = max(size // 4, 1)
+        user_ids = make_users(users, prefix=f'bench_{size}_')
+        Deposit.objects.bulk_create([
+            Deposit(user_id=user_ids[i % users], crypto_wallet=crypto_wallet, amount=Decimal('25.00'))
+            for i in range(size)
+        ])
+        batch = Deposit.objects.filter(user_id__in=user_ids)
+
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            confirmed = deposits.confirm_deposits(batch, admin)
+        elapsed = time.perf_counter() - started
+
+        credited = UserProfile.objects.filter(user_id__in=user_ids).aggregate(total=Sum('wallet_balance'))['total']
+        recorded = Transaction.objects.filter(user_id__in=user_ids, transaction_type='deposit').count()
+        ok = (confirmed == size == recorded and credited == Decimal('25.00') * size
+              and not batch.exclude(status='confirmed').exists()
+              and ledger.balance(User(pk=user_ids[0])) == Decimal('25.00') * len(range(0, size, users)))
+        # Bulk INSERTs (on SQLite) and bulk_increment() split into batches; everything else is fixed
+        others = sum(runs for sql, runs in recorder.fingerprints.items() if not sql.startswith('INSERT'))
+        others -= -(-users // INCREMENT_BATCH_SIZE) - 1
+        flat = others if flat is None else flat
+        ok = ok and others == flat
+        passed = passed and ok
+        stdout.write(f'{"ok  " if ok else "FAIL"} {size:>6} deposits / {users:>5} users: '
+                     f'{recorder.count} queries ({others} besides batches), {elapsed * 1000:.0f}ms')
+    if connection.vendor == 'sqlite':
+        stdout.write(f'(SQLite limits each bulk INSERT to {connection.features.max_query_params} parameters, '
+                     'so the INSERT count still grows with the batch here)')
+    return passed
+
+
+@scenario
+def transaction_approval(stdout, sizes=None, **options):
+    """
+    Approve batches of pending deposits, withdrawals and returns and
+    report the query count per batch size. Each user can afford only one
+    of their two withdrawals; checks balances and investments add up.
+    """
+    for name, minimum in [('basic', '50.00'), ('standard', '500.00'), ('premium', '5000.00')]:
+        make_plan(name, min_deposit=minimum)
+    passed = True
+    for size in sizes or [100, 1000, 10000]:
+        users = max(size // 10, 1)
+        user_ids = make_users(users, prefix=f'bench_{size}_', profiles=True)
+        wallet.credit_many({user_id: Decimal('150.00') for user_id in user_ids}, 'deposits')
+
+        # Per user: 6 deposits across the plans, 2 withdrawals of 100, 2 returns
+        kinds = ['deposit', 'withdrawal', 'deposit', 'return', 'deposit', 'withdrawal', 'deposit', 'return',
+                 'deposit', 'deposit']
+        amounts = {'deposit': [Decimal('60.00'), Decimal('600.00'), Decimal('6000.00'), Decimal('10.00')],
+                   'withdrawal': [Decimal('100.00')], 'return': [Decimal('5.00')]}
+        Transaction.objects.bulk_create([
+            Transaction(user_id=user_ids[i % users], transaction_type=kinds[i // users % 10],
+                        amount=amounts[kinds[i // users % 10]][i // users % len(amounts[kinds[i // users % 10]])],
+                        status='pending')
+            for i in range(users * 10)
+        ])
+        batch = Transaction.objects.filter(user_id__in=user_ids)
+
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            approved, left = approvals.approve_transactions(batch)
+        elapsed = time.perf_counter() - started
+
+        deposits_with_plan = batch.filter(transaction_type='deposit').exclude(amount__lt=Decimal('50.00'))
+        balances = set(UserProfile.objects.filter(user_id__in=user_ids).values_list('wallet_balance', flat=True))
+        ok = (approved == users * 9 and left == users
+              and Investment.objects.filter(user_id__in=user_ids).count() == deposits_with_plan.count()
+              and not deposits_with_plan.filter(investment__isnull=True).exists()
+              and balances == {Decimal('50.00')}
+              and ledger.balance(User(pk=user_ids[0])) == Decimal('50.00'))
+        passed = passed and ok
+        stdout.write(f'{"ok  " if ok else "FAIL"} {users * 10:>6} transactions / {users:>5} users: '
+                     f'{recorder.count} queries, {elapsed * 1000:.0f}ms')
+    return passed
+
+
+@scenario
+def lifecycle_transitions(stdout, **options):
+    """
+    Run each investment transition and report the queries it runs and how
+    many of them touch the investment table.
+    """
+    plan = make_plan()
+    user = User.objects.create_user('bench_lifecycle')
+    UserProfile.objects.create(user=user)
+    now = timezone.now()
+    investments = {
+        name: Investment.objects.create(user=user, plan=plan, amount=Decimal('100.00'), status=status,
+                                        start_date=now - timedelta(days=31), end_date=now - timedelta(days=1))
+        for name, status in [('confirm', 'pending'), ('complete', 'active'), ('cancel', 'active')]
+    }
+    transitions = {'confirm': lifecycle.confirm, 'complete': lifecycle.complete, 'cancel': lifecycle.cancel}
+    touches_investments = re.compile(r'"investment_app_investment"')
+
+    for name, transition in transitions.items():
+        investment = Investment.objects.select_related('user').get(pk=investments[name].pk)
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            transition(investment)
+        elapsed = (time.perf_counter() - started) * 1000
+        statements = [sql for sql in recorder.fingerprints.elements() if touches_investments.search(sql)]
+        stdout.write(f'{name:<8} {elapsed:.1f}ms, {len(statements)} investment statements, '
+                     f'{recorder.count} queries in total')
+    return True
+
+
+@scenario
+def maturity_sweep(stdout, sizes=None, **options):
+    """
+    Sweep a book of matured investments in batches and report the queries
+    per batch.
+    """
+    rows = (sizes or [20000])[0]
+    batch_size = 1000
+    plans = [
+        make_plan(name, rate, duration_days=days)
+        for name, rate, days in [('basic', '3.00', 30), ('standard', '3.33', 45), ('premium', '4.17', 60)]
+    ]
+    users = max(rows // 10, 1)
+    user_ids = make_users(users, prefix='bench_')
+    now = timezone.now()
+    investments = []
+    for i in range(rows):
+        plan = plans[i % 3]
+        start = now - timedelta(days=plan.duration_days + i % 5, seconds=i % 86400)
+        # One in four is still running
+        end = start + timedelta(days=plan.duration_days) + (timedelta(days=10) if i % 4 == 0 else timedelta())
+        investments.append(Investment(user_id=user_ids[i % users], plan=plan, amount=Decimal('123.45') + i % 1000,
+                                      status='active', start_date=start, end_date=end))
+    Investment.objects.bulk_create(investments, batch_size=5000)
+    matured = rows - len(range(0, rows, 4))
+
+    started = time.perf_counter()
+    with record_queries() as recorder:
+        stats = lifecycle.complete_matured(now=now, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    batches = -(-matured // batch_size)
+
+    stdout.write(f'{stats["investments"]} of {rows} investments completed in {batches} batches, '
+                 f'{elapsed * 1000:.0f}ms, {recorder.count} queries ({recorder.count / batches:.1f} per batch)')
+    return True
+
+
+@scenario
+def export_stream(stdout, sizes=None, **options):
+    """
+    Stream a large transaction export and report time to first byte and
+    peak Python memory, which should not grow with the row count.
+    """
+    rows = (sizes or [200000])[0]
+    seed_history(rows)
+    passed = True
+    for export_format in exports.FORMATS:
+        tracemalloc.start()
+        started = time.perf_counter()
+        header, data = exports.export_rows('transactions')
+        lines = exports.encode(header, data, export_format)
+        next(lines)
+        first_byte = time.perf_counter() - started
+        count = 1 + sum(1 for _ in lines)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        expected = rows + (1 if export_format == 'csv' else 0)
+        ok = count == expected
+        passed = passed and ok
+        stdout.write(f'{"ok  " if ok else "FAIL"} {export_format:<5} {count} lines, first byte after '
+                     f'{first_byte * 1000:.1f}ms, {elapsed:.2f}s total, peak memory {peak / 2 ** 20:.1f}MiB')
+    return passed
+
+
+@scenario
+def referral_bonuses(stdout, sizes=None, **options):
+    """
+    Settle a large set of referrals: a dry run must write nothing, the real
+    run must credit each referrer the sum of its bonuses with a constant
+    number of queries per batch, and later runs only see new referrals and
+    waiting ones whose referred user has invested since.
+    """
+    rows = (sizes or [20000])[0]
+    referrers = max(rows // 20, 1)
+    plan = make_plan()
+    user_ids = make_users(referrers + rows, prefix='bench_')
+    referrer_ids, referred_ids = user_ids[:referrers], user_ids[referrers:]
+    now = timezone.now()
+    # Half the referrals are old enough; one referred user in five never invested
+    Referral.objects.bulk_create([
+        Referral(referrer_id=referrer_ids[i % referrers], referred_user_id=user_id,
+                 created_at=now - timedelta(days=120 if i < rows // 2 else 30))
+        for i, user_id in enumerate(referred_ids)
+    ], batch_size=5000)
+    Investment.objects.bulk_create([
+        Investment(user_id=user_id, plan=plan, amount=Decimal('100.00') + i % 500, status='active')
+        for i, user_id in enumerate(referred_ids) for _ in range(2) if i % 5
+    ], batch_size=5000)
+
+    def expected(queryset):
+        totals = {}
+        for referrer_id, user_id in queryset.values_list('referrer_id', 'referred_user_id'):
+            invested = Investment.objects.filter(user_id=user_id).aggregate(total=Sum('amount'))['total']
+            if invested:
+                totals[referrer_id] = totals.get(referrer_id, 0) + referrals.bonus_amount(invested)
+        return totals
+
+    due = expected(Referral.objects.filter(created_at__lte=now - referrals.BONUS_DELAY)[:2000])
+    passed = True
+    for label, run_at, dry_run in [('dry run', now, True), ('first run', now, False),
+                                   ('rerun', now, False), ('90 days later', now + timedelta(days=90), False)]:
+        before = UserProfile.objects.aggregate(total=Sum('total_referral_bonus'))['total'] or 0
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            stats = referrals.process_referral_bonuses(now=run_at, dry_run=dry_run)
+        elapsed = time.perf_counter() - started
+        after = UserProfile.objects.aggregate(total=Sum('total_referral_bonus'))['total'] or 0
+        batches = max(-(-stats['referrals'] // referrals.BATCH_SIZE), 1)
+        ok = (after - before) == (0 if dry_run else stats['total'])
+        if label in ('dry run', 'first run', '90 days later'):
+            ok = ok and stats['referrals'] == rows // 2 + (rows % 2 if label == '90 days later' else 0)
+        if label == 'rerun':
+            # The referrals still waiting for an investment are behind the mark and not read again
+            ok = ok and stats['referrals'] == 0 and stats['paid'] == 0
+        passed = passed and ok
+        stdout.write(f'{"ok  " if ok else "FAIL"} {label:<14} {stats["paid"]} of {stats["referrals"]} referrals paid '
+                     f'to {stats["referrers"]} referrers, ${stats["total"]}, {elapsed * 1000:.0f}ms, '
+                     f'{recorder.count} queries ({recorder.count / batches:.1f} per batch)')
+
+    # Spot-check the first referrers against a per-referral recomputation
+    paid = dict(UserProfile.objects.filter(user_id__in=list(due)).values_list('user_id', 'total_referral_bonus'))
+    mismatched = sum(1 for referrer_id, total in due.items() if paid.get(referrer_id, 0) < total)
+    stdout.write(f'{mismatched} referrers credited less than their recomputed bonus')
+    return passed and not mismatched
+
+
+@scenario
+def referral_downlines(stdout, sizes=None, **options):
+    """
+    Build a deep referral tree, rebuild its closure table and time the
+    downline queries and the referrals page against it.
+    """
+    rows = (sizes or [20000])[0]
+    plan = make_plan()
+    user_ids = make_users(rows, prefix='bench_', profiles=True)
+    # Each user is referred by one of the users that joined shortly before them
+    parents = {user_ids[i]: user_ids[(i - 1) // 3] for i in range(1, rows)}
+    Referral.objects.bulk_create([
+        Referral(referrer_id=referrer_id, referred_user_id=user_id) for user_id, referrer_id in parents.items()
+    ], batch_size=5000)
+    Investment.objects.bulk_create([
+        Investment(user_id=user_id, plan=plan, amount=Decimal('100.00'), status='active') for user_id in user_ids[1:]
+    ], batch_size=5000)
+
+    started = time.perf_counter()
+    with record_queries() as recorder:
+        written = referral_graph.rebuild()
+    stdout.write(f'rebuilt {written} paths for {rows} users in {(time.perf_counter() - started) * 1000:.0f}ms, '
+                 f'{recorder.count} queries')
+
+    root = User.objects.get(pk=user_ids[0])
+    for label, func in [('downline', lambda: len(referral_graph.downline(root))),
+                        ('downline depth 3', lambda: len(referral_graph.downline(root, max_depth=3))),
+                        ('downline volume', lambda: referral_graph.downline_volume(root)),
+                        ('downline levels', lambda: referral_graph.downline_levels(root)),
+                        ('upline of last user', lambda: len(referral_graph.upline(user_ids[-1])))]:
+        with record_queries() as recorder:
+            func()
+        stdout.write(f'{label:<20} {time_call(func, runs=5):8.1f}ms  {recorder.count} query')
+
+    client = Client()
+    for label, user_id in [('leaf', user_ids[-1]), ('root', user_ids[0])]:
+        client.force_login(User.objects.get(pk=user_id))
+
+        def render():
+            cache.clear()
+            return client.get(reverse('referrals'))
+        with record_queries() as recorder:
+            render()
+        stdout.write(f'referrals page, {label:<5} {time_call(render, runs=5):8.1f}ms  {recorder.count} queries')
+    return True
+
+
+@scenario
+def referrals_page(stdout, sizes=None, **options):
+    """
+    Render the referrals page for a promoter with a large number of
+    referees: first page cold and with the summary cached, and a page deep
+    in the list, and report time and queries for each.
+    """
+    rows = (sizes or [20000])[0]
+    plan = make_plan()
+    promoter = User.objects.create_user('bench_promoter', password='bench')
+    UserProfile.objects.create(user=promoter)
+    referee_ids = make_users(rows, prefix='bench_', batch_size=5000)
+    now = timezone.now()
+    Referral.objects.bulk_create([
+        Referral(referrer=promoter, referred_user_id=user_id, created_at=now - timedelta(minutes=i),
+                 bonus_paid=i % 3 == 0)
+        for i, user_id in enumerate(referee_ids)
+    ], batch_size=5000)
+    Investment.objects.bulk_create([
+        Investment(user_id=user_id, plan=plan, amount=Decimal('100.00') + i % 7, status='active')
+        for i, user_id in enumerate(referee_ids) for _ in range(i % 3)
+    ], batch_size=5000)
+
+    client = Client()
+    client.force_login(promoter)
+    url = reverse('referrals')
+    deep = Referral.objects.filter(referrer=promoter).order_by('-created_at', '-id')[rows * 3 // 4]
+    for label, params, cold in [('first page, cold', {}, True), ('first page, cached', {}, False),
+                                ('deep page', {'after': encode_cursor(deep.created_at, deep.pk)}, False)]:
+        def render():
+            if cold:
+                cache.clear()
+            return client.get(url, params)
+        render()
+        with record_queries() as recorder:
+            response = render()
+        elapsed = time_call(render, runs=5)
+        stdout.write(f'{label:<20} {elapsed:8.1f}ms  {recorder.count} queries, status {response.status_code}')
+    return True
+
+
+@scenario
+def code_generation(stdout, sizes=None, **options):
+    """
+    Create deposits (and their owners' profiles) from many threads at once
+    and check every reference and referral code is unique, with one
+    counter round trip per block instead of a table count per save.
+    """
+    rows = (sizes or [4000])[0]
+    threads = 16
+    per_thread = max(rows // threads, 1)
+    crypto_wallet = CryptoWallet.objects.create(network='BTC', wallet_address='bench')
+    passed = True
+    for size in [1, 20]:
+        codes._blocks.clear()
+        owners = make_users(threads, prefix=f'bench_{size}_')
+
+        def create(index):
+            UserProfile.objects.create(user_id=owners[index])
+            for _ in range(per_thread):
+                Deposit.objects.create(user_id=owners[index], crypto_wallet=crypto_wallet, amount=Decimal('10.00'))
+
+        with override_settings(CODE_BLOCK_SIZE=size):
+            elapsed, errors = run_threads(threads, create)
+        deposits = Deposit.objects.filter(user_id__in=owners)
+        created = deposits.count()
+        unique = deposits.values('reference_id').distinct().count()
+        profiles = UserProfile.objects.filter(user_id__in=owners).values('referral_code').distinct().count()
+        ok = not errors and created == unique == threads * per_thread and profiles == threads
+        passed = passed and ok
+        stdout.write(f'{"ok  " if ok else "FAIL"} block size {size:>2}: {created} deposits from {threads} threads '
+                     f'in {elapsed:.2f}s ({created / elapsed:.0f}/s), {unique} unique references, '
+                     f'{profiles} unique referral codes, {len(errors)} errors')
+        for error in errors[:3]:
+            stdout.write(f'     {error!r}')
+    return passed
+
+
+@scenario
+def list_view_budgets(stdout, sizes=None, **options):
+    """
+    Render the paginated list views and admin changelists over a full page
+    of rows with every relation filled in, and report their time and
+    queries against their settings.QUERY_BUDGETS entry.
+    """
+    rows = (sizes or [60])[0]
+    plan = make_plan()
+    staff = User.objects.create_superuser('staff', 'staff@example.com', 'bench')
+    UserProfile.objects.create(user=staff)
+    crypto_wallets = [CryptoWallet.objects.create(network=network, wallet_address='bench') for network in ['BTC', 'ETH']]
+    user_ids = make_users(rows, prefix='bench_', profiles=True)
+    Deposit.objects.bulk_create([
+        Deposit(user_id=staff.pk if i % 2 else user_id, crypto_wallet=crypto_wallets[i % 2], amount=Decimal('10.00'),
+                status='confirmed', confirmed_by=staff)
+        for i, user_id in enumerate(user_ids)
+    ])
+    Investment.objects.bulk_create([
+        Investment(user_id=user_id, plan=plan, amount=Decimal('100.00'), status='active') for user_id in user_ids
+    ])
+    Transaction.objects.bulk_create([
+        Transaction(user_id=user_id, transaction_type='deposit', amount=Decimal('10.00')) for user_id in user_ids
+    ])
+    Referral.objects.bulk_create([Referral(referrer=staff, referred_user_id=user_id) for user_id in user_ids])
+
+    client = Client()
+    client.force_login(staff)
+    pages = ['deposit_history', 'referrals'] + [
+        f'admin:investment_app_{model}_changelist'
+        for model in ['deposit', 'investment', 'transaction', 'referral', 'userprofile']
+    ]
+    for url_name in pages:
+        url = reverse(url_name)
+        with record_queries() as recorder:
+            client.get(url)
+        elapsed = time_call(lambda: client.get(url), runs=5)
+        stdout.write(f'{url_name:<45} {elapsed:7.1f}ms  {recorder.count} queries '
+                     f'(budget {query_budget(url_name.split(":")[-1])})')
+
+    # /admin/deposits/ is routed to the Django admin site, so call the view directly
+    request = RequestFactory().get('/admin/deposits/', {'status': 'all'})
+    request.user = staff
+    with record_queries() as recorder:
+        views.admin_deposit_list(request)
+    elapsed = time_call(lambda: views.admin_deposit_list(request), runs=5)
+    # The middleware's request also loads the session and the user
+    stdout.write(f'{"admin_deposit_list":<45} {elapsed:7.1f}ms  {recorder.count + 2} queries '
+                 f'(budget {query_budget("admin_deposit_list")})')
+    return True
+
+
+@scenario
+def pagination_render(stdout, sizes=None, **options):
+    """
+    Render the transactions page for one user as their history grows, with
+    cursor links and with old ?page=N links (first and middle page). The
+    number of page links and the response size must not grow with it.
+    """
+    sizes = sizes or [2000, 20000, 200000]
+    user = seed_history(sizes[0], users=1)
+    client = Client()
+    client.force_login(user)
+    url = reverse('transactions')
+    results = {}
+    for rows in sizes:
+        existing = Transaction.objects.filter(user=user).count()
+        Transaction.objects.bulk_create([
+            Transaction(user=user, transaction_type='deposit', amount=Decimal('10.00'), status='completed',
+                        created_at=timezone.now() - timedelta(days=30, minutes=i))
+            for i in range(existing, rows)
+        ], batch_size=5000)
+        pages = -(-rows // 10)
+        for label, params in [('cursor', {}), ('page 1', {'page': 1}), ('middle page', {'page': pages // 2})]:
+            response = client.get(url, params)
+            body = response.content.decode()
+            links = body.count('class="page-link"')
+            elapsed = time_call(lambda: client.get(url, params), runs=5)
+            results.setdefault(label, []).append((len(body), links))
+            stdout.write(f'{rows:>7} rows {label:<12} {len(body):>7} bytes, {links:>2} page links, {elapsed:7.1f}ms')
+
+    # Page numbers get longer with the history, so allow a few bytes per link
+    passed = True
+    for label, measured in results.items():
+        sizes_seen = [size for size, _ in measured]
+        links_seen = {links for _, links in measured}
+        ok = len(links_seen) == 1 and max(sizes_seen) - min(sizes_seen) <= 20 * max(links_seen)
+        passed = passed and ok
+        stdout.write(f'{"ok  " if ok else "FAIL"} {label}: {sorted(links_seen)} links, '
+                     f'{min(sizes_seen)}-{max(sizes_seen)} bytes')
+    return passed
+
+
+@scenario
+def investment_time_fields(stdout, sizes=None, **options):
+    """
+    Render the dashboard for a user with a growing number of active
+    investments and report the cost per row.
+    """
+    sizes = sizes or [100, 500]
+    plan = make_plan()
+    user = User.objects.create_user('bench_time_fields', password='bench')
+    UserProfile.objects.create(user=user)
+    client = Client()
+    client.force_login(user)
+    as_of = timezone.now()
+    for rows in sizes:
+        existing = Investment.objects.filter(user=user).count()
+        Investment.objects.bulk_create([
+            Investment(user=user, plan=plan, amount=Decimal('100.00') + i % 50, status='active',
+                       start_date=as_of - timedelta(days=i % 40, hours=i % 24),
+                       end_date=as_of + timedelta(days=i % 30 - 5, hours=i % 7))
+            for i in range(existing, rows)
+        ])
+
+        def render():
+            cache.clear()
+            return client.get(reverse('dashboard'))
+
+        response = render()
+        elapsed = time_call(render, runs=3)
+        with record_queries() as recorder:
+            render()
+        stdout.write(f'{rows:>5} active investments: dashboard {elapsed:.1f}ms '
+                     f'({elapsed / rows * 1000:.0f}us per row), {recorder.count} queries, '
+                     f'status {response.status_code}')
+    return True
+
+
+@scenario
+def portfolio_projection(stdout, sizes=None, **options):
+    """
+    Time projection.project() with each available engine on synthetic
+    books of growing size.
+    """
+    sizes = sizes or [100000, 1000000]
+    engines = ['python'] + (['numpy'] if projection.numpy is not None else [])
+    as_of = timezone.now()
+    now = projection.to_micros(as_of)
+    for rows in sizes:
+        amounts = [10000 + i * 7919 % 10000000 for i in range(rows)]
+        book = projection.Portfolio(
+            list(range(rows)), amounts,
+            [projection.daily_cents(amount, 125 + i % 3 * 90) for i, amount in enumerate(amounts)],
+            [now - (i * 104729 % (40 * projection.DAY)) for i in range(rows)],
+            [now + (i * 130363 % (60 * projection.DAY)) - 5 * projection.DAY for i in range(rows)],
+        )
+        timings = [
+            f'{engine} {time_call(lambda: projection.project(book, as_of, engine=engine), runs=3):.0f}ms'
+            for engine in engines
+        ]
+        stdout.write(f'{rows:>8} investments: {", ".join(timings)}, '
+                     f'payout due ${projection.project(book, as_of)["payout_due"]}')
+    return True
+
+
+@scenario
+def liability_forecast(stdout, sizes=None, **options):
+    """
+    Time a liability forecast snapshot from scratch, then again
+    incrementally after changing a slice of the book (new, completed and
+    cancelled investments, a plan rate change), and a full rebuild.
+    """
+    rows = (sizes or [20000])[0]
+    horizon = forecast.HORIZON
+    plans = make_tiered_plans()
+    users = [User.objects.create_user(f'bench_forecast_{i}', password='bench') for i in range(20)]
+    now = timezone.now()
+
+    def seed(count, offset=0):
+        Investment.objects.bulk_create([
+            Investment(user=users[i % 20], plan=plans[i % 3], amount=Decimal('100.00') + Decimal(i * 37 % 90000) / 100,
+                       status='active', start_date=now - timedelta(days=i % 40, hours=i % 24),
+                       end_date=now + timedelta(days=i % 45 - 5, hours=i % 11))
+            for i in range(offset, offset + count)
+        ], batch_size=5000)
+
+    seed(rows)
+    # The book was last touched well before the first snapshot
+    Investment.objects.update(updated_at=now - timedelta(days=1))
+    Transaction.objects.bulk_create([
+        Transaction(user=users[i % 20], transaction_type='withdrawal', amount=Decimal('25.00') + i, status='pending')
+        for i in range(50)
+    ])
+    as_of = timezone.localdate(now)
+
+    def report(label, snapshot, elapsed):
+        stdout.write(f'{label}: {elapsed:.0f}ms, {snapshot.recomputed} investments re-read, '
+                     f'{snapshot.active_investments} active, ${snapshot.scheduled_returns} returns due')
+
+    started = time.perf_counter()
+    snapshot = forecast.take_snapshot(as_of, horizon)
+    report('first snapshot', snapshot, (time.perf_counter() - started) * 1000)
+
+    # Change about 1% of the book
+    changed = max(rows // 100, 3)
+    active = Investment.objects.filter(status='active').order_by('pk')
+    for investment in active[:changed // 3]:
+        lifecycle.complete(investment)
+    for investment in active[:changed // 3]:
+        lifecycle.cancel(investment)
+    seed(changed // 3, offset=rows)
+
+    started = time.perf_counter()
+    snapshot = forecast.take_snapshot(as_of, horizon)
+    report('after 1% of the book changed', snapshot, (time.perf_counter() - started) * 1000)
+
+    plans[0].daily_return = Decimal('1.30')
+    plans[0].save()
+    started = time.perf_counter()
+    snapshot = forecast.take_snapshot(as_of, horizon)
+    report(f'after the {plans[0].name} rate changed', snapshot, (time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    snapshot = forecast.take_snapshot(as_of, horizon, full=True)
+    report('full rebuild', snapshot, (time.perf_counter() - started) * 1000)
+    return True
@@ -0,0 +1,38 @@
+"""
+Per-user dashboard fragment caching.
+
+The dashboard's stats cards, referral panel, recent transactions and
+upcoming maturities are cached as template fragments keyed on the user, the
+day and the user's dashboard version. Anything that changes what those
+fragments show (a ledger posting, an investment, a transaction or a
+referral) calls invalidate_dashboards() for the users involved; that drops
+their version key once the surrounding transaction commits, so the next
+dashboard load renders fresh fragments under a new version.
+"""
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'dashboard:{user_id}:version'
+
+
+def fragment_timeout():
+    return getattr(settings, 'DASHBOARD_FRAGMENT_TIMEOUT', 300)
+
+
+def dashboard_version(user_id):
+    """The current version stamp for `user_id`'s dashboard fragments"""
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_dashboards(user_ids):
+    """Expire the dashboard fragments of `user_ids` when the transaction commits"""
+    keys = [VERSION_KEY.format(user_id=user_id) for user_id in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,11 +1,29 @@
 # In celery.py
+import os
 from celery import Celery
 from celery.schedules import crontab
 
-app = Celery('your_project')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crypto_investment.settings')
+
+app = Celery('crypto_investment')
+# CELERY_* settings (e.g. CELERY_TASK_ALWAYS_EAGER for local runs) are read from Django settings
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'add-daily-earnings': {
-        'task': 'your_app.tasks.add_daily_earnings_task',
+        'task': 'investment_app.tasks.fan_out_daily_earnings_task',
         'schedule': crontab(hour=0, minute=0),  # Run daily at midnight
     },
-}
\ No newline at end of file
+    'snapshot-balances': {
+        'task': 'investment_app.tasks.snapshot_balances_task',
+        'schedule': crontab(minute=30),  # Hourly
+    },
+    'complete-matured-investments': {
+        'task': 'investment_app.tasks.complete_matured_investments_task',
+        'schedule': crontab(minute=15),  # Hourly
+    },
+    'forecast-liabilities': {
+        'task': 'investment_app.tasks.forecast_liabilities_task',
+        'schedule': crontab(minute=45),  # Hourly, after the maturity sweep; only changed investments are re-read
+    },
+}
@@ -0,0 +1,55 @@
+"""
+The "as of" time for the current request.
+
+Every Investment time field (days left, days elapsed, progress, current
+value) is measured against clock.now() rather than timezone.now(), and
+AsOfClockMiddleware fixes that time when a request starts, so one
+response shows the same moment everywhere. Outside a request clock.now()
+is the real time unless a block is wrapped in frozen():
+
+    with clock.frozen(run_started):
+        ...
+
+with_time_fields() computes the day counts for a whole queryset in SQL;
+Investment picks them up instead of doing the date math per row.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db.models import DateTimeField, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .utils import DaysBetween
+
+_as_of = ContextVar('as_of', default=None)
+
+
+def now():
+    """The frozen as-of time if there is one, otherwise timezone.now()"""
+    return _as_of.get() or timezone.now()
+
+
+def today():
+    return timezone.localdate(now())
+
+
+@contextmanager
+def frozen(as_of=None):
+    """Pin now() to `as_of` (default: the current time) inside the block"""
+    token = _as_of.set(as_of or timezone.now())
+    try:
+        yield _as_of.get()
+    finally:
+        _as_of.reset(token)
+
+
+def with_time_fields(queryset, as_of=None):
+    """
+    Annotate an Investment queryset with days_elapsed_as_of and
+    days_remaining_as_of, measured in SQL against `as_of` (default: now()).
+    Investment time fields read these instead of computing them per row.
+    """
+    as_of = Value(as_of or now(), output_field=DateTimeField())
+    return queryset.annotate(
+        days_elapsed_as_of=Greatest(DaysBetween('start_date', as_of), 0),
+        days_remaining_as_of=Greatest(DaysBetween(as_of, 'end_date'), 0),
+    )
@@ -0,0 +1,151 @@
+"""
+Human-readable reference codes drawn from counter rows.
+
+Each kind of code has a CodeSequence row. Numbers are taken from it a
+block at a time with a single UPDATE, so a code costs no query at all
+until the process's block runs out, and two processes never get the same
+number. The block size is settings.CODE_BLOCK_SIZE; codes are unique but
+not gapless, and a number is not reused once handed out.
+
+Inside a transaction a new block is only used by that transaction until
+it commits (refills double in size, up to MAX_BLOCK_SIZE), and bulk
+creators call reserve() first, so creating many rows in one atomic block
+costs a couple of queries rather than two per code.
+
+    deposit_reference()   # 'DEP20250117000042'
+    referral_code()       # 'REF000042'
+
+Models hold them in a CodeField, which draws the code when the row is
+inserted, bulk_create() included. Building an instance that is never
+saved (say the Deposit() behind an unbound form) takes no number.
+"""
+import threading
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+DEPOSIT_REFERENCE = 'deposit_reference'
+REFERRAL_CODE = 'referral_code'
+MAX_BLOCK_SIZE = 1000
+
+_lock = threading.Lock()
+_blocks = {}  # sequence name -> iterator over the committed numbers this process holds
+_local = threading.local()  # .pending: sequence name -> (publish, numbers, size) not committed yet
+
+
+def block_size():
+    return max(getattr(settings, 'CODE_BLOCK_SIZE', 20), 1)
+
+
+def allocate(name, size):
+    """
+    Reserve `size` numbers from sequence `name` and return them as a range.
+    The counter row stays locked until the surrounding transaction ends.
+    """
+    from .models import CodeSequence  # Import here to avoid circular imports
+
+    with transaction.atomic(savepoint=False):
+        if not CodeSequence.objects.filter(name=name).update(next_value=F('next_value') + size):
+            CodeSequence.objects.get_or_create(name=name)
+            CodeSequence.objects.filter(name=name).update(next_value=F('next_value') + size)
+        end = CodeSequence.objects.values_list('next_value', flat=True).get(name=name)
+    return range(end - size, end)
+
+
+def _pending(name):
+    """
+    The block of `name` allocated by this thread's open transaction, or
+    None. A block is only valid while its publish callback is still queued:
+    a rollback (of the transaction or of the savepoint that allocated it)
+    drops the callback and undoes the counter update along with it.
+    """
+    entry = getattr(_local, 'pending', {}).get(name)
+    if entry is None:
+        return None
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(func is entry[0] for _, func, _ in connection.run_on_commit):
+        return entry
+    del _local.pending[name]
+    return None
+
+
+def _new_block(name, size):
+    numbers = iter(allocate(name, size))
+    if not transaction.get_connection().in_atomic_block:
+        # Autocommit: the counter update is already durable
+        with _lock:
+            _blocks[name] = numbers
+        return
+
+    def publish():
+        # Hand the rest of the block to the whole process once the counter
+        # update is durable; before that only this transaction may use it,
+        # since a rollback would let another process allocate the same numbers
+        if _local.__dict__.get('pending', {}).get(name, (None,))[0] is publish:
+            del _local.pending[name]
+        with _lock:
+            _blocks[name] = numbers
+
+    transaction.on_commit(publish)
+    _local.__dict__.setdefault('pending', {})[name] = (publish, numbers, size)
+
+
+def reserve(name, count):
+    """
+    Allocate `count` numbers of sequence `name` in one query ahead of a bulk
+    create, so the codes it assigns don't refill a block each.
+    """
+    if count > 0:
+        _new_block(name, max(count, block_size()))
+
+
+def next_number(name):
+    """
+    The next number of sequence `name`: from this process's committed
+    block, else from the block this transaction already allocated, else
+    from a new block (twice the size of the last one when this transaction
+    keeps running out).
+    """
+    with _lock:
+        number = next(_blocks.get(name, iter(())), None)
+    if number is not None:
+        return number
+
+    pending = _pending(name)
+    if pending is not None:
+        number = next(pending[1], None)
+        if number is not None:
+            return number
+    size = min(pending[2] * 2, MAX_BLOCK_SIZE) if pending else block_size()
+    _new_block(name, size)
+    return next_number(name)
+
+
+def deposit_reference():
+    return f"DEP{timezone.localdate():%Y%m%d}{next_number(DEPOSIT_REFERENCE):06d}"
+
+
+def referral_code():
+    return f"REF{next_number(REFERRAL_CODE):06d}"
+
+
+class CodeField(models.CharField):
+    """A CharField set from `generate()` when a row is inserted without a value"""
+
+    def __init__(self, *args, generate=None, **kwargs):
+        self.generate = generate
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['generate'] = self.generate
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        # Called for save() and bulk_create() inserts alike
+        value = getattr(model_instance, self.attname)
+        if add and not value:
+            value = self.generate()
+            setattr(model_instance, self.attname, value)
+        return value
@@ -0,0 +1,45 @@
+"""
+Bulk deposit confirmation.
+
+Confirming deposits one at a time saves each row, fires its post_save
+signal and updates the owner's profile separately. `confirm_deposits`
+does the whole batch set-based instead: one UPDATE for the statuses, one
+INSERT for the deposit Transactions and a single credit per user for the
+sum of their deposits.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from .models import Deposit, Transaction
+from . import wallet
+
+
+def confirm_deposits(queryset, confirmed_by):
+    """
+    Confirm every deposit in `queryset` that isn't confirmed yet, credit
+    the owners' wallets and record a completed 'deposit' Transaction per
+    deposit. Returns the number of deposits confirmed.
+    """
+    with db_transaction.atomic():
+        rows = list(
+            queryset.exclude(status='confirmed').select_for_update()
+            .values_list('pk', 'user_id', 'amount')
+        )
+        if not rows:
+            return 0
+
+        now = timezone.now()
+        Deposit.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+            status='confirmed', confirmed_by=confirmed_by, confirmed_at=now, updated_at=now
+        )
+        Transaction.objects.bulk_create([
+            Transaction(user_id=user_id, transaction_type='deposit', amount=amount, status='completed')
+            for _, user_id, amount in rows
+        ])
+
+        amounts = defaultdict(Decimal)
+        for _, user_id, amount in rows:
+            amounts[user_id] += amount
+        wallet.credit_many(amounts, 'deposits', memo='Deposit confirmation')
+    return len(rows)
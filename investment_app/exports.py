@@ -0,0 +1,144 @@
+"""
+Streaming history exports.
+
+Rows are read with values_list().iterator(), which streams from a
+server-side cursor on PostgreSQL (and fetches in chunks elsewhere), and
+are encoded one at a time, so an export of any size runs in constant
+memory and the first bytes go out as soon as the first chunk is read.
+
+    header, rows = export_rows('transactions', user='alice', since=date(2025, 1, 1))
+    for line in encode(header, rows, 'csv'):
+        ...
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .models import DailyEarning, Deposit, Transaction
+
+CHUNK_SIZE = 2000
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+class Dataset:
+    def __init__(self, model, columns, date_field, type_field=None, status_field=None):
+        self.model = model
+        self.columns = columns  # {header: field lookup}
+        self.date_field = date_field
+        self.type_field = type_field
+        self.status_field = status_field
+
+
+DATASETS = {
+    'transactions': Dataset(
+        Transaction,
+        {
+            'id': 'id', 'user_id': 'user_id', 'username': 'user__username',
+            'type': 'transaction_type', 'amount': 'amount', 'status': 'status',
+            'investment_id': 'investment_id', 'reference_id': 'reference_id', 'created_at': 'created_at',
+        },
+        date_field='created_at', type_field='transaction_type', status_field='status',
+    ),
+    'daily_earnings': Dataset(
+        DailyEarning,
+        {
+            'id': 'id', 'user_id': 'user_id', 'username': 'user__username',
+            'investment_id': 'investment_id', 'amount': 'amount', 'date': 'date',
+        },
+        date_field='date',
+    ),
+    'deposits': Dataset(
+        Deposit,
+        {
+            'id': 'id', 'user_id': 'user_id', 'username': 'user__username',
+            'network': 'crypto_wallet__network', 'amount': 'amount', 'amount_in_crypto': 'amount_in_crypto',
+            'status': 'status', 'transaction_hash': 'transaction_hash', 'reference_id': 'reference_id',
+            'created_at': 'created_at', 'confirmed_at': 'confirmed_at',
+        },
+        date_field='created_at', type_field='crypto_wallet__network', status_field='status',
+    ),
+}
+
+
+def parse_date(value):
+    """A date from YYYY-MM-DD (or None for empty), raising ValueError otherwise"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_rows(name, user=None, since=None, until=None, type=None, status=None):
+    """
+    (header, rows) for dataset `name`: the column names and an iterator of
+    one tuple per row, oldest first. Filters are checked up front, before
+    anything is streamed.
+
+    `user` is a user id or username; `since` and `until` are inclusive
+    dates; `type` is the transaction type (transactions) or network
+    (deposits). Raises KeyError for an unknown dataset and ValueError for a
+    filter the dataset doesn't support.
+    """
+    dataset = DATASETS[name]
+    queryset = dataset.model.objects.all()
+
+    if user:
+        user = str(user)
+        queryset = queryset.filter(user_id=int(user)) if user.isdigit() else queryset.filter(user__username=user)
+
+    date_field = dataset.date_field
+    is_datetime = date_field != 'date'
+    if since:
+        queryset = queryset.filter(**{f'{date_field}__gte': _day_start(since) if is_datetime else since})
+    if until:
+        if is_datetime:
+            # Compare against the next midnight so the column's index can be used
+            queryset = queryset.filter(**{f'{date_field}__lt': _day_start(until + timedelta(days=1))})
+        else:
+            queryset = queryset.filter(**{f'{date_field}__lte': until})
+
+    for field, value, label in [(dataset.type_field, type, 'type'), (dataset.status_field, status, 'status')]:
+        if value:
+            if field is None:
+                raise ValueError(f'{name} cannot be filtered by {label}')
+            queryset = queryset.filter(**{field: value})
+
+    rows = queryset.order_by('id').values_list(*dataset.columns.values()).iterator(chunk_size=CHUNK_SIZE)
+    return tuple(dataset.columns), rows
+
+
+class _Echo:
+    """File-like object whose write() hands back what it was given"""
+
+    def write(self, value):
+        return value
+
+
+def _jsonable(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return str(value)
+
+
+def encode(header, rows, format='csv'):
+    """Encode the rows from export_rows() as CSV or JSON Lines, one line per item"""
+    if format not in FORMATS:
+        raise ValueError(f'Unknown export format {format!r}')
+    return _encode_csv(header, rows) if format == 'csv' else _encode_jsonl(header, rows)
+
+
+def _encode_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _encode_jsonl(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, map(_jsonable, row)))) + '\n'
@@ -0,0 +1,176 @@
+"""
+Book-wide liability and cash-flow forecast.
+
+Every active investment owes its principal on its maturity date and one
+daily return for each day from the day after it starts up to maturity.
+LiabilityEntry keeps that contribution for each active investment, so a
+forecast is a handful of aggregate queries over a narrow table: returns
+starting and stopping per date, principal maturing per date, and pending
+withdrawals due now.
+
+take_snapshot() first re-counts only the investments changed since the
+previous snapshot (Investment.updated_at, which the lifecycle transitions
+bump) and those whose plan's daily return has changed since they were
+counted, then stores the result as a LiabilitySnapshot with one
+LiabilityForecastDay per date, which the staff report reads as is:
+
+    python manage.py forecast_liabilities [--horizon 30] [--full]
+
+Investments changed with update() without touching updated_at are missed
+until the next --full run.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .accrual import daily_return
+from .models import Investment, LiabilityEntry, LiabilityForecastDay, LiabilitySnapshot, Transaction
+from .plans import get_catalog
+
+HORIZON = 30
+CHUNK_SIZE = 2000
+# Re-read changes this far behind the previous snapshot, so a save that
+# committed after it but was timestamped before it is still picked up
+OVERLAP = timedelta(minutes=5)
+
+ZERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=15, decimal_places=2))
+
+
+def _money(value):
+    # SQLite sums decimals as floats; bring them back to cents
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def _entries(investments):
+    """LiabilityEntry rows for the active investments in `investments`, read as plain tuples"""
+    rows = investments.filter(status='active', end_date__isnull=False).values_list(
+        'pk', 'plan_id', 'plan__daily_return', 'amount', 'start_date', 'end_date'
+    )
+    return [
+        LiabilityEntry(
+            investment_id=pk, plan_id=plan_id, rate=rate, principal=amount,
+            daily_return=daily_return(amount, rate),
+            first_payout=timezone.localdate(start_date) + timedelta(days=1),
+            maturity_date=timezone.localdate(end_date),
+        )
+        for pk, plan_id, rate, amount, start_date, end_date in rows
+    ]
+
+
+def stale_entries():
+    """Ids of investments counted at a plan rate that has since changed"""
+    stale = Q()
+    for plan in get_catalog().all():
+        stale |= Q(plan_id=plan.pk) & ~Q(rate=plan.daily_return)
+    if not stale:
+        return []
+    return list(LiabilityEntry.objects.filter(stale).values_list('investment_id', flat=True))
+
+
+def refresh_entries(since=None):
+    """
+    Re-count the investments changed after `since`, or every investment
+    when it is None. Returns the number of investments re-read.
+    """
+    if since is None:
+        LiabilityEntry.objects.all().delete()
+        active = Investment.objects.filter(status='active').order_by('pk').values_list('pk', flat=True)
+        ids = list(active.iterator(chunk_size=CHUNK_SIZE))
+    else:
+        changed = Investment.objects.filter(updated_at__gt=since).values_list('pk', flat=True)
+        ids = sorted(set(changed) | set(stale_entries()))
+
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        if since is not None:
+            LiabilityEntry.objects.filter(investment_id__in=chunk).delete()
+        LiabilityEntry.objects.bulk_create(_entries(Investment.objects.filter(pk__in=chunk)))
+    return len(ids)
+
+
+def forecast_days(as_of, horizon=HORIZON):
+    """
+    (totals, days) for the `horizon` days after `as_of`, from the current
+    entries. Day `as_of` also carries the principal of investments past
+    maturity but not completed yet, and every pending withdrawal.
+    """
+    end = as_of + timedelta(days=horizon)
+    paying = Q(first_payout__lte=F('maturity_date'))  # matured the day it started: no returns
+    totals = LiabilityEntry.objects.aggregate(
+        investments=Count('pk'),
+        outstanding=Coalesce(Sum('principal'), ZERO),
+        returns=Coalesce(Sum('daily_return', filter=Q(first_payout__lte=as_of, maturity_date__gte=as_of)), ZERO),
+        overdue=Coalesce(Sum('principal', filter=Q(maturity_date__lt=as_of)), ZERO),
+        overdue_count=Count('pk', filter=Q(maturity_date__lt=as_of)),
+    )
+    withdrawals = Transaction.objects.filter(transaction_type='withdrawal', status='pending').aggregate(
+        total=Coalesce(Sum('amount'), ZERO), count=Count('pk'),
+    )
+    starting = {
+        date: _money(total)
+        for date, total in LiabilityEntry.objects.filter(paying, first_payout__gt=as_of, first_payout__lte=end)
+        .values('first_payout').annotate(total=Sum('daily_return')).values_list('first_payout', 'total')
+    }
+    maturing = {
+        row['maturity_date']: {**row, 'due': _money(row['due']), 'stopping': _money(row['stopping'])}
+        for row in LiabilityEntry.objects.filter(maturity_date__gte=as_of, maturity_date__lte=end)
+        .values('maturity_date').annotate(
+            due=Sum('principal'), count=Count('pk'),
+            stopping=Coalesce(Sum('daily_return', filter=paying), ZERO),
+        )
+    }
+
+    days = []
+    totals = {name: _money(value) if isinstance(value, Decimal) else value for name, value in totals.items()}
+    withdrawals['total'] = _money(withdrawals['total'])
+    returns = totals['returns']
+    for offset in range(horizon + 1):
+        date = as_of + timedelta(days=offset)
+        if offset:
+            returns += starting.get(date, 0)
+        matured = maturing.get(date, {'due': Decimal('0.00'), 'count': 0, 'stopping': 0})
+        principal, count = matured['due'], matured['count']
+        due_now = Decimal('0.00')
+        if not offset:
+            principal += totals['overdue']
+            count += totals['overdue_count']
+            due_now = withdrawals['total']
+        days.append(LiabilityForecastDay(
+            date=date, returns=returns, principal=principal, withdrawals=due_now,
+            total=returns + principal + due_now, maturing=count,
+        ))
+        returns -= matured['stopping']
+
+    return {
+        'active_investments': totals['investments'],
+        'outstanding_principal': totals['outstanding'],
+        'scheduled_returns': sum((day.returns for day in days), Decimal('0.00')),
+        'pending_withdrawals': withdrawals['total'],
+        'pending_withdrawal_count': withdrawals['count'],
+    }, days
+
+
+def take_snapshot(as_of=None, horizon=HORIZON, full=False):
+    """
+    Bring the entries up to date and store the forecast for `as_of`
+    (default: today), replacing an earlier snapshot for the same date.
+    With `full`, or before the first snapshot, every investment is re-read.
+    """
+    started = timezone.now()
+    as_of = as_of or timezone.localdate(started)
+    with db_transaction.atomic():
+        # Serialise runs on the latest snapshot so two can't refresh the same entries
+        previous = LiabilitySnapshot.objects.select_for_update().order_by('-changes_through').first()
+        since = None if full or previous is None else previous.changes_through - OVERLAP
+        recomputed = refresh_entries(since)
+        totals, days = forecast_days(as_of, horizon)
+        snapshot, _ = LiabilitySnapshot.objects.update_or_create(as_of=as_of, defaults={
+            **totals, 'horizon_days': horizon, 'changes_through': started, 'recomputed': recomputed,
+        })
+        snapshot.days.all().delete()
+        for day in days:
+            day.snapshot = snapshot
+        LiabilityForecastDay.objects.bulk_create(days)
+    return snapshot
@@ -0,0 +1,57 @@
+"""
+Per-request SQL instrumentation.
+
+QueryRecorder is installed as a database execute wrapper and records the
+number of queries, total SQL time and how often each statement (with its
+parameters stripped) ran. Any statement that runs more than once in a
+request is reported as a duplicate, which is usually an N+1 loop.
+"""
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            # Parameters are passed separately, so the SQL text is already a fingerprint
+            self.fingerprints[sql] += 1
+
+    @property
+    def duplicates(self):
+        """{fingerprint: times run} for statements run more than once"""
+        return {sql: runs for sql, runs in self.fingerprints.items() if runs > 1}
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'sql_time_ms': round(self.duration * 1000, 2),
+            'duplicate_queries': sum(runs - 1 for runs in self.duplicates.values()),
+        }
+
+
+@contextmanager
+def record_queries():
+    """Record every query run on any database connection inside the block"""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def query_budget(url_name):
+    """The maximum number of queries configured for `url_name`, if any"""
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
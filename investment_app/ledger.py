@@ -0,0 +1,128 @@
+"""
+Append-only double-entry ledger for wallet balances.
+
+Every change to a user's wallet is posted as a journal of two LedgerEntry
+rows written with a single INSERT: the signed amount on the user's
+'wallet' account and the opposite amount on a system account ('deposits',
+'earnings', ...). Entries are never updated, so concurrent postings never
+contend on a shared row.
+
+A wallet balance is the latest BalanceSnapshot plus the wallet entries
+posted after it. `snapshot_balances` (run periodically) keeps that tail
+short, so reading a balance costs two indexed queries.
+
+The balance the views and investment_app.wallet check is still
+UserProfile.wallet_balance: wallet.debit() tests and decrements it in one
+conditional UPDATE, which is what keeps concurrent debits from overdrawing,
+and a balance summed from entries can't be checked that way without
+locking. wallet posts every change here in the same transaction, so
+`balance()` always reconciles with the profile and serves audits.
+"""
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import BalanceSnapshot, LedgerEntry
+from .caching import invalidate_dashboards
+
+WALLET = 'wallet'
+
+# Snapshots only cover entries at least this old, so a posting whose
+# transaction commits after a higher id has been snapshotted is not skipped
+SNAPSHOT_LAG = timedelta(minutes=5)
+
+ZERO = Decimal('0.00')
+
+
+def _journal(user_id, amount, account, memo='', transaction=None):
+    journal_id = uuid.uuid4()
+    transaction_id = transaction.pk if transaction is not None else None
+    return [
+        LedgerEntry(journal_id=journal_id, user_id=user_id, account=WALLET, amount=amount,
+                    memo=memo, transaction_id=transaction_id),
+        LedgerEntry(journal_id=journal_id, user_id=user_id, account=account, amount=-amount,
+                    memo=memo, transaction_id=transaction_id),
+    ]
+
+
+def post(user, amount, account, memo='', transaction=None):
+    """
+    Credit (positive `amount`) or debit (negative) `user`'s wallet against
+    the system `account`.
+    """
+    invalidate_dashboards([user.pk])
+    return LedgerEntry.objects.bulk_create(_journal(user.pk, amount, account, memo, transaction))
+
+
+def post_many(amounts, account, memo=''):
+    """Post {user_id: amount} against one system account in a single INSERT"""
+    invalidate_dashboards(amounts)
+    entries = []
+    for user_id, amount in amounts.items():
+        entries.extend(_journal(user_id, amount, account, memo))
+    return LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+def balance(user):
+    """Current wallet balance: latest snapshot plus the entries after it"""
+    snapshot = (
+        BalanceSnapshot.objects.filter(user=user)
+        .order_by('-last_entry_id').values_list('balance', 'last_entry_id').first()
+    )
+    opening, last_entry_id = snapshot or (ZERO, 0)
+    tail = LedgerEntry.objects.filter(
+        user=user, account=WALLET, id__gt=last_entry_id
+    ).aggregate(total=Sum('amount'))['total']
+    return opening + (tail or ZERO)
+
+
+def snapshot_balances(user_ids=None, batch_size=1000):
+    """
+    Write a new snapshot for every user (or every user in `user_ids`) with
+    wallet entries after their latest snapshot. Returns the number written.
+    """
+    latest = BalanceSnapshot.objects.filter(user=OuterRef('user')).order_by('-last_entry_id')
+    high_water = (
+        LedgerEntry.objects.filter(created_at__lte=timezone.now() - SNAPSHOT_LAG)
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+    if high_water is None:
+        return 0
+
+    entries = LedgerEntry.objects.filter(account=WALLET, id__lte=high_water)
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+    tails = entries.annotate(
+        snapshot_entry=Subquery(latest.values('last_entry_id')[:1]),
+    ).filter(
+        # Entries not covered by the user's latest snapshot
+        id__gt=Coalesce(F('snapshot_entry'), 0)
+    ).values('user_id').annotate(total=Sum('amount')).values_list('user_id', 'total')
+
+    created = 0
+    batch = []
+    for user_id, total in tails.iterator():
+        batch.append((user_id, total))
+        if len(batch) >= batch_size:
+            created += _write_snapshots(batch, high_water)
+            batch = []
+    if batch:
+        created += _write_snapshots(batch, high_water)
+    return created
+
+
+def _write_snapshots(tails, high_water):
+    user_ids = [user_id for user_id, _ in tails]
+    latest = BalanceSnapshot.objects.filter(user=OuterRef('user')).order_by('-last_entry_id')
+    previous = dict(
+        BalanceSnapshot.objects.filter(
+            user_id__in=user_ids, pk=Subquery(latest.values('pk')[:1])
+        ).values_list('user_id', 'balance')
+    )
+    BalanceSnapshot.objects.bulk_create([
+        BalanceSnapshot(user_id=user_id, balance=previous.get(user_id, ZERO) + total, last_entry_id=high_water)
+        for user_id, total in tails
+    ])
+    return len(tails)
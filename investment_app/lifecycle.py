@@ -0,0 +1,132 @@
+"""
+Investment lifecycle.
+
+    pending --confirm--> active --complete--> completed
+    pending/active --cancel--> cancelled
+
+complete_matured() is the bulk form of `complete` for the maturity sweep.
+
+Each transition is a single conditional UPDATE of the investment row: the
+WHERE clause checks the current status, so a transition that lost a race
+(or doesn't apply) changes nothing and raises InvalidTransition. The
+side effects (principal rollup, dashboard cache) follow in the same
+database transaction. Nothing here calls Investment.save(), so no save
+signals run.
+
+Completion pays nothing: the daily accrual has already credited the
+returns, so total_return is recorded as 0.00, the figure Investment.save()
+used to record on completion (calculate_total_return() is zero once an
+investment is no longer active).
+"""
+from django.db import transaction as db_transaction
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .caching import invalidate_dashboards
+from .models import Investment
+from .rollups import add_invested_principal
+
+MATURITY_BATCH_SIZE = 1000
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def _transition(investment, sources, target, **fields):
+    if investment.status not in sources:
+        raise InvalidTransition(f'Investment #{investment.pk} is {investment.status}, not {" or ".join(sources)}')
+    now = timezone.now()
+    updated = Investment.objects.filter(pk=investment.pk, status=investment.status).update(
+        status=target, updated_at=now, **fields
+    )
+    if not updated:
+        raise InvalidTransition(f'Investment #{investment.pk} changed status concurrently')
+
+    previous = investment.status
+    investment.status = target
+    investment.updated_at = now
+    for field, value in fields.items():
+        setattr(investment, field, value)
+
+    if previous != target and 'active' in (previous, target):
+        add_invested_principal({investment.user_id: investment.amount if target == 'active' else -investment.amount})
+    invalidate_dashboards([investment.user_id])
+
+
+def confirm(investment):
+    """Mark the payment confirmed; a pending investment becomes active"""
+    if investment.is_confirmed:
+        raise InvalidTransition(f'Investment #{investment.pk} is already confirmed')
+    with db_transaction.atomic():
+        _transition(investment, ['pending', 'active'], 'active', is_confirmed=True)
+
+
+def complete(investment):
+    """Complete an active investment; its returns were paid by the daily accrual"""
+    with db_transaction.atomic():
+        _transition(investment, ['active'], 'completed', total_return=Decimal('0.00'))
+
+
+def cancel(investment):
+    """Cancel a pending or active investment"""
+    with db_transaction.atomic():
+        _transition(investment, ['pending', 'active'], 'cancelled')
+
+
+def confirm_many(queryset):
+    """
+    Confirm every unconfirmed investment in `queryset` with one UPDATE;
+    pending ones become active. Returns the number confirmed.
+    """
+    with db_transaction.atomic():
+        unconfirmed = queryset.filter(is_confirmed=False, status__in=['pending', 'active'])
+        rows = list(unconfirmed.select_for_update().values_list('user_id', 'amount', 'status'))
+        updated = unconfirmed.update(
+            is_confirmed=True,
+            status=Case(When(status='pending', then=Value('active')), default=F('status')),
+            updated_at=timezone.now(),
+        )
+        activated = {}
+        for user_id, amount, status in rows:
+            if status == 'pending':
+                activated[user_id] = activated.get(user_id, 0) + amount
+        if activated:
+            add_invested_principal(activated)
+        invalidate_dashboards([user_id for user_id, _, _ in rows])
+    return updated
+
+
+def complete_matured(now=None, batch_size=MATURITY_BATCH_SIZE):
+    """
+    Complete every active investment whose end_date has passed, a batch at
+    a time, with one UPDATE per batch that records total_return as 0.00,
+    as `complete` does. Returns {'investments': n, 'users': n}.
+    """
+    now = now or timezone.now()
+    matured = Investment.objects.filter(status='active', end_date__lt=now)
+    stats = {'investments': 0}
+    users = set()
+    while True:
+        with db_transaction.atomic():
+            # (status, end_date) is indexed by inv_status_end_idx
+            rows = list(
+                matured.order_by('end_date', 'id').select_for_update(skip_locked=True)
+                .values_list('pk', 'user_id', 'amount')[:batch_size]
+            )
+            if not rows:
+                break
+
+            principal = defaultdict(Decimal)
+            for _, user_id, amount in rows:
+                principal[user_id] -= amount
+            Investment.objects.filter(pk__in=[row[0] for row in rows], status='active').update(
+                status='completed', total_return=Decimal('0.00'), updated_at=now,
+            )
+            add_invested_principal(principal)
+            invalidate_dashboards(principal)
+
+            stats['investments'] += len(rows)
+            users.update(principal)
+    return {**stats, 'users': len(users)}
@@ -1,54 +1,62 @@
 # In your_app/management/commands/add_daily_earnings.py
 from django.core.management.base import BaseCommand
+from django.db.models import F
 from django.utils import timezone
-from django.db import transaction
-from decimal import Decimal
-from investment_app.models import Investment, UserProfile, DailyEarning
+from investment_app.accrual import accrue_daily_earnings, CHUNK_SIZE
+from investment_app.models import Investment, DailyEarning, RunCheckpoint
+
+JOB_NAME = 'add_daily_earnings_command'
 
 class Command(BaseCommand):
     help = 'Adds daily earnings from investments to user total earnings'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Number of users written per batch'
+        )
+
     def handle(self, *args, **options):
         today = timezone.now().date()
-        
-        # Check if we've already processed earnings for today
-        if DailyEarning.objects.filter(date=today).exists():
+
+        # Each chunk commits on its own, so a run that died part way is resumed from its checkpoint
+        checkpoint = RunCheckpoint.objects.filter(job=JOB_NAME, run_date=today).first()
+        if checkpoint is None:
+            # Earnings without a checkpoint were added by another run (e.g. the sharded task)
+            if DailyEarning.objects.filter(date=today).exists():
+                self.stdout.write(self.style.WARNING('Daily earnings already processed for today'))
+                return
+            checkpoint = RunCheckpoint.objects.create(job=JOB_NAME, run_date=today)
+        elif checkpoint.is_complete:
             self.stdout.write(self.style.WARNING('Daily earnings already processed for today'))
             return
-        
-        # Get all active investments
+        else:
+            self.stdout.write(f'Resuming run for {today} after user #{checkpoint.last_processed_id}')
+
+        def save_progress(last_user_id, users, investments, total):
+            RunCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                last_processed_id=last_user_id,
+                processed_count=F('processed_count') + investments,
+                total_amount=F('total_amount') + total,
+                updated_at=timezone.now(),
+            )
+
+        # Get all active investments of the users not credited yet
         active_investments = Investment.objects.filter(
             status='active',
-            end_date__gte=today
+            end_date__gte=today,
+            user_id__gt=checkpoint.last_processed_id,
+        )
+
+        accrue_daily_earnings(
+            today, active_investments, chunk_size=options.get('chunk_size') or CHUNK_SIZE,
+            on_chunk=save_progress,
         )
-        
-        earnings_added = 0
-        with transaction.atomic():
-            for investment in active_investments:
-                # Calculate daily earning based on your investment plan
-                daily_earning = investment.calculate_daily_earning()
-                
-                if daily_earning > 0:
-                    # Create daily earning record
-                    DailyEarning.objects.create(
-                        user=investment.user,
-                        amount=daily_earning,
-                        date=today,
-                        investment=investment
-                    )
-                    
-                    # Update user's total earnings and wallet balance
-                    profile, created = UserProfile.objects.get_or_create(
-                        user=investment.user,
-                        defaults={'total_earnings': Decimal('0.00'), 'wallet_balance': Decimal('0.00')}
-                    )
-                    
-                    profile.total_earnings += daily_earning
-                    profile.wallet_balance += daily_earning
-                    profile.save()
-                    
-                    earnings_added += 1
-        
+
+        checkpoint.refresh_from_db()
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save(update_fields=['completed_at', 'updated_at'])
+
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully added daily earnings for {earnings_added} investments')
-        )
\ No newline at end of file
+            self.style.SUCCESS(f'Successfully added daily earnings for {checkpoint.processed_count} investments')
+        )
@@ -0,0 +1,37 @@
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from investment_app.benchmarks import SCENARIOS
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS), help='Scenario to run')
+        parser.add_argument('--requests', type=int, default=200, help='Number of concurrent requests/operations')
+        parser.add_argument('--size', type=int, action='append', help='Batch size(s) for batch scenarios')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            # SQLite's shared-cache in-memory test database fails concurrent
+            # writers immediately; use a file so they queue on the lock instead
+            test_settings = connection.settings_dict.setdefault('TEST', {})
+            if not test_settings.get('NAME'):
+                test_settings['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            passed = SCENARIOS[options['scenario']](
+                self.stdout,
+                requests=options['requests'],
+                sizes=options.get('size'),
+            )
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        if not passed:
+            raise CommandError(f'Benchmark {options["scenario"]} failed its correctness check')
+        self.stdout.write(self.style.SUCCESS(f'Benchmark {options["scenario"]} passed'))
@@ -1,66 +1,85 @@
 # investment_app/management/commands/calculate_daily_earnings.py
+from datetime import date
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from decimal import Decimal
-from investment_app.models import Investment, Transaction, DailyEarning, UserProfile
 from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+from investment_app.accrual import daily_return, write_accruals
+from investment_app.models import Investment, RunCheckpoint
+
+JOB_NAME = 'calculate_daily_earnings'
 
 class Command(BaseCommand):
     help = 'Calculate daily earnings for all active investments'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Number of investments committed per transaction'
+        )
+        parser.add_argument(
+            '--date', type=date.fromisoformat,
+            help='Run (or resume) the accrual for this date instead of today (YYYY-MM-DD)'
+        )
+
     def handle(self, *args, **options):
-        today = timezone.now().date()
-        
-        active_investments = Investment.objects.filter(status='active')
-        
-        total_earnings = Decimal('0.00')
-        processed_users = set()
-        
-        with transaction.atomic():
-            for investment in active_investments:
-                # Skip if we've already processed this user today
-                if investment.user.id in processed_users:
+        today = options.get('date') or timezone.now().date()
+        chunk_size = options.get('chunk_size') or 500
+
+        checkpoint, created = RunCheckpoint.objects.get_or_create(job=JOB_NAME, run_date=today)
+        if checkpoint.is_complete:
+            self.stdout.write(self.style.WARNING(f'Daily earnings already calculated for {today}'))
+            return
+        if not created:
+            self.stdout.write(f'Resuming run for {today} after investment #{checkpoint.last_processed_id}')
+        if checkpoint.max_id is None:
+            checkpoint.max_id = Investment.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+            checkpoint.save(update_fields=['max_id', 'updated_at'])
+
+        # Each user is credited once per day, from their most recent active investment. Investments
+        # created after the run started are left out, or a user already credited in a committed
+        # chunk would get a new candidate above the checkpoint and be credited again on resume.
+        active_investments = Investment.objects.filter(status='active', pk__lte=checkpoint.max_id)
+        candidates = active_investments.exclude(
+            Exists(active_investments.filter(user=OuterRef('user'), pk__gt=OuterRef('pk')))
+        ).order_by('pk')
+
+        while True:
+            rows = list(
+                candidates.filter(pk__gt=checkpoint.last_processed_id).values_list(
+                    'pk', 'user_id', 'amount', 'plan__daily_return'
+                )[:chunk_size]
+            )
+            if not rows:
+                break
+
+            with transaction.atomic():
+                # Lock the checkpoint so a concurrent run can't credit the same chunk
+                locked = RunCheckpoint.objects.select_for_update().get(pk=checkpoint.pk)
+                if locked.last_processed_id != checkpoint.last_processed_id:
+                    checkpoint = locked
                     continue
-                    
-                daily_return = investment.calculate_daily_return()
-                
-                if daily_return > 0:
-                    # Check if daily earning already exists for this user today
-                    daily_earning, created = DailyEarning.objects.get_or_create(
-                        user=investment.user,
-                        date=today,
-                        defaults={
-                            'amount': daily_return,
-                            'investment': investment
-                        }
-                    )
-                    
-                    if not created:
-                        # Update existing record
-                        daily_earning.amount += daily_return
-                        daily_earning.save()
-                    
-                    # Create transaction for daily return
-                    Transaction.objects.create(
-                        user=investment.user,
-                        transaction_type='return',
-                        amount=daily_return,
-                        status='completed',
-                        investment=investment
-                    )
-                    
-                    # Update user's total earnings and wallet balance
-                    profile = UserProfile.objects.get(user=investment.user)
-                    profile.total_earnings += daily_return
-                    profile.wallet_balance += daily_return
-                    profile.save()
-                    
-                    total_earnings += daily_return
-                    processed_users.add(investment.user.id)
-        
+
+                accruals = {}
+                for investment_id, user_id, amount, daily_rate in rows:
+                    earning = daily_return(amount, daily_rate)
+                    if earning > 0:
+                        accruals[user_id] = (investment_id, earning)
+                if accruals:
+                    write_accruals(today, accruals, record_transactions=True)
+
+                locked.last_processed_id = rows[-1][0]
+                locked.processed_count += len(accruals)
+                locked.total_amount += sum(amount for _, amount in accruals.values())
+                locked.save()
+            checkpoint = locked
+
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save(update_fields=['completed_at', 'updated_at'])
+
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully calculated daily earnings for {len(processed_users)} users. '
-                f'Total earnings: ${total_earnings}'
+                f'Successfully calculated daily earnings for {checkpoint.processed_count} users. '
+                f'Total earnings: ${checkpoint.total_amount}'
             )
-        )
\ No newline at end of file
+        )
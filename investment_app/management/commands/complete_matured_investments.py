@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from investment_app.lifecycle import MATURITY_BATCH_SIZE, complete_matured
+
+class Command(BaseCommand):
+    help = 'Complete active investments past their end date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=MATURITY_BATCH_SIZE,
+                            help='Number of investments completed per transaction')
+
+    def handle(self, *args, **options):
+        stats = complete_matured(batch_size=options.get('batch_size') or MATURITY_BATCH_SIZE)
+        self.stdout.write(self.style.SUCCESS(
+            f"Completed {stats['investments']} matured investments for {stats['users']} users"
+        ))
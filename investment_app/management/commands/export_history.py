@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from investment_app import exports
+
+class Command(BaseCommand):
+    help = 'Stream Transaction, DailyEarning or Deposit history as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS), help='History to export')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv', help='Output format')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--user', help='User id or username')
+        parser.add_argument('--since', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--type', help='Transaction type (transactions) or network (deposits)')
+        parser.add_argument('--status', help='Status (transactions and deposits)')
+
+    def handle(self, *args, **options):
+        try:
+            header, rows = exports.export_rows(
+                options['dataset'],
+                user=options.get('user'),
+                since=exports.parse_date(options.get('since')),
+                until=exports.parse_date(options.get('until')),
+                type=options.get('type'),
+                status=options.get('status'),
+            )
+            lines = exports.encode(header, rows, options['format'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        count = -1 if options['format'] == 'csv' else 0  # don't count the CSV header
+        if options.get('output'):
+            with open(options['output'], 'w', newline='') as output:
+                for line in lines:
+                    output.write(line)
+                    count += 1
+            self.stderr.write(self.style.SUCCESS(f"Exported {count} {options['dataset']} rows to {options['output']}"))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from investment_app.forecast import HORIZON, take_snapshot
+
+class Command(BaseCommand):
+    help = 'Snapshot the book-wide liability and cash-flow forecast, re-reading only changed investments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=HORIZON, help='Number of days forecast')
+        parser.add_argument('--full', action='store_true',
+                            help='Re-read every active investment instead of only the changed ones')
+
+    def handle(self, *args, **options):
+        snapshot = take_snapshot(horizon=options.get('horizon') or HORIZON, full=options.get('full'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Forecast for {snapshot.as_of}: {snapshot.active_investments} active investments '
+            f'({snapshot.recomputed} re-read), ${snapshot.outstanding_principal:.2f} principal, '
+            f'${snapshot.scheduled_returns:.2f} returns over {snapshot.horizon_days} days, '
+            f'${snapshot.pending_withdrawals:.2f} pending withdrawals'
+        ))
@@ -1,46 +1,23 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import timedelta
-from decimal import Decimal
-from investment_app.models import Referral, UserProfile, Transaction
+from investment_app.referrals import BATCH_SIZE, process_referral_bonuses
 
 class Command(BaseCommand):
     help = 'Process referral bonuses every 3 months'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Number of referrals settled per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the bonuses that would be paid without writing anything')
+
     def handle(self, *args, **options):
-        three_months_ago = timezone.now() - timedelta(days=90)
-        unpaid_referrals = Referral.objects.filter(
-            created_at__lte=three_months_ago,
-            bonus_paid=False
+        dry_run = options.get('dry_run')
+        stats = process_referral_bonuses(batch_size=options.get('batch_size') or BATCH_SIZE, dry_run=dry_run)
+        summary = (
+            f"{stats['paid']} of {stats['referrals']} eligible referrals, "
+            f"{stats['referrers']} referrers, total ${stats['total']:.2f}"
         )
-        
-        for referral in unpaid_referrals:
-            # Get all investments made by the referred user
-            referred_investments = referral.referred_user.investment_set.all()
-            total_deposits = sum(inv.amount for inv in referred_investments)
-            
-            # Calculate 2% bonus
-            bonus_amount = total_deposits * Decimal('0.02')
-            
-            if bonus_amount > 0:
-                # Update referrer's profile
-                referrer_profile = UserProfile.objects.get(user=referral.referrer)
-                referrer_profile.wallet_balance += bonus_amount
-                referrer_profile.total_referral_bonus += bonus_amount
-                referrer_profile.save()
-                
-                # Create transaction for referral bonus
-                Transaction.objects.create(
-                    user=referral.referrer,
-                    transaction_type='referral',
-                    amount=bonus_amount,
-                    status='completed'
-                )
-                
-                # Mark referral as paid
-                referral.bonus_paid = True
-                referral.save()
-        
-        self.stdout.write(
-            self.style.SUCCESS('Successfully processed referral bonuses')
-        )
\ No newline at end of file
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run, nothing written: would pay {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Successfully processed referral bonuses: paid {summary}'))
@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from investment_app.models import EarningsRollup
+from investment_app.rollups import compute_rollups
+
+class Command(BaseCommand):
+    help = 'Recompute every user\'s earnings rollup from transactions, investments and daily earnings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of users rebuilt per batch')
+
+    def handle(self, *args, **options):
+        chunk_size = options.get('chunk_size') or 1000
+        today = timezone.localdate()
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+        for start in range(0, len(user_ids), chunk_size):
+            rollups = compute_rollups(user_ids[start:start + chunk_size], today)
+            with transaction.atomic():
+                EarningsRollup.objects.bulk_create(
+                    rollups,
+                    update_conflicts=True,
+                    unique_fields=['user'],
+                    update_fields=['lifetime_earnings', 'today_earnings', 'weekly_earnings',
+                                   'invested_principal', 'as_of', 'updated_at'],
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt earnings rollups for {len(user_ids)} users'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from investment_app import referral_graph
+
+class Command(BaseCommand):
+    help = 'Rebuild the referral closure table (ReferralPath) from the Referral table'
+
+    def handle(self, *args, **options):
+        written = referral_graph.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt referral graph: {written} paths'))
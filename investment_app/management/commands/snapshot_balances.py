@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from investment_app.ledger import snapshot_balances
+
+class Command(BaseCommand):
+    help = 'Snapshot wallet balances from the ledger so balance reads only sum a short tail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of snapshots written per INSERT')
+
+    def handle(self, *args, **options):
+        created = snapshot_balances(batch_size=options.get('batch_size') or 1000)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {created} balance snapshots'))
@@ -0,0 +1,57 @@
+import json
+import logging
+from django.conf import settings
+from . import clock
+from .instrumentation import query_budget, record_queries
+
+logger = logging.getLogger('investment_app.queries')
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the SQL issued while handling each request.
+
+    With DEBUG on the numbers are returned as X-Query-* response headers;
+    otherwise one JSON log line per request goes to the
+    'investment_app.queries' logger. Requests over the view's budget in
+    settings.QUERY_BUDGETS are logged as warnings either way.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        stats = {'url_name': url_name, 'path': request.path, **recorder.as_dict()}
+        budget = query_budget(url_name)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(stats['queries'])
+            response['X-Query-Time-Ms'] = str(stats['sql_time_ms'])
+            response['X-Query-Duplicates'] = str(stats['duplicate_queries'])
+        else:
+            logger.info(json.dumps(stats))
+
+        if budget is not None and recorder.count > budget:
+            logger.warning(json.dumps({**stats, 'budget': budget, 'duplicates': recorder.duplicates}))
+
+        return response
+
+
+class AsOfClockMiddleware:
+    """
+    Freeze investment_app.clock for the duration of each request, so every
+    time-dependent figure in one response is computed as of the same moment.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with clock.frozen() as as_of:
+            request.as_of = as_of
+            return self.get_response(request)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-17 06:49
+
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0009_userprofile_today_earnings_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailyearning',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.CreateModel(
+            name='RunCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=50)),
+                ('run_date', models.DateField()),
+                ('last_processed_id', models.BigIntegerField(default=0)),
+                ('processed_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'unique_together': {('job', 'run_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0010_runcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='runcheckpoint',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='runcheckpoint',
+            name='shard',
+            field=models.IntegerField(default=0, help_text='0 for the whole run, 1..N for a shard of a fanned-out run'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='runcheckpoint',
+            unique_together={('job', 'run_date', 'shard')},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 06:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0011_runcheckpoint_shard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EarningsRollup',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='earnings_rollup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('lifetime_earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('today_earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('weekly_earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('invested_principal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('as_of', models.DateField(default=django.utils.timezone.localdate)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-17 06:52
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_wallet_balances(apps, schema_editor):
+    """Seed the ledger with each user's current wallet balance"""
+    UserProfile = apps.get_model('investment_app', 'UserProfile')
+    LedgerEntry = apps.get_model('investment_app', 'LedgerEntry')
+    entries = []
+    for user_id, balance in UserProfile.objects.exclude(wallet_balance=0).values_list('user_id', 'wallet_balance').iterator():
+        journal_id = uuid.uuid4()
+        entries.append(LedgerEntry(journal_id=journal_id, user_id=user_id, account='wallet', amount=balance, memo='Opening balance'))
+        entries.append(LedgerEntry(journal_id=journal_id, user_id=user_id, account='opening', amount=-balance, memo='Opening balance'))
+    LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0012_earningsrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('last_entry_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_entry_id'], name='snapshot_user_latest_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('journal_id', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('account', models.CharField(choices=[('wallet', 'User Wallet'), ('deposits', 'Deposits'), ('investments', 'Investments'), ('earnings', 'Investment Returns'), ('referrals', 'Referral Bonuses'), ('withdrawals', 'Withdrawals'), ('opening', 'Opening Balances')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('memo', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='investment_app.transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'account', 'id'], name='ledger_user_account_idx'), models.Index(fields=['journal_id'], name='ledger_journal_idx')],
+            },
+        ),
+        migrations.RunPython(open_wallet_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-17 06:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0013_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailyearning',
+            index=models.Index(fields=['date'], name='earning_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='deposit_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='deposit_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['-created_at', '-id'], name='deposit_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(fields=['user', 'status', 'end_date'], name='inv_user_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(fields=['status', 'end_date'], name='inv_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'status', 'transaction_type'], include=('amount',), name='txn_user_status_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='txn_user_created_idx'),
+        ),
+    ]
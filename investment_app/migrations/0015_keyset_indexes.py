@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 06:59
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The (-created_at, -id) keyset indexes this migration used to rebuild are
+    # now created by 0014. It is kept empty so the numbering has no gap and
+    # databases that already applied it still find it in the graph.
+
+    dependencies = [
+        ('investment_app', '0014_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = []
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-17 07:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_referral_paths(apps, schema_editor):
+    """Seed the closure table by walking each referred user's chain of referrers"""
+    Referral = apps.get_model('investment_app', 'Referral')
+    ReferralPath = apps.get_model('investment_app', 'ReferralPath')
+    referrer_of = dict(Referral.objects.values_list('referred_user_id', 'referrer_id').iterator())
+    paths = []
+    for descendant_id, ancestor_id in referrer_of.items():
+        depth, seen = 1, {descendant_id}
+        while ancestor_id is not None and ancestor_id not in seen:
+            paths.append(ReferralPath(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth))
+            seen.add(ancestor_id)
+            ancestor_id, depth = referrer_of.get(ancestor_id), depth + 1
+    ReferralPath.objects.bulk_create(paths, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0015_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralPath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='downline_paths', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upline_paths', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='refpath_ancestor_depth_idx'), models.Index(fields=['descendant', 'depth'], name='refpath_descendant_depth_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_referral_paths, migrations.RunPython.noop),
+    ]
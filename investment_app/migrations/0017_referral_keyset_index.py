@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 07:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0016_referral_paths'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['referrer', '-created_at', '-id'], name='referral_referrer_created_idx'),
+        ),
+    ]
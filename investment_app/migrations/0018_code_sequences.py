@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-17 07:22
+
+import investment_app.codes
+import uuid
+from django.db import migrations, models
+
+
+def hyphenate_existing_codes(apps, schema_editor):
+    """
+    Keep existing codes in the form they were shown in (str(uuid)), so old
+    referral links still match; SQLite stored them as bare hex.
+    """
+    for model_name, field in [('Deposit', 'reference_id'), ('UserProfile', 'referral_code')]:
+        model = apps.get_model('investment_app', model_name)
+        for pk, value in model.objects.values_list('pk', field).iterator():
+            try:
+                code = str(uuid.UUID(value))
+            except ValueError:
+                continue
+            if code != value:
+                model.objects.filter(pk=pk).update(**{field: code})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0017_referral_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='deposit',
+            name='reference_id',
+            field=models.CharField(default=investment_app.codes.deposit_reference, editable=False, max_length=40, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='referral_code',
+            field=models.CharField(default=investment_app.codes.referral_code, editable=False, max_length=40, unique=True),
+        ),
+        migrations.RunPython(hyphenate_existing_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2 on 2026-10-17 07:39
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0018_code_sequences'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiabilityEntry',
+            fields=[
+                ('investment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='liability_entry', serialize=False, to='investment_app.investment')),
+                ('rate', models.DecimalField(decimal_places=2, help_text="The plan's daily return when counted", max_digits=5)),
+                ('principal', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('daily_return', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('first_payout', models.DateField()),
+                ('maturity_date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LiabilityForecastDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('returns', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('principal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('withdrawals', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('maturing', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LiabilitySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField(unique=True)),
+                ('horizon_days', models.IntegerField()),
+                ('active_investments', models.IntegerField(default=0)),
+                ('outstanding_principal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('scheduled_returns', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Daily returns due within the horizon', max_digits=15)),
+                ('pending_withdrawals', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('pending_withdrawal_count', models.IntegerField(default=0)),
+                ('changes_through', models.DateTimeField(help_text='Investment changes up to this time are included')),
+                ('recomputed', models.IntegerField(default=0, help_text='Investments re-read to build this snapshot')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-as_of'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(fields=['updated_at'], name='inv_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='liabilityentry',
+            name='plan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='investment_app.investmentplan'),
+        ),
+        migrations.AddField(
+            model_name='liabilityforecastday',
+            name='snapshot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='days', to='investment_app.liabilitysnapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='liabilityentry',
+            index=models.Index(fields=['plan', 'rate'], name='liability_plan_rate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='liabilityentry',
+            index=models.Index(fields=['first_payout'], name='liability_first_payout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='liabilityentry',
+            index=models.Index(fields=['maturity_date'], name='liability_maturity_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='liabilityforecastday',
+            unique_together={('snapshot', 'date')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0019_liability_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='runcheckpoint',
+            name='max_id',
+            field=models.BigIntegerField(blank=True, help_text='Highest id the run covers; rows created after it started wait for the next run', null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-17 08:58
+
+import investment_app.codes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0020_runcheckpoint_max_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deposit',
+            name='reference_id',
+            field=investment_app.codes.CodeField(editable=False, generate=investment_app.codes.deposit_reference, max_length=40, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='referral_code',
+            field=investment_app.codes.CodeField(editable=False, generate=investment_app.codes.referral_code, max_length=40, unique=True),
+        ),
+    ]
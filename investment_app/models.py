@@ -5,6 +5,7 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from decimal import Decimal
 import uuid
+from . import codes
 
 
 class InvestmentPlan(models.Model):
@@ -49,33 +50,46 @@ class Investment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # dashboard: active/completed investments and upcoming maturities per user
+            models.Index(fields=['user', 'status', 'end_date'], name='inv_user_status_end_idx'),
+            # accrual runs and maturity sweeps over the whole book
+            models.Index(fields=['status', 'end_date'], name='inv_status_end_idx'),
+            # investments changed since the last liability forecast
+            models.Index(fields=['updated_at'], name='inv_updated_idx'),
+        ]
+    
+    def load_plan(self):
+        """Serve self.plan from the plan catalog instead of a query"""
+        if self.plan_id is not None and not Investment.plan.is_cached(self):
+            from .plans import get_plan
+            plan = get_plan(self.plan_id)
+            if plan is not None:
+                Investment.plan.field.set_cached_value(self, plan)
     
     def clean(self):
         """Validate investment amount against plan minimum"""
         super().clean()
+        self.load_plan()
         if self.plan and self.amount < self.plan.min_deposit:
             raise ValidationError(
                 f"Investment amount must be at least ${self.plan.min_deposit} for {self.plan.get_name_display()}"
             )
     
     def save(self, *args, **kwargs):
-        # Run validation before saving
-        self.full_clean()
+        # The plan minimum is checked by the validate_investment_amount
+        # pre_save signal; status changes go through investment_app.lifecycle
         
         # Set end_date based on plan duration if not set
+        self.load_plan()
         if not self.end_date and self.plan:
             self.end_date = self.start_date + timezone.timedelta(days=self.plan.duration_days)
         
-        # Auto-complete investments that have passed their end date
-        if (self.status == 'active' and self.end_date and 
-            timezone.now() > self.end_date):
-            self.status = 'completed'
-            self.total_return = self.calculate_total_return()
-        
         super().save(*args, **kwargs)
     
     def calculate_daily_return(self):
         """Calculate daily return based on plan's daily return percentage"""
+        self.load_plan()
         if self.plan and self.status == 'active':
             daily_return = (self.amount * self.plan.daily_return) / 100
             return daily_return.quantize(Decimal('0.01'))
@@ -83,6 +97,7 @@ class Investment(models.Model):
     
     def calculate_total_return(self):
         """Calculate total return if investment was completed"""
+        self.load_plan()
         if self.status == 'completed' and self.plan and self.start_date and self.end_date:
             total_days = (self.end_date - self.start_date).days
             daily_return = self.calculate_daily_return()
@@ -90,49 +105,77 @@ class Investment(models.Model):
             return total_return.quantize(Decimal('0.01'), rounding=ROUND_DOWN)
         return Decimal('0.00')
     
-    @property
-    def current_value(self):
-        """Calculate current investment value including earned returns"""
+    def time_fields(self, as_of=None):
+        """
+        days_elapsed, days_remaining, is_active, progress_percentage and
+        current_value as of `as_of` (default: the request's clock), computed
+        once per instance and time. Day counts annotated by
+        clock.with_time_fields() are used when present.
+        """
+        from . import clock
+        annotated = as_of is None and hasattr(self, 'days_elapsed_as_of')
+        as_of = as_of or clock.now()
+        cached = self.__dict__.get('_time_fields')
+        if cached and cached[0] == (as_of, self.status):
+            return cached[1]
+
+        if annotated:
+            days_elapsed = self.days_elapsed_as_of or 0
+            days_remaining = self.days_remaining_as_of or 0
+        else:
+            days_elapsed = max(0, (as_of - self.start_date).days) if self.start_date else 0
+            days_remaining = max(0, (self.end_date - as_of).days) if self.end_date else 0
+        if self.status != 'active':
+            days_remaining = 0
+
+        self.load_plan()
+        if self.plan and self.plan.duration_days > 0 and self.status == 'active':
+            progress = min(100, (days_elapsed / self.plan.duration_days) * 100)
+        else:
+            progress = 100 if self.status == 'completed' else 0
+
         if self.status == 'active':
-            days_elapsed = self.days_elapsed
-            daily_return = self.calculate_daily_return()
-            earned_returns = daily_return * days_elapsed
-            return (self.amount + earned_returns).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+            earned_returns = self.calculate_daily_return() * days_elapsed
+            current_value = (self.amount + earned_returns).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
         elif self.status == 'completed':
-            return (self.amount + self.total_return).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
-        return self.amount  # For pending or cancelled investments
+            current_value = (self.amount + self.total_return).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+        else:
+            current_value = self.amount  # For pending or cancelled investments
+
+        fields = {
+            'days_elapsed': days_elapsed,
+            'days_remaining': days_remaining,
+            'is_active': self.status == 'active' and days_remaining > 0,
+            'progress_percentage': progress,
+            'current_value': current_value,
+        }
+        self._time_fields = ((as_of, self.status), fields)
+        return fields
+    
+    @property
+    def current_value(self):
+        """Current investment value including earned returns"""
+        return self.time_fields()['current_value']
     
     @property
     def days_remaining(self):
-        """Calculate days remaining until investment completion"""
-        if self.end_date and self.status == 'active':
-            today = timezone.now()
-            remaining = (self.end_date - today).days
-            return max(0, remaining)
-        return 0
+        """Days remaining until investment completion"""
+        return self.time_fields()['days_remaining']
     
     @property
     def days_elapsed(self):
-        """Calculate days since investment started"""
-        if self.start_date:
-            today = timezone.now()
-            elapsed = (today - self.start_date).days
-            return max(0, elapsed)
-        return 0
+        """Days since investment started"""
+        return self.time_fields()['days_elapsed']
     
     @property
     def is_active(self):
         """Check if investment is currently active"""
-        return self.status == 'active' and self.days_remaining > 0
+        return self.time_fields()['is_active']
     
     @property
     def progress_percentage(self):
-        """Calculate investment progress percentage"""
-        if self.plan and self.plan.duration_days > 0 and self.status == 'active':
-            elapsed = self.days_elapsed
-            total = self.plan.duration_days
-            return min(100, (elapsed / total) * 100)
-        return 100 if self.status == 'completed' else 0
+        """Investment progress percentage"""
+        return self.time_fields()['progress_percentage']
     
     def calculate_referral_bonus(self, referral_percentage=5):
         """
@@ -145,48 +188,45 @@ class Investment(models.Model):
     def award_referral_bonus(self, referrer, referral_percentage=5):
         """Award referral bonus to the referrer"""
         from .models import UserProfile  # Import here to avoid circular imports
+        from . import wallet
         
         if referrer and referrer != self.user:
             bonus_amount = self.calculate_referral_bonus(referral_percentage)
             
             # Update referrer's profile
-            try:
-                referrer_profile = UserProfile.objects.get(user=referrer)
-                referrer_profile.total_referral_bonus += bonus_amount
-                referrer_profile.wallet_balance += bonus_amount
-                referrer_profile.save()
+            if UserProfile.objects.filter(user=referrer).exists():
+                wallet.credit(referrer, bonus_amount, 'referrals',
+                              memo=f'Referral bonus for investment #{self.pk}',
+                              counters=['total_referral_bonus'])
                 
                 # Update investment record
                 self.referral_bonus_earned = bonus_amount
                 self.save()
                 
                 return bonus_amount
-            except UserProfile.DoesNotExist:
-                pass
         
         return Decimal('0.00')
     
     def confirm_investment(self):
         """Confirm the investment and update status"""
-        if not self.is_confirmed:
-            self.is_confirmed = True
-            self.status = 'active'
-            self.save()
+        from . import lifecycle
+        if not self.is_confirmed and self.status in ['pending', 'active']:
+            lifecycle.confirm(self)
     
     def complete_investment(self):
         """Mark investment as completed and calculate final returns"""
+        from . import lifecycle
         if self.status == 'active':
-            self.status = 'completed'
-            self.total_return = self.calculate_total_return()
-            self.save()
+            lifecycle.complete(self)
     
     def cancel_investment(self):
         """Cancel the investment"""
+        from . import lifecycle
         if self.status in ['pending', 'active']:
-            self.status = 'cancelled'
-            self.save()
+            lifecycle.cancel(self)
     
     def __str__(self):
+        self.load_plan()
         return f"{self.user.username} - {self.plan.get_name_display()} - ${self.amount}"
     
 
@@ -213,6 +253,17 @@ class Transaction(models.Model):
     investment = models.ForeignKey(Investment, on_delete=models.CASCADE, null=True, blank=True)
     reference_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     
+    class Meta:
+        indexes = [
+            # dashboard pending list and earnings totals; amount is included so
+            # SUM(amount) can be answered from the index on PostgreSQL
+            models.Index(fields=['user', 'status', 'transaction_type'], include=['amount'],
+                         name='txn_user_status_type_idx'),
+            # transaction history and recent activity, newest first; id breaks
+            # ties for keyset pagination
+            models.Index(fields=['user', '-created_at', '-id'], name='txn_user_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - {self.amount}"
 
@@ -221,13 +272,39 @@ class Referral(models.Model):
     referred_user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='referred_by')
     created_at = models.DateTimeField(default=timezone.now)
     bonus_paid = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['referrer', '-created_at', '-id'], name='referral_referrer_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.referrer.username} referred {self.referred_user.username}"
 
+
+class ReferralPath(models.Model):
+    """
+    Closure of the referral graph: one row for every (ancestor, descendant)
+    pair joined by a chain of referrals, `depth` links apart (1 for a
+    direct referral). Maintained by investment_app.referral_graph.
+    """
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='downline_paths')
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upline_paths')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='refpath_ancestor_depth_idx'),
+            models.Index(fields=['descendant', 'depth'], name='refpath_descendant_depth_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    referral_code = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    referral_code = codes.CodeField(max_length=40, generate=codes.referral_code, editable=False, unique=True)
     total_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
     today_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
     weekly_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
@@ -243,16 +320,8 @@ class UserProfile(models.Model):
         super().save(*args, **kwargs)
     
     def generate_referral_code(self):
-        return f"REF{self.user.id:06d}{UserProfile.objects.count() + 1:04d}"
-
-    User.add_to_class('referrals', 
-        models.ManyToManyField('self', 
-            symmetrical=False, 
-            related_name='referrers',
-            blank=True
-        )
-    )
-    
+        return codes.referral_code()
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
@@ -277,11 +346,14 @@ class CryptoWallet(models.Model):
 class DailyEarning(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate)
     investment = models.ForeignKey('Investment', on_delete=models.CASCADE, null=True, blank=True)
     
     class Meta:
-        unique_together = ['user', 'date']
+        unique_together = ['user', 'date']  # also serves the per-user date range lookups
+        indexes = [
+            models.Index(fields=['date'], name='earning_date_idx'),
+        ]
 
 class Deposit(models.Model):
     STATUS_CHOICES = (
@@ -302,7 +374,7 @@ class Deposit(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     confirmed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='confirmed_deposits')
     confirmed_at = models.DateTimeField(null=True, blank=True)
-    reference_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    reference_id = codes.CodeField(max_length=40, generate=codes.deposit_reference, editable=False, unique=True)
     screenshot = models.ImageField(upload_to='deposit_screenshots/', blank=True, null=True)
     
     def save(self, *args, **kwargs):
@@ -311,11 +383,180 @@ class Deposit(models.Model):
         super().save(*args, **kwargs)
     
     def generate_reference_id(self):
-        return f"DEP{self.created_at.strftime('%Y%m%d')}{Deposit.objects.count() + 1:04d}"
+        return codes.deposit_reference()
 
     
     def __str__(self):
         return f"{self.user.username} - {self.amount} - {self.get_status_display()}"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # deposit history, newest first; id breaks ties for keyset pagination
+            models.Index(fields=['user', '-created_at', '-id'], name='deposit_user_created_idx'),
+            # admin deposit queue filtered by status, and unfiltered
+            models.Index(fields=['status', '-created_at', '-id'], name='deposit_status_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='deposit_created_idx'),
+        ]
+
+
+class RunCheckpoint(models.Model):
+    """Progress of a chunked batch job (e.g. a daily accrual run) for one date"""
+    job = models.CharField(max_length=50)
+    run_date = models.DateField()
+    shard = models.IntegerField(default=0, help_text="0 for the whole run, 1..N for a shard of a fanned-out run")
+    last_processed_id = models.BigIntegerField(default=0)
+    max_id = models.BigIntegerField(null=True, blank=True,
+                                 help_text="Highest id the run covers; rows created after it started wait for the next run")
+    processed_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['job', 'run_date', 'shard']
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
+
+    def __str__(self):
+        shard = f" shard {self.shard}" if self.shard else ""
+        return f"{self.job} {self.run_date}{shard} (last id {self.last_processed_id})"
+
+
+class EarningsRollup(models.Model):
+    """Per-user dashboard totals, maintained incrementally by the write paths"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='earnings_rollup')
+    lifetime_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    today_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    weekly_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    invested_principal = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    as_of = models.DateField(default=timezone.localdate)  # day today/weekly were computed for
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s earnings rollup"
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of an append-only double-entry journal. Every posting writes a
+    'wallet' leg for the user and an opposite leg on a system account, so
+    the legs of a journal always sum to zero. Rows are never updated.
+    """
+    ACCOUNT_CHOICES = (
+        ('wallet', 'User Wallet'),
+        ('deposits', 'Deposits'),
+        ('investments', 'Investments'),
+        ('earnings', 'Investment Returns'),
+        ('referrals', 'Referral Bonuses'),
+        ('withdrawals', 'Withdrawals'),
+        ('opening', 'Opening Balances'),
+    )
+
+    journal_id = models.UUIDField(default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries')
+    account = models.CharField(max_length=20, choices=ACCOUNT_CHOICES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)  # signed
+    memo = models.CharField(max_length=255, blank=True)
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'account', 'id'], name='ledger_user_account_idx'),
+            models.Index(fields=['journal_id'], name='ledger_journal_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.account} {self.amount}"
+
+
+class BalanceSnapshot(models.Model):
+    """Wallet balance of a user up to and including ledger entry `last_entry_id`"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_snapshots')
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    last_entry_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-last_entry_id'], name='snapshot_user_latest_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.balance} at entry #{self.last_entry_id}"
+
+
+class CodeSequence(models.Model):
+    """Counter behind one kind of reference code; see investment_app.codes"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} (next {self.next_value})"
+
+
+class LiabilityEntry(models.Model):
+    """What one active investment adds to the liability forecast, as last counted; see investment_app.forecast"""
+    investment = models.OneToOneField(Investment, on_delete=models.CASCADE, primary_key=True, related_name='liability_entry')
+    plan = models.ForeignKey(InvestmentPlan, on_delete=models.CASCADE, related_name='+')
+    rate = models.DecimalField(max_digits=5, decimal_places=2, help_text="The plan's daily return when counted")
+    principal = models.DecimalField(max_digits=15, decimal_places=2)
+    daily_return = models.DecimalField(max_digits=15, decimal_places=2)
+    first_payout = models.DateField()
+    maturity_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            # entries counted at a plan rate that has since changed
+            models.Index(fields=['plan', 'rate'], name='liability_plan_rate_idx'),
+            # returns starting and principal maturing within the horizon
+            models.Index(fields=['first_payout'], name='liability_first_payout_idx'),
+            models.Index(fields=['maturity_date'], name='liability_maturity_idx'),
+        ]
+
+    def __str__(self):
+        return f"Investment #{self.investment_id}: ${self.principal} due {self.maturity_date}"
+
+
+class LiabilitySnapshot(models.Model):
+    """Book-wide liability and cash-flow forecast computed on `as_of`; see investment_app.forecast"""
+    as_of = models.DateField(unique=True)
+    horizon_days = models.IntegerField()
+    active_investments = models.IntegerField(default=0)
+    outstanding_principal = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    scheduled_returns = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'),
+                                            help_text="Daily returns due within the horizon")
+    pending_withdrawals = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    pending_withdrawal_count = models.IntegerField(default=0)
+    changes_through = models.DateTimeField(help_text="Investment changes up to this time are included")
+    recomputed = models.IntegerField(default=0, help_text="Investments re-read to build this snapshot")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-as_of']
+
+    def __str__(self):
+        return f"Liability forecast {self.as_of} ({self.horizon_days} days)"
+
+
+class LiabilityForecastDay(models.Model):
+    """Cash due on one date of a LiabilitySnapshot"""
+    snapshot = models.ForeignKey(LiabilitySnapshot, on_delete=models.CASCADE, related_name='days')
+    date = models.DateField()
+    returns = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    principal = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    withdrawals = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    maturing = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['snapshot', 'date']
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date}: ${self.total}"
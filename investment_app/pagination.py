@@ -0,0 +1,144 @@
+"""
+Keyset pagination for history lists.
+
+Django's Paginator counts the whole queryset and then skips `OFFSET n`
+rows, so deep pages get slower as history grows. KeysetPaginator orders on
+(created_at, id) and asks for the rows after (or before) the last row the
+user saw, which an index on those columns answers in the same time on any
+page. Cursors are opaque strings passed back as ?after= / ?before=.
+
+    page = paginate(request, Transaction.objects.filter(user=user), 10)
+
+Old ?page=N links are still served by Django's Paginator; their pages
+carry a `window` of page numbers to link to instead of the full range.
+Both kinds render with the investment_app/pagination.html include.
+"""
+import base64
+import json
+from datetime import datetime
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+COUNT_CAP = 1000
+# Page links shown either side of the current page for numbered pages
+WINDOW_SIZE = 2
+
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) for a cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of rows; iterates like a Paginator page"""
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            first = self.object_list[0]
+            return encode_cursor(first.created_at, first.pk)
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            last = self.object_list[-1]
+            return encode_cursor(last.created_at, last.pk)
+
+
+class KeysetPaginator:
+    """Newest-first pages of `queryset` keyed on (created_at, id)"""
+
+    def __init__(self, queryset, per_page, count_cap=COUNT_CAP):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_cap = count_cap
+
+    def page(self, after=None, before=None):
+        """The page after cursor `after`, before cursor `before`, or the first page"""
+        if before and (key := decode_cursor(before)):
+            created_at, pk = key
+            rows = list(self.queryset.filter(
+                Q(created_at__gte=created_at),
+                Q(created_at__gt=created_at) | Q(id__gt=pk),
+            ).order_by('created_at', 'id')[:self.per_page + 1])
+            if len(rows) > self.per_page:
+                return KeysetPage(rows[:self.per_page][::-1], self, True, True)
+            # Reached the newest rows; show a full first page instead of a short one
+            return self.page()
+
+        queryset = self.queryset.order_by('-created_at', '-id')
+        if after and (key := decode_cursor(after)):
+            created_at, pk = key
+            queryset = queryset.filter(
+                Q(created_at__lte=created_at),
+                Q(created_at__lt=created_at) | Q(id__lt=pk),
+            )
+            has_previous = True
+        else:
+            has_previous = False
+        rows = list(queryset[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], self, has_previous, len(rows) > self.per_page)
+
+    @cached_property
+    def approximate_count(self):
+        """
+        Roughly how many rows there are. PostgreSQL reports the planner's
+        estimate; elsewhere rows are counted up to `count_cap`.
+        """
+        queryset = self.queryset.order_by()
+        if connection.vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows'])
+        return queryset[:self.count_cap].count()
+
+    @property
+    def count_is_capped(self):
+        return connection.vendor != 'postgresql' and self.approximate_count >= self.count_cap
+
+
+def paginate(request, queryset, per_page):
+    """A keyset page for the request's cursor, or a numbered page for ?page=N"""
+    if 'page' in request.GET:
+        page = Paginator(queryset.order_by('-created_at', '-id'), per_page).get_page(request.GET['page'])
+        page.window = list(page.paginator.get_elided_page_range(
+            page.number, on_each_side=WINDOW_SIZE, on_ends=1))
+        return page
+    return KeysetPaginator(queryset, per_page).page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
@@ -0,0 +1,81 @@
+"""
+Process-local catalog of investment plans.
+
+The plan table holds a handful of rows that rarely change, yet nearly
+every page and every Investment method needs them. The catalog is loaded
+once per process and reused until the plans change: saving or deleting
+an InvestmentPlan bumps a version stamp in the shared cache, and each
+process reloads when it sees a version it hasn't loaded. A lookup costs
+one cache read and no queries.
+
+Plans changed with QuerySet.update() don't fire signals; call
+invalidate() afterwards.
+"""
+import uuid
+from bisect import bisect_right
+from django.core.cache import cache
+from django.db import transaction
+from .models import InvestmentPlan
+
+VERSION_KEY = 'investment_plans:version'
+CATALOG_KEY = 'investment_plans:{version}'
+
+_loaded = {'version': None, 'catalog': None}
+
+
+class PlanCatalog:
+    """
+    Plans ordered by minimum deposit. The instances are shared between
+    requests, so treat them as read-only.
+    """
+
+    def __init__(self, plans):
+        self.plans = sorted(plans, key=lambda plan: (plan.min_deposit, plan.pk))
+        self.by_id = {plan.pk: plan for plan in self.plans}
+        self.minimums = [plan.min_deposit for plan in self.plans]
+
+    def all(self):
+        return list(self.plans)
+
+    def active(self):
+        return [plan for plan in self.plans if plan.is_active]
+
+    def get(self, plan_id):
+        """The plan with id `plan_id`, or None"""
+        try:
+            return self.by_id.get(int(plan_id))
+        except (TypeError, ValueError):
+            return None
+
+    def pick(self, amount):
+        """The plan with the highest minimum deposit `amount` qualifies for"""
+        index = bisect_right(self.minimums, amount)
+        return self.plans[index - 1] if index else None
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_catalog():
+    version = _version()
+    if _loaded['version'] != version or _loaded['catalog'] is None:
+        plans = cache.get(CATALOG_KEY.format(version=version))
+        if plans is None:
+            plans = list(InvestmentPlan.objects.all())
+            cache.set(CATALOG_KEY.format(version=version), plans, timeout=None)
+        _loaded.update(version=version, catalog=PlanCatalog(plans))
+    return _loaded['catalog']
+
+
+def get_plan(plan_id):
+    return get_catalog().get(plan_id)
+
+
+def invalidate():
+    """Make every process reload the catalog once the current transaction commits"""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None))
@@ -0,0 +1,144 @@
+"""
+Multi-level referral graph.
+
+Referral rows are single referrer -> referred edges. ReferralPath stores
+their closure, one row for every user above another with the number of
+links in between, so whole downlines and uplines are read with one
+indexed query instead of one query per level:
+
+    downline(user, max_depth=3)     # users up to three levels below
+    upline(user)                    # referrers above, nearest first
+    downline_levels(user)           # members and volume per level
+
+Paths are added when a Referral is saved and removed when one is
+deleted (see signals). Referrals written with bulk_create() or update()
+bypass that; run `manage.py rebuild_referral_paths` afterwards.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Investment, Referral, ReferralPath
+
+BATCH_SIZE = 2000
+INVESTED_STATUSES = ['active', 'completed']
+
+
+def _upline(user_id):
+    """[(ancestor id, depth)] for `user_id`, itself included at depth 0"""
+    return [(user_id, 0), *ReferralPath.objects.filter(descendant_id=user_id).values_list('ancestor_id', 'depth')]
+
+
+def _downline(user_id):
+    """[(descendant id, depth)] for `user_id`, itself included at depth 0"""
+    return [(user_id, 0), *ReferralPath.objects.filter(ancestor_id=user_id).values_list('descendant_id', 'depth')]
+
+
+def link(referrer_id, referred_id):
+    """
+    Add the paths created by the edge referrer -> referred: every user
+    above the referrer gains the referred user and everyone below them.
+    For a newly registered user that is one row per upline level.
+    Returns the number of paths added.
+    """
+    with db_transaction.atomic():
+        upline = _upline(referrer_id)
+        subtree = _downline(referred_id)
+        if referred_id in {ancestor_id for ancestor_id, _ in upline}:
+            raise ValueError(f'User {referred_id} is already above user {referrer_id}; the edge would close a cycle')
+        ReferralPath.objects.bulk_create([
+            ReferralPath(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + 1 + down)
+            for ancestor_id, up in upline
+            for descendant_id, down in subtree
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(upline) * len(subtree)
+
+
+def unlink(referrer_id, referred_id):
+    """Remove the paths that ran through the edge referrer -> referred"""
+    upline = [ancestor_id for ancestor_id, _ in _upline(referrer_id)]
+    subtree = [descendant_id for descendant_id, _ in _downline(referred_id)]
+    return ReferralPath.objects.filter(ancestor_id__in=upline, descendant_id__in=subtree).delete()[0]
+
+
+def relink(referrer_id, referred_id):
+    """
+    Re-attach the referred user's subtree under `referrer_id`, dropping the
+    paths from its previous upline (for a Referral whose referrer changed).
+    """
+    with db_transaction.atomic():
+        subtree = [descendant_id for descendant_id, _ in _downline(referred_id)]
+        ReferralPath.objects.filter(descendant_id__in=subtree).exclude(ancestor_id__in=subtree).delete()
+        return link(referrer_id, referred_id)
+
+
+def rebuild():
+    """
+    Recompute the whole closure from the Referral table, one level at a
+    time: level 1 is the referrals themselves and level n + 1 extends each
+    level n path by one referral. Returns the number of paths written.
+    """
+    with db_transaction.atomic():
+        ReferralPath.objects.all().delete()
+        level = Referral.objects.values_list('referrer_id', 'referred_user_id')
+        # A chain can't be longer than there are referrals; stop rather than loop on a cycle
+        max_depth = Referral.objects.count()
+        depth, written = 1, 0
+        while True:
+            paths = [
+                ReferralPath(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+                for ancestor_id, descendant_id in level.iterator(chunk_size=BATCH_SIZE)
+            ]
+            if not paths:
+                return written
+            ReferralPath.objects.bulk_create(paths, batch_size=BATCH_SIZE)
+            written += len(paths)
+            if depth > max_depth:
+                raise ValueError('The referral graph contains a cycle')
+            level = ReferralPath.objects.filter(
+                depth=depth, descendant__referrals_made__isnull=False,
+            ).values_list('ancestor_id', 'descendant__referrals_made__referred_user_id')
+            depth += 1
+
+
+def _within(prefix, max_depth):
+    return Q(**{f'{prefix}depth__lte': max_depth}) if max_depth else Q()
+
+
+def downline(user, max_depth=None):
+    """Users below `user`, at most `max_depth` levels down, annotated with their `depth`"""
+    return User.objects.filter(
+        Q(upline_paths__ancestor=user) & _within('upline_paths__', max_depth)
+    ).annotate(depth=F('upline_paths__depth'))
+
+
+def upline(user):
+    """Users above `user`, nearest referrer first, annotated with their `depth`"""
+    return User.objects.filter(downline_paths__descendant=user).annotate(
+        depth=F('downline_paths__depth')
+    ).order_by('depth')
+
+
+def downline_volume(user, max_depth=None):
+    """Total amount the users below `user` have invested"""
+    return Investment.objects.filter(
+        Q(user__upline_paths__ancestor=user) & _within('user__upline_paths__', max_depth),
+        status__in=INVESTED_STATUSES,
+    ).aggregate(total=Coalesce(Sum('amount'), Value(0), output_field=DecimalField()))['total']
+
+
+def downline_levels(user, max_depth=None):
+    """[{'depth', 'members', 'invested'}] for each level below `user`, in one grouped query"""
+    return list(
+        ReferralPath.objects.filter(Q(ancestor=user) & _within('', max_depth))
+        .values('depth')
+        .annotate(
+            members=Count('descendant', distinct=True),
+            invested=Coalesce(
+                Sum('descendant__investment__amount',
+                    filter=Q(descendant__investment__status__in=INVESTED_STATUSES)),
+                Value(0), output_field=DecimalField(),
+            ),
+        )
+        .order_by('depth')
+    )
@@ -0,0 +1,227 @@
+"""
+Incremental referral bonus processing.
+
+A referral becomes eligible BONUS_DELAY after it was made; the referrer is
+then paid BONUS_RATE of what the referred user has invested. Each run
+reads the newly eligible referrals with their investment totals in one
+annotated query, credits every referrer once for the whole batch and
+records a high-water mark in a RunCheckpoint: the highest referral id
+every eligible referral up to which has been settled, so the next run
+starts there instead of rescanning every referral. Referrals settled at
+zero (the referred user hadn't invested) stay unpaid behind the mark and
+are only read again once the referred user's investments change.
+
+referral_rows() and referral_summary() back the referrals page.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, ROUND_DOWN
+from django.db import transaction as db_transaction
+from django.db.models import Count, DecimalField, F, Max, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Investment, Referral, RunCheckpoint, Transaction
+from .referral_graph import INVESTED_STATUSES
+from .rollups import add_lifetime_earnings
+from . import wallet
+
+JOB_NAME = 'process_referral_bonuses'
+BONUS_RATE = Decimal('0.02')
+BONUS_DELAY = timedelta(days=90)
+BATCH_SIZE = 1000
+
+
+def bonus_amount(total_deposits):
+    return (total_deposits * BONUS_RATE).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+
+
+def high_water_mark():
+    """Id of the last referral settled by a previous run (0 before the first run)"""
+    return RunCheckpoint.objects.filter(job=JOB_NAME).aggregate(
+        mark=Coalesce(Max('last_processed_id'), 0)
+    )['mark']
+
+
+def last_run():
+    """When the previous completed run started (None before the first)"""
+    return RunCheckpoint.objects.filter(job=JOB_NAME).aggregate(since=Max('completed_at'))['since']
+
+
+def with_total_deposits(referrals):
+    """(id, referrer_id, total invested) for `referrals`, ordered by id"""
+    return referrals.annotate(
+        total_deposits=Coalesce(
+            Sum('referred_user__investment__amount'),
+            Value(Decimal('0.00')), output_field=DecimalField(max_digits=15, decimal_places=2),
+        )
+    ).order_by('pk').values_list('pk', 'referrer_id', 'total_deposits')
+
+
+def eligible_referrals(mark, now):
+    """
+    (rows, stop) for the referrals after `mark`. `rows` are the unpaid ones
+    old enough for a bonus, as (id, referrer_id, total invested) ordered by
+    id; `stop` is the highest id the mark may advance to, just before the
+    first referral that isn't eligible yet, so a later run still sees it.
+    """
+    cutoff = now - BONUS_DELAY
+    referrals = Referral.objects.filter(pk__gt=mark)
+    bounds = referrals.aggregate(
+        first_pending=Min('pk', filter=Q(created_at__gt=cutoff)), last=Max('pk'),
+    )
+    if bounds['first_pending'] is not None:
+        stop = bounds['first_pending'] - 1
+        referrals = referrals.filter(pk__lte=stop)
+    else:
+        stop = bounds['last'] or mark
+    return with_total_deposits(referrals.filter(bonus_paid=False)), stop
+
+
+def awaiting_investment(mark, since):
+    """
+    Unpaid referrals the mark has already passed whose referred user has
+    an investment created or changed after `since`, as (id, referrer_id,
+    total invested) ordered by id. Reading them from the recent
+    investments (inv_updated_idx) leaves the rest of the backlog alone.
+    """
+    invested = Investment.objects.all() if since is None else Investment.objects.filter(updated_at__gt=since)
+    return with_total_deposits(Referral.objects.filter(
+        pk__lte=mark, bonus_paid=False, referred_user__in=invested.values('user_id'),
+    ))
+
+
+def process_referral_bonuses(now=None, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Pay the bonuses for every newly eligible referral, a batch at a time.
+    Each batch marks its referrals paid, writes one 'referral' Transaction,
+    one wallet credit and one lifetime earnings update per referrer and
+    advances the high-water mark in a single transaction. With `dry_run`
+    nothing is written.
+
+    Returns {'referrals': n, 'paid': n, 'referrers': n, 'total': Decimal}.
+    Referrals whose referred user hasn't invested yet are passed over at
+    zero and stay unpaid while the mark moves on; a later run pays them
+    once they invest (see awaiting_investment).
+    """
+    now = now or timezone.now()
+    stats = {'referrals': 0, 'paid': 0, 'total': Decimal('0.00')}
+    referrers = set()
+    cursor = high_water_mark()
+    since = last_run()
+    if not dry_run:
+        checkpoint, _ = RunCheckpoint.objects.get_or_create(
+            job=JOB_NAME, run_date=now.date(), shard=0, defaults={'last_processed_id': cursor}
+        )
+
+    def settle(rows, mark):
+        """Pay the bonuses in `rows` and advance the high-water mark to `mark`"""
+        bonuses = {}  # referral id -> (referrer id, bonus)
+        for referral_id, referrer_id, total_deposits in rows:
+            amount = bonus_amount(total_deposits)
+            if amount > 0:
+                bonuses[referral_id] = (referrer_id, amount)
+
+        if not dry_run and (bonuses or mark > cursor):
+            with db_transaction.atomic():
+                # Lock the checkpoint so a concurrent run can't pay the same batch
+                locked = RunCheckpoint.objects.select_for_update().get(pk=checkpoint.pk)
+                unpaid = Referral.objects.filter(pk__in=list(bonuses), bonus_paid=False)
+                paid = list(unpaid.values_list('pk', flat=True))
+                credits = defaultdict(Decimal)
+                for referral_id in paid:
+                    referrer_id, amount = bonuses[referral_id]
+                    credits[referrer_id] += amount
+                if paid:
+                    Referral.objects.filter(pk__in=paid).update(bonus_paid=True)
+                    Transaction.objects.bulk_create([
+                        Transaction(user_id=referrer_id, transaction_type='referral',
+                                    amount=amount, status='completed')
+                        for referrer_id, amount in credits.items()
+                    ])
+                    wallet.credit_many(credits, 'referrals', memo='Referral bonuses',
+                                       counters=['total_referral_bonus'])
+                    add_lifetime_earnings(credits)
+                locked.last_processed_id = max(locked.last_processed_id, mark)
+                locked.processed_count += len(paid)
+                locked.total_amount += sum(credits.values(), Decimal('0.00'))
+                locked.save()
+        else:
+            paid = list(bonuses)
+            credits = defaultdict(Decimal)
+            for referrer_id, amount in bonuses.values():
+                credits[referrer_id] += amount
+
+        stats['referrals'] += len(rows)
+        stats['paid'] += len(paid)
+        stats['total'] += sum(credits.values(), Decimal('0.00'))
+        referrers.update(credits)
+
+    # Referrals passed over at zero by earlier runs whose referred user has invested since
+    waiting = awaiting_investment(cursor, since)
+    after = 0
+    while True:
+        rows = list(waiting.filter(pk__gt=after)[:batch_size])
+        if not rows:
+            break
+        settle(rows, cursor)
+        after = rows[-1][0]
+
+    while True:
+        rows, stop = eligible_referrals(cursor, now)
+        rows = list(rows[:batch_size])
+        end = rows[-1][0] if len(rows) == batch_size else stop
+        settle(rows, end)
+        if len(rows) < batch_size:
+            break
+        cursor = end
+
+    if not dry_run:
+        RunCheckpoint.objects.filter(pk=checkpoint.pk).update(completed_at=now, updated_at=now)
+    return {**stats, 'referrers': len(referrers)}
+
+
+def referral_rows(referrer):
+    """
+    The referrals made by `referrer` with the referred user's username,
+    signup date, active flag and total invested annotated onto each row,
+    so a page of them renders from a single query.
+    """
+    invested = Investment.objects.filter(
+        user=OuterRef('referred_user_id'), status__in=INVESTED_STATUSES,
+    ).order_by().values('user').annotate(total=Sum('amount')).values('total')
+    return Referral.objects.filter(referrer=referrer).annotate(
+        username=F('referred_user__username'),
+        signup_date=F('referred_user__date_joined'),
+        user_is_active=F('referred_user__is_active'),
+        total_invested=Coalesce(
+            Subquery(invested), Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        ),
+    )
+
+
+def referral_summary(referrer, profile):
+    """Figures for the referrals page's summary card"""
+    counts = Referral.objects.filter(referrer=referrer).aggregate(
+        referrals=Count('id'),
+        paid=Count('id', filter=Q(bonus_paid=True)),
+        oldest_unpaid=Min('created_at', filter=Q(bonus_paid=False)),
+    )
+    volume = Investment.objects.filter(
+        user__referred_by__referrer=referrer, status__in=INVESTED_STATUSES,
+    ).aggregate(
+        invested=Coalesce(Sum('amount'), Value(Decimal('0.00')),
+                          output_field=DecimalField(max_digits=15, decimal_places=2)),
+        active=Count('user', distinct=True, filter=Q(status='active')),
+    )
+    next_payout = None
+    if counts['oldest_unpaid']:
+        next_payout = max(counts['oldest_unpaid'] + BONUS_DELAY, timezone.now())
+    return {
+        'referrals': counts['referrals'],
+        'active_referrals': volume['active'],
+        'bonuses_paid': counts['paid'],
+        'total_invested': volume['invested'],
+        'total_referral_bonus': profile.total_referral_bonus,
+        'next_payout': next_payout,
+    }
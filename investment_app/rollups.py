@@ -0,0 +1,165 @@
+"""
+Per-user earnings rollups.
+
+EarningsRollup holds the figures the dashboard shows so a page load reads
+one row instead of summing the user's whole Transaction history:
+
+- lifetime_earnings: completed 'return' and 'referral' transactions
+- today_earnings / weekly_earnings: DailyEarning for the day and the
+  trailing week, as of `as_of`
+- invested_principal: amount held in active investments
+
+Rows are built from the source tables the first time a user is touched
+and adjusted by the accrual, referral and investment write paths after
+that. `rebuild_earnings_rollups` recomputes them from scratch.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Q, Sum
+from django.utils import timezone
+from .models import DailyEarning, EarningsRollup, Investment, Transaction
+from .utils import bulk_increment
+
+EARNING_TRANSACTION_TYPES = ['return', 'referral']
+WEEKLY_WINDOW_DAYS = 7
+
+ZERO = Decimal('0.00')
+
+
+def _lifetime_earnings(user_ids):
+    return dict(
+        Transaction.objects.filter(
+            user_id__in=user_ids,
+            status='completed',
+            transaction_type__in=EARNING_TRANSACTION_TYPES,
+        ).values('user_id').annotate(total=Sum('amount')).values_list('user_id', 'total')
+    )
+
+
+def _invested_principal(user_ids):
+    return dict(
+        Investment.objects.filter(user_id__in=user_ids, status='active')
+        .values('user_id').annotate(total=Sum('amount')).values_list('user_id', 'total')
+    )
+
+
+def _earning_windows(user_ids, day):
+    """{user_id: (today, trailing week)} from DailyEarning"""
+    rows = DailyEarning.objects.filter(
+        user_id__in=user_ids, date__gte=day - timedelta(days=WEEKLY_WINDOW_DAYS)
+    ).values('user_id').annotate(
+        today=Sum('amount', filter=Q(date=day)),
+        weekly=Sum('amount'),
+    ).values_list('user_id', 'today', 'weekly')
+    return {user_id: (today or ZERO, weekly or ZERO) for user_id, today, weekly in rows}
+
+
+def compute_rollups(user_ids, day=None):
+    """Build unsaved EarningsRollup rows for `user_ids` from the source tables"""
+    day = day or timezone.localdate()
+    lifetime = _lifetime_earnings(user_ids)
+    principal = _invested_principal(user_ids)
+    windows = _earning_windows(user_ids, day)
+    return [
+        EarningsRollup(
+            user_id=user_id,
+            lifetime_earnings=lifetime.get(user_id) or ZERO,
+            today_earnings=windows.get(user_id, (ZERO, ZERO))[0],
+            weekly_earnings=windows.get(user_id, (ZERO, ZERO))[1],
+            invested_principal=principal.get(user_id) or ZERO,
+            as_of=day,
+        )
+        for user_id in user_ids
+    ]
+
+
+def ensure_rollups(user_ids, day=None):
+    """
+    Create missing rollups from the source tables. Returns the ids that were
+    just built; they already include every write made so far.
+    """
+    user_ids = set(user_ids)
+    existing = set(
+        EarningsRollup.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+    )
+    missing = user_ids - existing
+    if missing:
+        EarningsRollup.objects.bulk_create(compute_rollups(list(missing), day), ignore_conflicts=True)
+    return missing
+
+
+def add_lifetime_earnings(amounts):
+    """Add {user_id: amount} of newly completed earnings"""
+    built = ensure_rollups(amounts)
+    bulk_increment(
+        EarningsRollup.objects.all(), 'user_id',
+        {user_id: amount for user_id, amount in amounts.items() if user_id not in built},
+        ['lifetime_earnings'],
+    )
+
+
+def refresh_lifetime_earnings(user_ids):
+    """Recompute lifetime earnings, for writes that change an existing transaction"""
+    ensure_rollups(user_ids)
+    lifetime = _lifetime_earnings(user_ids)
+    EarningsRollup.objects.bulk_update(
+        [EarningsRollup(user_id=user_id, lifetime_earnings=lifetime.get(user_id) or ZERO) for user_id in user_ids],
+        ['lifetime_earnings'],
+    )
+
+
+def refresh_earning_windows(user_ids, day):
+    """Recompute today/weekly earnings after DailyEarning rows for `day` change"""
+    ensure_rollups(user_ids, day)
+    windows = _earning_windows(user_ids, day)
+    EarningsRollup.objects.bulk_update(
+        [
+            EarningsRollup(
+                user_id=user_id,
+                today_earnings=windows.get(user_id, (ZERO, ZERO))[0],
+                weekly_earnings=windows.get(user_id, (ZERO, ZERO))[1],
+                as_of=day,
+            )
+            for user_id in user_ids
+        ],
+        ['today_earnings', 'weekly_earnings', 'as_of'],
+    )
+
+
+def add_invested_principal(amounts):
+    """Add {user_id: amount} to principal (negative when investments stop being active)"""
+    built = ensure_rollups(amounts)
+    bulk_increment(
+        EarningsRollup.objects.all(), 'user_id',
+        {user_id: amount for user_id, amount in amounts.items() if user_id not in built},
+        ['invested_principal'],
+    )
+
+
+def refresh_invested_principal(user_ids):
+    """Recompute principal after investments are created or change status"""
+    ensure_rollups(user_ids)
+    principal = _invested_principal(user_ids)
+    EarningsRollup.objects.bulk_update(
+        [EarningsRollup(user_id=user_id, invested_principal=principal.get(user_id) or ZERO) for user_id in user_ids],
+        ['invested_principal'],
+    )
+
+
+def get_rollup(user, day=None):
+    """
+    The user's rollup for display. Never writes once the row exists: if no
+    accrual has touched the user since `as_of`, the daily windows are rolled
+    forward in memory from at most a week of DailyEarning rows.
+    """
+    day = day or timezone.localdate()
+    rollup = EarningsRollup.objects.filter(user=user).first()
+    if rollup is None:
+        # Built from the source tables, so it's current even if another
+        # request inserted the row first
+        rollup = compute_rollups([user.id], day)[0]
+        EarningsRollup.objects.bulk_create([rollup], ignore_conflicts=True)
+    if rollup.as_of != day:
+        rollup.today_earnings, rollup.weekly_earnings = _earning_windows([user.id], day).get(user.id, (ZERO, ZERO))
+        rollup.as_of = day
+    return rollup
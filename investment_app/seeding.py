@@ -0,0 +1,114 @@
+"""
+Seed data shared by tests.py and the `manage.py bench` scenarios.
+
+    from investment_app.seeding import make_plan, make_users
+
+    plan = make_plan()  # 'basic': 3.00% a day, 50.00 minimum
+    user_ids = make_users(40, profiles=True)
+
+seed_history() fills the history tables at benchmark scale. hot_queries()
+are the queries the busiest pages run against them, and
+FULL_SCAN_PATTERNS spot a plan that reads a whole table.
+"""
+import re
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from .models import CryptoWallet, DailyEarning, Deposit, Investment, InvestmentPlan, Transaction, UserProfile
+
+# Three plans whose rates exercise the rounding to a cent
+TIERED_RATES = [('basic', Decimal('1.25')), ('standard', Decimal('2.50')), ('premium', Decimal('3.05'))]
+
+
+def make_plan(name='basic', daily_return='3.00', min_deposit='50.00', **fields):
+    return InvestmentPlan.objects.create(name=name, daily_return=Decimal(daily_return),
+                                         min_deposit=Decimal(min_deposit), **fields)
+
+
+def make_tiered_plans(min_deposit='10.00'):
+    """The basic, standard and premium plans at TIERED_RATES"""
+    return [make_plan(name, rate, min_deposit) for name, rate in TIERED_RATES]
+
+
+def make_users(count, prefix='user', profiles=False, batch_size=None):
+    """
+    Bulk-create users `prefix`0 to `prefix`<count - 1>, and their profiles
+    if `profiles`; returns their ids in creation order.
+    """
+    last_id = User.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+    User.objects.bulk_create([User(username=f'{prefix}{i}') for i in range(count)], batch_size=batch_size)
+    user_ids = list(User.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True))
+    if profiles:
+        UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in user_ids], batch_size=batch_size)
+    return user_ids
+
+
+def seed_history(rows, users=1000, batch_size=5000):
+    """Bulk-insert `rows` each of investments, transactions, deposits and daily earnings"""
+    plan = make_plan()
+    crypto_wallet = CryptoWallet.objects.create(network='BTC', wallet_address='bench')
+    user_ids = make_users(users, prefix='bench_')
+    now = timezone.now()
+    today = timezone.localdate()
+
+    def batched(make):
+        for start in range(0, rows, batch_size):
+            yield [make(i) for i in range(start, min(start + batch_size, rows))]
+
+    statuses = ['active', 'completed', 'cancelled']
+    for batch in batched(lambda i: Investment(
+            user_id=user_ids[i % users], plan=plan, amount=Decimal('100.00'),
+            start_date=now - timedelta(days=i % 60), end_date=now + timedelta(days=30 - i % 60),
+            status=statuses[i % 3])):
+        Investment.objects.bulk_create(batch)
+
+    types = ['deposit', 'withdrawal', 'return', 'referral']
+    transaction_statuses = ['completed', 'completed', 'pending', 'rejected']
+    for batch in batched(lambda i: Transaction(
+            user_id=user_ids[i % users], transaction_type=types[i % 4], amount=Decimal('10.00'),
+            status=transaction_statuses[(i // 4) % 4], created_at=now - timedelta(minutes=i))):
+        Transaction.objects.bulk_create(batch)
+
+    deposit_statuses = ['pending', 'confirmed', 'rejected', 'completed', 'processing']
+    for batch in batched(lambda i: Deposit(
+            user_id=user_ids[i % users], crypto_wallet=crypto_wallet, amount=Decimal('100.00'),
+            status=deposit_statuses[i % 5], created_at=now - timedelta(minutes=i))):
+        Deposit.objects.bulk_create(batch)
+
+    for batch in batched(lambda i: DailyEarning(
+            user_id=user_ids[i % users], amount=Decimal('3.00'), date=today - timedelta(days=i // users))):
+        DailyEarning.objects.bulk_create(batch)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return User.objects.get(pk=user_ids[0])
+
+
+# A plan line that reads a table without using an index
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!.*\bUSING (COVERING )?INDEX)(?P<table>\w+)'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+
+
+def hot_queries(user):
+    """The queries behind dashboard, transactions, deposit_history and admin_deposit_list"""
+    today = timezone.localdate()
+    return {
+        'dashboard: active investments': Investment.objects.filter(user=user, status='active'),
+        'dashboard: pending transactions': Transaction.objects.filter(user=user, status='pending'),
+        'dashboard: earnings total': Transaction.objects.filter(
+            user=user, status='completed', transaction_type__in=['return', 'referral']).values('amount'),
+        'dashboard: weekly earnings': DailyEarning.objects.filter(user=user, date__gte=today - timedelta(days=7)),
+        'dashboard: recent transactions': Transaction.objects.filter(user=user).order_by('-created_at')[:5],
+        'dashboard: upcoming maturities': Investment.objects.filter(
+            user=user, status='active', end_date__lte=today + timedelta(days=7),
+            end_date__gte=today).order_by('end_date'),
+        'transactions': Transaction.objects.filter(user=user).order_by('-created_at', '-id')[:10],
+        'deposit_history': Deposit.objects.filter(user=user).order_by('-created_at', '-id')[:10],
+        'admin_deposit_list: by status': Deposit.objects.filter(status='pending').order_by('-created_at', '-id')[:20],
+        'admin_deposit_list: all': Deposit.objects.order_by('-created_at', '-id')[:20],
+    }
@@ -1,10 +1,16 @@
 # In signals.py
-from django.db.models.signals import post_save, pre_save
+import logging
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.core.exceptions import ValidationError
 from django.dispatch import receiver
-from django.utils import timezone
-from .models import Deposit, CryptoWallet, Investment
+from .models import Deposit, CryptoWallet, Investment, InvestmentPlan, Referral, Transaction
+from .caching import invalidate_dashboards
+from .rollups import (EARNING_TRANSACTION_TYPES, add_lifetime_earnings,
+                      refresh_invested_principal, refresh_lifetime_earnings)
 from decimal import Decimal
+from . import plans, referral_graph
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=Deposit)
 def update_user_balance_on_deposit_confirmation(sender, instance, **kwargs):
@@ -29,6 +35,7 @@ def validate_investment_amount(sender, instance, **kwargs):
     """
     Signal to validate investment amount against plan minimum before saving
     """
+    instance.load_plan()
     if instance.plan and instance.amount < instance.plan.min_deposit:
         raise ValidationError(
             f"Investment amount must be at least ${instance.plan.min_deposit} "
@@ -39,41 +46,66 @@ def validate_investment_amount(sender, instance, **kwargs):
 @receiver(post_save, sender=Investment)
 def handle_investment_status_change(sender, instance, created, **kwargs):
     """
-    Signal to handle investment status changes and automatic actions
+    Log new investments. Confirmation and completion are transitions in
+    investment_app.lifecycle, which update the row directly.
     """
-    from .models import UserProfile
-    
     if created:
-        # New investment created
-        print(f"New investment created: {instance}")
-    
-    # Handle investment confirmation
-    if instance.is_confirmed and instance.status == 'pending':
-        instance.status = 'active'
-        instance.save()
-    
-    # Handle completed investments
-    if instance.status == 'completed' and instance.total_return == 0:
-        # Calculate and assign total returns for completed investments
-        instance.total_return = instance.calculate_total_return()
-        
-        # Add returns to user's wallet
-        try:
-            user_profile = UserProfile.objects.get(user=instance.user)
-            user_profile.wallet_balance += instance.total_return
-            user_profile.total_earnings += instance.total_return
-            user_profile.save()
-        except UserProfile.DoesNotExist:
-            pass
-        
-        instance.save()
+        logger.info("New investment created: %s", instance)
 
 
 @receiver(post_save, sender=Investment)
-def check_investment_completion(sender, instance, **kwargs):
-    """
-    Signal to automatically complete investments that have passed their end date
-    """
-    if (instance.status == 'active' and instance.end_date and 
-        timezone.now() > instance.end_date):
-        instance.complete_investment()
\ No newline at end of file
+@receiver(post_delete, sender=Investment)
+def update_invested_principal(sender, instance, **kwargs):
+    """Keep the owner's earnings rollup in step with their active investments"""
+    refresh_invested_principal([instance.user_id])
+
+
+@receiver(post_save, sender=Transaction)
+def update_lifetime_earnings(sender, instance, created, **kwargs):
+    """Add completed return/referral transactions to the owner's earnings rollup"""
+    if instance.transaction_type not in EARNING_TRANSACTION_TYPES:
+        return
+    if created:
+        if instance.status == 'completed':
+            add_lifetime_earnings({instance.user_id: instance.amount})
+    else:
+        # The status of an existing transaction may have changed
+        refresh_lifetime_earnings([instance.user_id])
+
+
+@receiver(post_save, sender=InvestmentPlan)
+@receiver(post_delete, sender=InvestmentPlan)
+def invalidate_plan_catalog(sender, **kwargs):
+    """Make every worker reload the plan catalog"""
+    plans.invalidate()
+
+
+@receiver(post_save, sender=Investment)
+@receiver(post_delete, sender=Investment)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def expire_dashboard_for_owner(sender, instance, **kwargs):
+    """The owner's dashboard lists investments and transactions"""
+    invalidate_dashboards([instance.user_id])
+
+
+@receiver(post_save, sender=Referral)
+@receiver(post_delete, sender=Referral)
+def expire_dashboard_for_referrer(sender, instance, **kwargs):
+    """The referrer's dashboard shows their referral count"""
+    invalidate_dashboards([instance.referrer_id])
+
+
+@receiver(post_save, sender=Referral)
+def link_referral_paths(sender, instance, created, **kwargs):
+    """Keep the referral closure table in step with the referral edges"""
+    if created:
+        referral_graph.link(instance.referrer_id, instance.referred_user_id)
+    else:
+        # The referrer may have been changed
+        referral_graph.relink(instance.referrer_id, instance.referred_user_id)
+
+
+@receiver(post_delete, sender=Referral)
+def unlink_referral_paths(sender, instance, **kwargs):
+    referral_graph.unlink(instance.referrer_id, instance.referred_user_id)
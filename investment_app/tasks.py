@@ -1,9 +1,170 @@
 # In tasks.py
-from celery import shared_task
+from datetime import date
+from decimal import Decimal
+from celery import group, shared_task
+from django.conf import settings
+from django.db.models import Count, DecimalField, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from investment_app.accrual import accrue_daily_earnings
+from investment_app.forecast import take_snapshot
+from investment_app.ledger import snapshot_balances
+from investment_app.lifecycle import complete_matured
 from investment_app.management.commands.add_daily_earnings import Command as DailyEarningsCommand
+from investment_app.models import Investment, DailyEarning, RunCheckpoint
+
+SHARDED_ACCRUAL_JOB = 'add_daily_earnings'
+DEFAULT_ACCRUAL_SHARDS = 8
+
 
 @shared_task
 def add_daily_earnings_task():
     command = DailyEarningsCommand()
-    command.handle()
\ No newline at end of file
+    command.handle()
+
+
+@shared_task
+def snapshot_balances_task():
+    return snapshot_balances()
+
+
+@shared_task
+def forecast_liabilities_task():
+    snapshot = take_snapshot()
+    return {'as_of': str(snapshot.as_of), 'recomputed': snapshot.recomputed}
+
+
+@shared_task
+def complete_matured_investments_task():
+    return complete_matured()
+
+
+def accrual_investments(run_date):
+    """Investments that earn a return on `run_date`"""
+    return Investment.objects.filter(status='active', end_date__gte=run_date)
+
+
+def user_shards(run_date, shards):
+    """
+    Split the users holding accruing investments into at most `shards`
+    contiguous user-id ranges [low, high). Sharding by user keeps all of a
+    user's investments in one shard, so shards never write the same rows.
+    """
+    bounds = accrual_investments(run_date).aggregate(low=Min('user_id'), high=Max('user_id'))
+    if bounds['low'] is None:
+        return []
+    low, high = bounds['low'], bounds['high'] + 1
+    step = max(1, -(-(high - low) // shards))
+    return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+
+@shared_task
+def fan_out_daily_earnings_task(shards=None, run_date=None):
+    """
+    Coordinator: dispatch one accrual subtask per user shard. Each shard
+    queues finalize_daily_earnings_task when it is done, and the one that
+    finds every shard complete marks the day complete. The totals are read
+    from the shard checkpoints, so no result backend is needed.
+
+    Runs inline when CELERY_TASK_ALWAYS_EAGER is enabled.
+    """
+    shards = shards or getattr(settings, 'ACCRUAL_SHARDS', DEFAULT_ACCRUAL_SHARDS)
+    run_date = date.fromisoformat(run_date) if run_date else timezone.now().date()
+
+    if (DailyEarning.objects.filter(date=run_date).exists() and not
+            RunCheckpoint.objects.filter(job=SHARDED_ACCRUAL_JOB, run_date=run_date).exists()):
+        # Earnings were already added for this day by the add_daily_earnings command
+        return {'status': 'already processed', 'run_date': run_date.isoformat()}
+
+    day, _ = RunCheckpoint.objects.get_or_create(job=SHARDED_ACCRUAL_JOB, run_date=run_date, shard=0)
+    if day.is_complete:
+        return {'status': 'already complete', 'run_date': run_date.isoformat()}
+
+    ranges = user_shards(run_date, shards)
+    if not ranges:
+        return finalize_daily_earnings_task(run_date.isoformat())
+
+    # Create every shard's checkpoint up front, so the day can't be finalized
+    # while a shard that hasn't started yet is still to run
+    RunCheckpoint.objects.bulk_create([
+        RunCheckpoint(job=SHARDED_ACCRUAL_JOB, run_date=run_date, shard=index)
+        for index in range(1, len(ranges) + 1)
+    ], ignore_conflicts=True)
+    group([
+        accrue_shard_task.s(run_date.isoformat(), index, low, high)
+        for index, (low, high) in enumerate(ranges, start=1)
+    ]).apply_async()
+    return {'status': 'dispatched', 'run_date': run_date.isoformat(), 'shards': len(ranges)}
+
+
+@shared_task
+def accrue_shard_task(run_date, shard, low, high):
+    """
+    Accrue one user-id range. Progress is checkpointed per chunk, so a
+    retried or re-dispatched shard resumes after the last committed user.
+    """
+    run_date = date.fromisoformat(run_date)
+    checkpoint, _ = RunCheckpoint.objects.get_or_create(
+        job=SHARDED_ACCRUAL_JOB, run_date=run_date, shard=shard
+    )
+
+    if not checkpoint.is_complete:
+        def save_progress(last_user_id, users, investments, total):
+            RunCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                last_processed_id=last_user_id,
+                processed_count=F('processed_count') + investments,
+                total_amount=F('total_amount') + total,
+                updated_at=timezone.now(),
+            )
+
+        investments = accrual_investments(run_date).filter(
+            user_id__gte=max(low, checkpoint.last_processed_id + 1),
+            user_id__lt=high,
+        )
+        accrue_daily_earnings(run_date, investments, on_chunk=save_progress)
+
+        checkpoint.refresh_from_db()
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save(update_fields=['completed_at', 'updated_at'])
+
+    finalize_daily_earnings_task.delay(run_date.isoformat())
+    return {
+        'shard': shard,
+        'investments': checkpoint.processed_count,
+        'total': str(checkpoint.total_amount),
+    }
+
+
+@shared_task
+def finalize_daily_earnings_task(run_date):
+    """
+    Sum the shard checkpoints and mark the day complete once every shard
+    is; until then there is nothing to do, the last shard queues this again.
+    """
+    run_date = date.fromisoformat(run_date)
+    totals = RunCheckpoint.objects.filter(job=SHARDED_ACCRUAL_JOB, run_date=run_date, shard__gt=0).aggregate(
+        shards=Count('pk'),
+        pending=Count('pk', filter=Q(completed_at__isnull=True)),
+        investments=Coalesce(Sum('processed_count'), 0),
+        total=Coalesce(Sum('total_amount'), Value(Decimal('0.00')),
+                       output_field=DecimalField(max_digits=15, decimal_places=2)),
+    )
+    if totals['pending']:
+        return {'status': 'waiting', 'run_date': run_date.isoformat(), 'pending': totals['pending']}
+
+    total = Decimal(totals['total']).quantize(Decimal('0.01'))  # SQLite sums decimals as floats
+    RunCheckpoint.objects.filter(
+        job=SHARDED_ACCRUAL_JOB, run_date=run_date, shard=0, completed_at__isnull=True
+    ).update(
+        processed_count=totals['investments'],
+        total_amount=total,
+        completed_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    return {
+        'status': 'complete',
+        'run_date': run_date.isoformat(),
+        'shards': totals['shards'],
+        'investments': totals['investments'],
+        'total': str(total),
+    }
@@ -0,0 +1,65 @@
+"""
+Test helpers.
+
+    from investment_app.testing import assert_query_budget
+
+    def test_dashboard_queries(self):
+        self.client.force_login(self.user)
+        assert_query_budget(self.client, 'dashboard')
+
+The budget comes from settings.QUERY_BUDGETS unless passed explicitly, so
+an N+1 regression in any budgeted view fails the test that renders it.
+Namespaced names ('admin:investment_app_deposit_changelist') use the
+budget of the name without the namespace, as the middleware reports it.
+
+run_threads() runs a function from several threads at once, each on its
+own database connection. Seed data lives in seeding.py.
+"""
+import threading
+import time
+from django.db import connections
+from django.urls import reverse
+from .instrumentation import query_budget, record_queries
+
+
+def assert_query_budget(client, url_name, *args, budget=None, method='get', data=None, **kwargs):
+    """
+    Request `url_name` with the test client and fail if it ran more queries
+    than its budget. Returns the response.
+    """
+    budget = budget if budget is not None else query_budget(url_name.rpartition(':')[2])
+    if budget is None:
+        raise AssertionError(f'No query budget configured for {url_name!r}')
+
+    url = reverse(url_name, args=args, kwargs=kwargs)
+    with record_queries() as recorder:
+        response = getattr(client, method)(url, data or {})
+
+    if recorder.count > budget:
+        duplicates = '\n'.join(f'  {runs}x {sql}' for sql, runs in recorder.duplicates.items())
+        raise AssertionError(
+            f'{url_name} ran {recorder.count} queries, budget is {budget}'
+            + (f'\nRepeated queries:\n{duplicates}' if duplicates else '')
+        )
+    return response
+
+
+def run_threads(count, target):
+    """Run `target(index)` in `count` threads; returns (elapsed seconds, errors)"""
+    errors = []
+
+    def worker(index):
+        try:
+            target(index)
+        except Exception as e:  # Report, don't swallow
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, errors
@@ -1,3 +1,858 @@
-from django.test import TestCase
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from . import (accrual, approvals, clock, codes, deposits, forecast, ledger, lifecycle, projection, referral_graph,
+               referrals, tasks, wallet)
+from .management.commands import calculate_daily_earnings
+from .models import (BalanceSnapshot, CodeSequence, CryptoWallet, DailyEarning, Deposit, EarningsRollup, Investment,
+                     LedgerEntry, LiabilitySnapshot, Referral, RunCheckpoint, Transaction, UserProfile)
+from .rollups import ensure_rollups
+from .caching import dashboard_version
+from .celery import app as celery_app
+from .forms import DepositForm
+from .pagination import KeysetPaginator, decode_cursor, encode_cursor
+from .seeding import FULL_SCAN_PATTERNS, hot_queries, make_plan, make_tiered_plans, make_users, seed_history
+from .testing import assert_query_budget, run_threads
 
-# Create your tests here.
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as context:
+        func()
+    return len(context)
+
+
+class CodeSequenceTests(TestCase):
+    def setUp(self):
+        # Blocks are per process; start every test from an empty pool
+        codes._blocks.clear()
+        codes._local.__dict__.clear()
+        # Create the counters up front so first use doesn't add a get_or_create to the counts
+        for name in (codes.DEPOSIT_REFERENCE, codes.REFERRAL_CODE):
+            CodeSequence.objects.create(name=name)
+
+    def test_codes_are_unique_inside_a_transaction(self):
+        with transaction.atomic():
+            references = [codes.referral_code() for _ in range(500)]
+        self.assertEqual(len(set(references)), 500)
+
+    def test_query_count_stays_flat_inside_a_transaction(self):
+        # Blocks double while one transaction keeps running out: 20 + 40 + ... covers 500 codes in 5 blocks
+        with transaction.atomic():
+            queries = count_queries(lambda: [codes.deposit_reference() for _ in range(500)])
+        self.assertLessEqual(queries, 10)
+
+    def test_bulk_profile_creation_allocates_once(self):
+        def credit(count):
+            user_ids = make_users(count, prefix=f'user{count}_')
+            with transaction.atomic():
+                return count_queries(lambda: wallet.credit_many(
+                    {user_id: Decimal('1.00') for user_id in user_ids}, 'deposits'
+                ))
+
+        self.assertEqual(credit(10), credit(40))
+        codes_ = UserProfile.objects.values_list('referral_code', flat=True)
+        self.assertEqual(len(set(codes_)), 50)
+
+    def test_unsaved_instances_take_no_code(self):
+        self.assertEqual(count_queries(lambda: (Deposit(), UserProfile(), DepositForm())), 0)
+        self.assertEqual(CodeSequence.objects.get(name=codes.DEPOSIT_REFERENCE).next_value, 1)
+
+        user = User.objects.create_user('investor')
+        crypto_wallet = CryptoWallet.objects.create(network='BTC', wallet_address='test')
+        deposit = Deposit.objects.create(user=user, crypto_wallet=crypto_wallet, amount=Decimal('10.00'))
+        self.assertRegex(deposit.reference_id, r'^DEP\d{8}000001$')
+
+    def test_rolled_back_block_is_dropped(self):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    codes.referral_code()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.assertIsNone(codes._pending(codes.REFERRAL_CODE))
+            self.assertEqual(count_queries(codes.referral_code), 2)
+
+
+class CodeConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        codes._blocks.clear()
+        codes._local.__dict__.clear()
+
+    def test_parallel_creates_get_unique_codes(self):
+        threads, per_thread = 8, 25
+        crypto_wallet = CryptoWallet.objects.create(network='BTC', wallet_address='test')
+        owners = make_users(threads)
+
+        def create(index):
+            UserProfile.objects.create(user_id=owners[index])
+            for _ in range(per_thread):
+                Deposit.objects.create(user_id=owners[index], crypto_wallet=crypto_wallet, amount=Decimal('10.00'))
+
+        with override_settings(CODE_BLOCK_SIZE=5):
+            _, errors = run_threads(threads, create)
+
+        self.assertEqual(errors, [])
+        references = Deposit.objects.values_list('reference_id', flat=True)
+        self.assertEqual(len(set(references)), threads * per_thread)
+        referral_codes = UserProfile.objects.values_list('referral_code', flat=True)
+        self.assertEqual(len(set(referral_codes)), threads)
+
+
+class ConfirmDepositsTests(TestCase):
+    def test_confirms_credits_and_records_each_deposit(self):
+        crypto_wallet = CryptoWallet.objects.create(network='BTC', wallet_address='test')
+        admin = User.objects.create_user('admin', is_staff=True)
+        user_ids = make_users(3)
+        Deposit.objects.bulk_create([
+            Deposit(user_id=user_ids[i % 3], crypto_wallet=crypto_wallet, amount=Decimal('25.00')) for i in range(7)
+        ])
+
+        self.assertEqual(deposits.confirm_deposits(Deposit.objects.all(), admin), 7)
+        self.assertFalse(Deposit.objects.exclude(status='confirmed').exists())
+        self.assertFalse(Deposit.objects.filter(confirmed_at__isnull=True).exists())
+        self.assertEqual(Transaction.objects.filter(transaction_type='deposit', status='completed').count(), 7)
+        balances = dict(UserProfile.objects.values_list('user_id', 'wallet_balance'))
+        self.assertEqual(balances, dict(zip(user_ids, [Decimal('75.00'), Decimal('50.00'), Decimal('50.00')])))
+        self.assertEqual(deposits.confirm_deposits(Deposit.objects.all(), admin), 0)
+
+
+class MaturityTests(TestCase):
+    def test_sweep_completes_matured_investments(self):
+        plan = make_plan()
+        user = User.objects.create_user('investor')
+        started = timezone.now() - timedelta(days=31)
+        matured, running = [
+            Investment.objects.create(user=user, plan=plan, amount=Decimal('100.00'), status='active',
+                                      start_date=started, end_date=started + timedelta(days=days))
+            for days in (30, 60)
+        ]
+
+        stats = lifecycle.complete_matured()
+
+        matured.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual(stats, {'investments': 1, 'users': 1})
+        self.assertEqual((matured.status, matured.total_return), ('completed', Decimal('0.00')))
+        self.assertEqual(running.status, 'active')
+        self.assertEqual(EarningsRollup.objects.get(user=user).invested_principal, Decimal('100.00'))
+        # As with complete(), the returns were paid by the daily accrual
+        self.assertFalse(UserProfile.objects.filter(user=user, wallet_balance__gt=0).exists())
+
+    def test_completion_does_not_pay_returns_again(self):
+        # Returns are paid by the daily accrual; completion adds nothing on top
+        plan = make_plan()
+        user = User.objects.create_user('investor')
+        started = timezone.now() - timedelta(days=31)
+        investment = Investment.objects.create(user=user, plan=plan, amount=Decimal('100.00'), status='active',
+                                               start_date=started, end_date=started + timedelta(days=30))
+
+        lifecycle.complete(investment)
+
+        self.assertEqual(investment.total_return, Decimal('0.00'))
+        self.assertFalse(UserProfile.objects.filter(user=user, wallet_balance__gt=0).exists())
+
+
+class ReferralBonusTests(TestCase):
+    def setUp(self):
+        self.plan = make_plan()
+        self.referrer = User.objects.create_user('referrer')
+        ensure_rollups([self.referrer.pk])
+        joined = timezone.now() - referrals.BONUS_DELAY - timedelta(days=1)
+        self.invested, self.later = User.objects.bulk_create([User(username='invested'), User(username='later')])
+        self.referrals = Referral.objects.bulk_create([
+            Referral(referrer=self.referrer, referred_user=user, created_at=joined)
+            for user in (self.invested, self.later)
+        ])
+        self.invest(self.invested)
+
+    def invest(self, user):
+        Investment.objects.create(user=user, plan=self.plan, amount=Decimal('100.00'), status='active')
+
+    def test_bonus_updates_the_lifetime_earnings_rollup(self):
+        stats = referrals.process_referral_bonuses()
+
+        self.assertEqual((stats['paid'], stats['total']), (1, Decimal('2.00')))
+        rollup = EarningsRollup.objects.get(user=self.referrer)
+        self.assertEqual(rollup.lifetime_earnings, Decimal('2.00'))
+
+    def test_referral_invested_later_is_still_paid(self):
+        referrals.process_referral_bonuses()
+        # The mark moves past the referral still waiting for an investment
+        self.assertEqual(referrals.high_water_mark(), self.referrals[1].pk)
+        self.assertEqual(referrals.process_referral_bonuses()['referrals'], 0)
+
+        self.invest(self.later)
+        stats = referrals.process_referral_bonuses()
+
+        self.assertEqual((stats['referrals'], stats['paid'], stats['total']), (1, 1, Decimal('2.00')))
+        self.assertFalse(Referral.objects.filter(bonus_paid=False).exists())
+        self.assertEqual(referrals.high_water_mark(), self.referrals[1].pk)
+        profile = UserProfile.objects.get(user=self.referrer)
+        self.assertEqual(profile.total_referral_bonus, Decimal('4.00'))
+        self.assertEqual(EarningsRollup.objects.get(user=self.referrer).lifetime_earnings, Decimal('4.00'))
+
+
+class InvestmentAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        plan = make_plan()
+        self.investment = Investment.objects.create(user=User.objects.create_user('investor'), plan=plan,
+                                                    amount=Decimal('100.00'))
+
+    def change(self, **fields):
+        investment = self.investment
+        data = {
+            'user': investment.user_id, 'plan': investment.plan_id, 'amount': investment.amount,
+            'start_date_0': investment.start_date.date(), 'start_date_1': investment.start_date.time(),
+            'end_date_0': investment.end_date.date(), 'end_date_1': investment.end_date.time(),
+            'status': investment.status, 'total_return': investment.total_return,
+            'referral_bonus_earned': investment.referral_bonus_earned, **fields,
+        }
+        if data.pop('is_confirmed', investment.is_confirmed):
+            data['is_confirmed'] = 'on'
+        response = self.client.post(reverse('admin:investment_app_investment_change', args=[investment.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        self.investment.refresh_from_db()
+
+    def test_confirming_goes_through_the_lifecycle(self):
+        self.change(is_confirmed=True)
+
+        self.assertEqual((self.investment.status, self.investment.is_confirmed), ('active', True))
+        self.assertEqual(EarningsRollup.objects.get(user=self.investment.user).invested_principal, Decimal('100.00'))
+
+    def test_invalid_status_change_is_refused(self):
+        self.change(status='completed')
+
+        self.assertEqual(self.investment.status, 'pending')
+
+
+class LifecycleTests(TestCase):
+    TRANSITIONS = [
+        (lifecycle.confirm, 'pending', 'active'),
+        (lifecycle.complete, 'active', 'completed'),
+        (lifecycle.cancel, 'active', 'cancelled'),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.plan = make_plan()
+        self.user = User.objects.create_user('investor')
+        ensure_rollups([self.user.pk])
+
+    def test_one_investment_update_per_transition(self):
+        now = timezone.now()
+        for transition, source, target in self.TRANSITIONS:
+            with self.subTest(transition.__name__):
+                investment = Investment.objects.create(user=self.user, plan=self.plan, amount=Decimal('100.00'),
+                                                       status=source, start_date=now - timedelta(days=31),
+                                                       end_date=now - timedelta(days=1))
+                investment = Investment.objects.select_related('user').get(pk=investment.pk)
+                with CaptureQueriesContext(connection) as queries:
+                    transition(investment)
+
+                # Leave out the savepoint the test's own transaction adds around the transition
+                statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+                touching = [sql for sql in statements if '"investment_app_investment"' in sql]
+                self.assertEqual(len(touching), 1)
+                self.assertTrue(touching[0].startswith('UPDATE "investment_app_investment"'))
+                # The investment UPDATE, then reading and updating the principal rollup
+                self.assertEqual(len(statements), 3)
+                self.assertEqual(Investment.objects.get(pk=investment.pk).status, target)
+
+    def test_completed_investments_cannot_be_cancelled(self):
+        investment = Investment.objects.create(user=self.user, plan=self.plan, amount=Decimal('100.00'),
+                                               status='active')
+        lifecycle.complete(investment)
+        with self.assertRaises(lifecycle.InvalidTransition):
+            lifecycle.cancel(investment)
+        self.assertEqual(EarningsRollup.objects.get(user=self.user).invested_principal, Decimal('0.00'))
+
+
+class QueryBudgetTests(TestCase):
+    # Everything in settings.QUERY_BUDGETS except the views below, tested separately
+    PAGES = [name for name in settings.QUERY_BUDGETS
+             if name != 'admin_deposit_list' and not name.startswith('investment_app_')]
+    CHANGELISTS = [name for name in settings.QUERY_BUDGETS if name.startswith('investment_app_')]
+
+    def setUp(self):
+        cache.clear()
+        self.plans = [
+            make_plan(name) for name in ('basic', 'standard', 'premium')
+        ]
+        self.user = User.objects.create_superuser('investor')
+        wallet.credit(self.user, Decimal('1000.00'), 'deposits')
+        crypto_wallet = CryptoWallet.objects.create(network='BTC', wallet_address='test')
+        for i, plan in enumerate(self.plans):
+            investment = Investment.objects.create(user=self.user, plan=plan, amount=Decimal('100.00'),
+                                                   status='active', is_confirmed=True)
+            Transaction.objects.create(user=self.user, transaction_type='return', amount=Decimal('3.00'),
+                                       status='completed', investment=investment)
+            DailyEarning.objects.create(user=self.user, investment=investment, amount=Decimal('3.00'),
+                                        date=timezone.localdate() - timedelta(days=i))
+            Deposit.objects.create(user=self.user, crypto_wallet=crypto_wallet, amount=Decimal('50.00'))
+            Referral.objects.create(referrer=self.user, referred_user=User.objects.create_user(f'referred{i}'))
+        forecast.take_snapshot()
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        for name in self.PAGES:
+            with self.subTest(name):
+                self.assertEqual(assert_query_budget(self.client, name).status_code, 200)
+
+    def test_pages_for_a_new_user(self):
+        # The first visit also creates the profile and builds the rollup
+        self.client.force_login(User.objects.create_user('new'))
+        for name in self.PAGES:
+            if name != 'liability_forecast':
+                with self.subTest(name):
+                    self.assertEqual(assert_query_budget(self.client, name).status_code, 200)
+
+    def test_forms(self):
+        response = assert_query_budget(self.client, 'invest', method='post',
+                                       data={'plan_id': self.plans[0].pk, 'amount': '60.00'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        response = assert_query_budget(self.client, 'withdraw', method='post',
+                                       data={'amount': '10.00', 'wallet_address': 'address'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    @override_settings(ROOT_URLCONF='investment_app.urls')
+    def test_admin_deposit_list(self):
+        # Shadowed by the Django admin under the project's URLs
+        self.assertEqual(assert_query_budget(self.client, 'admin_deposit_list').status_code, 200)
+
+    def test_admin_changelists(self):
+        for name in self.CHANGELISTS:
+            with self.subTest(name):
+                self.assertEqual(assert_query_budget(self.client, f'admin:{name}').status_code, 200)
+
+
+class AddDailyEarningsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plans = make_tiered_plans()
+        self.users = [User.objects.create_user(f'investor{i}') for i in range(6)]
+        for i in range(10):
+            # Some users hold several investments; the amounts exercise the rounding to a cent
+            Investment.objects.create(user=self.users[i % 6], plan=plans[i % 3], status='active', is_confirmed=True,
+                                      amount=Decimal('100.50') + Decimal(i * 3333) / 100)
+
+    def assertCreditedOnce(self):
+        """Each user gets the sum of Investment.calculate_daily_return(), once"""
+        for user in self.users:
+            expected = sum(investment.calculate_daily_return() for investment in Investment.objects.filter(user=user))
+            profile = UserProfile.objects.get(user=user)
+            with self.subTest(user.username):
+                self.assertEqual(DailyEarning.objects.get(user=user, date=timezone.localdate()).amount, expected)
+                self.assertEqual((profile.total_earnings, profile.wallet_balance), (expected, expected))
+
+    def test_matches_per_investment_arithmetic(self):
+        call_command('add_daily_earnings', chunk_size=2, stdout=StringIO())
+        self.assertCreditedOnce()
+
+    def test_resumes_after_a_failed_chunk(self):
+        write_accruals = accrual.write_accruals
+        written = []
+
+        def killed_after_one_chunk(*args, **kwargs):
+            if written:
+                raise RuntimeError('killed')
+            written.append(args)
+            write_accruals(*args, **kwargs)
+
+        with mock.patch.object(accrual, 'write_accruals', killed_after_one_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command('add_daily_earnings', chunk_size=2, stdout=StringIO())
+        self.assertEqual(DailyEarning.objects.count(), 2)
+
+        out = StringIO()
+        call_command('add_daily_earnings', chunk_size=2, stdout=out)
+        self.assertIn('Resuming', out.getvalue())
+        self.assertCreditedOnce()
+
+        out = StringIO()
+        call_command('add_daily_earnings', stdout=out)
+        self.assertIn('already processed', out.getvalue())
+
+
+class CalculateDailyEarningsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plan = make_plan()
+        self.users = [User.objects.create_user(f'investor{i}') for i in range(4)]
+        for user in self.users:
+            Investment.objects.create(user=user, plan=self.plan, amount=Decimal('100.00'), status='active',
+                                      is_confirmed=True)
+
+    def test_resume_credits_every_user_once(self):
+        write_accruals = calculate_daily_earnings.write_accruals
+        written = []
+
+        def killed_after_one_chunk(*args, **kwargs):
+            if written:
+                raise RuntimeError('killed')
+            written.append(args)
+            write_accruals(*args, **kwargs)
+
+        with mock.patch.object(calculate_daily_earnings, 'write_accruals', killed_after_one_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command('calculate_daily_earnings', chunk_size=2, stdout=StringIO())
+        # A user credited in the committed chunk invests again before the run is resumed
+        Investment.objects.create(user=self.users[0], plan=self.plan, amount=Decimal('200.00'), status='active',
+                                  is_confirmed=True)
+        call_command('calculate_daily_earnings', chunk_size=2, stdout=StringIO())
+
+        for user in self.users:
+            with self.subTest(user.username):
+                self.assertEqual(UserProfile.objects.get(user=user).wallet_balance, Decimal('3.00'))
+                self.assertEqual(Transaction.objects.filter(user=user, transaction_type='return').count(), 1)
+                self.assertEqual(DailyEarning.objects.get(user=user).amount, Decimal('3.00'))
+
+
+class ShardedAccrualTests(TestCase):
+    def setUp(self):
+        # Run the shard and finalize tasks inline (the app reads CELERY_* names)
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+        self.addCleanup(setattr, celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', False)
+        plan = make_plan()
+        for i in range(4):
+            Investment.objects.create(user=User.objects.create_user(f'investor{i}'), plan=plan,
+                                      amount=Decimal('100.00'), status='active', is_confirmed=True)
+
+    def test_day_completes_once_every_shard_has(self):
+        run_date = timezone.localdate()
+        result = tasks.fan_out_daily_earnings_task(shards=2, run_date=run_date.isoformat())
+
+        self.assertEqual(result['shards'], 2)
+        day = RunCheckpoint.objects.get(job=tasks.SHARDED_ACCRUAL_JOB, run_date=run_date, shard=0)
+        self.assertTrue(day.is_complete)
+        self.assertEqual((day.processed_count, day.total_amount), (4, Decimal('12.00')))
+        self.assertEqual(DailyEarning.objects.filter(date=run_date).count(), 4)
+
+    def test_finalize_waits_for_pending_shards(self):
+        run_date = timezone.localdate()
+        RunCheckpoint.objects.create(job=tasks.SHARDED_ACCRUAL_JOB, run_date=run_date, shard=0)
+        RunCheckpoint.objects.create(job=tasks.SHARDED_ACCRUAL_JOB, run_date=run_date, shard=1,
+                                     processed_count=2, completed_at=timezone.now())
+        RunCheckpoint.objects.create(job=tasks.SHARDED_ACCRUAL_JOB, run_date=run_date, shard=2)
+
+        result = tasks.finalize_daily_earnings_task(run_date.isoformat())
+
+        self.assertEqual(result['status'], 'waiting')
+        day = RunCheckpoint.objects.get(job=tasks.SHARDED_ACCRUAL_JOB, run_date=run_date, shard=0)
+        self.assertFalse(day.is_complete)
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_an_index(self):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'No plan checks for {connection.vendor}')
+        user = seed_history(2000, users=20)
+        for name, queryset in hot_queries(user).items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(pattern.search(plan), plan)
+
+
+class ReferralGraphTests(TestCase):
+    def setUp(self):
+        plan = make_plan()
+        self.user_ids = make_users(40, profiles=True)
+        # Each user is referred by one of the users that joined shortly before them
+        self.parents = {self.user_ids[i]: self.user_ids[(i - 1) // 3] for i in range(1, len(self.user_ids))}
+        Referral.objects.bulk_create([
+            Referral(referrer_id=referrer_id, referred_user_id=user_id) for user_id, referrer_id in self.parents.items()
+        ])
+        Investment.objects.bulk_create([
+            Investment(user_id=user_id, plan=plan, amount=Decimal('100.00'), status='active')
+            for user_id in self.user_ids[1:]
+        ])
+        self.root = User.objects.get(pk=self.user_ids[0])
+
+    def test_rebuild_writes_one_path_per_ancestor(self):
+        depth = {self.user_ids[0]: 0}
+        for user_id in self.user_ids[1:]:
+            depth[user_id] = depth[self.parents[user_id]] + 1
+        self.assertEqual(referral_graph.rebuild(), sum(depth.values()))
+
+    def test_downline_queries_run_one_query(self):
+        referral_graph.rebuild()
+        for func in [lambda: len(referral_graph.downline(self.root)),
+                     lambda: len(referral_graph.downline(self.root, max_depth=3)),
+                     lambda: referral_graph.downline_volume(self.root),
+                     lambda: referral_graph.downline_levels(self.root),
+                     lambda: len(referral_graph.upline(self.user_ids[-1]))]:
+            self.assertEqual(count_queries(func), 1)
+        self.assertEqual(len(referral_graph.downline(self.root)), len(self.user_ids) - 1)
+        self.assertEqual(referral_graph.downline_volume(self.root), Decimal('100.00') * (len(self.user_ids) - 1))
+
+    def test_referrals_page_queries_do_not_depend_on_the_downline(self):
+        referral_graph.rebuild()
+        counts = []
+        for user_id in [self.user_ids[-1], self.user_ids[0]]:
+            cache.clear()
+            self.client.force_login(User.objects.get(pk=user_id))
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('referrals'))
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ReferralsPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plan = make_plan()
+        self.promoter = User.objects.create_user('promoter')
+        UserProfile.objects.create(user=self.promoter)
+        referee_ids = make_users(60, prefix='referee')
+        now = timezone.now()
+        Referral.objects.bulk_create([
+            Referral(referrer=self.promoter, referred_user_id=user_id, created_at=now - timedelta(minutes=i),
+                     bonus_paid=i % 3 == 0)
+            for i, user_id in enumerate(referee_ids)
+        ])
+        Investment.objects.bulk_create([
+            Investment(user_id=user_id, plan=plan, amount=Decimal('100.00') + i % 7, status='active')
+            for i, user_id in enumerate(referee_ids) for _ in range(i % 3)
+        ])
+        self.invested = Investment.objects.aggregate(total=Sum('amount'))['total']
+        self.client.force_login(self.promoter)
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('referrals'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['referrals']), 25)
+        return response, len(context)
+
+    def test_summary(self):
+        response, _ = self.get()
+        summary = response.context['summary']
+        self.assertEqual(summary['referrals'], 60)
+        self.assertEqual(summary['bonuses_paid'], 20)
+        self.assertEqual(summary['total_invested'], self.invested)
+
+    def test_query_count_does_not_depend_on_the_page(self):
+        self.get()  # Caches the summary fragments
+        _, first = self.get()
+        deep = Referral.objects.order_by('-created_at', '-id')[30]
+        _, later = self.get(after=encode_cursor(deep.created_at, deep.pk))
+        self.assertEqual(first, later)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('investor')
+        now = timezone.now()
+        # Ten rows share one timestamp so the id has to break the tie
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, transaction_type='deposit', amount=Decimal('10.00'),
+                        created_at=now - timedelta(minutes=max(i - 9, 0)))
+            for i in range(25)
+        ])
+        self.queryset = Transaction.objects.filter(user=self.user)
+        self.newest_first = list(self.queryset.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def test_cursor_round_trip(self):
+        row = self.queryset.first()
+        self.assertEqual(decode_cursor(encode_cursor(row.created_at, row.pk)), (row.created_at, row.pk))
+        self.assertIsNone(decode_cursor('not a cursor'))
+
+    def test_pages_break_ties_on_id(self):
+        paginator = KeysetPaginator(self.queryset, 10)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([row.pk for page in pages for row in page], self.newest_first)
+
+        previous = paginator.page(before=pages[2].previous_cursor)
+        self.assertEqual([row.pk for row in previous], [row.pk for row in pages[1]])
+        self.assertTrue(previous.has_previous() and previous.has_next())
+        first = paginator.page(before=previous.previous_cursor)
+        self.assertEqual([row.pk for row in first], self.newest_first[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_page_number_fallback(self):
+        self.client.force_login(self.user)
+        page = self.client.get(reverse('transactions'), {'page': 2}).context['transactions']
+        self.assertEqual(page.number, 2)
+        self.assertEqual([row.pk for row in page], self.newest_first[10:20])
+        self.assertEqual(list(page.window), [1, 2, 3])
+        page = self.client.get(reverse('transactions'), {'page': 'x'}).context['transactions']
+        self.assertEqual(page.number, 1)
+        page = self.client.get(reverse('transactions')).context['transactions']
+        self.assertTrue(page.is_keyset)
+
+
+class ListViewBudgetTests(TestCase):
+    # A full page of rows with every relation filled in, so an N+1 shows up
+    def setUp(self):
+        plan = make_plan()
+        self.staff = User.objects.create_superuser('staff')
+        UserProfile.objects.create(user=self.staff)
+        crypto_wallets = [
+            CryptoWallet.objects.create(network=network, wallet_address='test') for network in ['BTC', 'ETH']
+        ]
+        user_ids = make_users(60, profiles=True)
+        Deposit.objects.bulk_create([
+            Deposit(user_id=self.staff.pk if i % 2 else user_id, crypto_wallet=crypto_wallets[i % 2],
+                    amount=Decimal('10.00'), status='confirmed', confirmed_by=self.staff)
+            for i, user_id in enumerate(user_ids)
+        ])
+        Investment.objects.bulk_create([
+            Investment(user_id=user_id, plan=plan, amount=Decimal('100.00'), status='active') for user_id in user_ids
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(user_id=user_id, transaction_type='deposit', amount=Decimal('10.00')) for user_id in user_ids
+        ])
+        Referral.objects.bulk_create([Referral(referrer=self.staff, referred_user_id=user_id) for user_id in user_ids])
+        self.client.force_login(self.staff)
+
+    def test_list_views(self):
+        for name in ['deposit_history', 'referrals', 'transactions']:
+            with self.subTest(name):
+                self.assertEqual(assert_query_budget(self.client, name).status_code, 200)
+
+    def test_admin_changelists(self):
+        for model in ['deposit', 'investment', 'transaction', 'referral', 'userprofile']:
+            with self.subTest(model):
+                response = assert_query_budget(self.client, f'admin:investment_app_{model}_changelist')
+                self.assertEqual(response.status_code, 200)
+
+    @override_settings(ROOT_URLCONF='investment_app.urls')
+    def test_admin_deposit_list(self):
+        response = assert_query_budget(self.client, 'admin_deposit_list', data={'status': 'all'})
+        self.assertEqual(response.status_code, 200)
+
+
+class TimeFieldTests(TestCase):
+    def test_sql_day_counts_match_python(self):
+        cache.clear()
+        plan = make_plan()
+        user = User.objects.create_user('investor')
+        as_of = timezone.now()
+        Investment.objects.bulk_create([
+            Investment(user=user, plan=plan, amount=Decimal('100.00') + i % 50, status='active',
+                       start_date=as_of - timedelta(days=i % 40, hours=i % 24),
+                       end_date=as_of + timedelta(days=i % 30 - 5, hours=i % 7))
+            for i in range(100)
+        ])
+
+        investments = Investment.objects.filter(user=user)
+        with clock.frozen(as_of):
+            annotated = {investment.pk: investment.time_fields() for investment in clock.with_time_fields(investments)}
+            computed = {investment.pk: investment.time_fields() for investment in investments}
+        self.assertEqual(annotated, computed)
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plans = make_tiered_plans()
+        self.user = User.objects.create_user('investor')
+        self.as_of = timezone.now()
+        Investment.objects.bulk_create([
+            Investment(user=self.user, plan=plans[i % 3], amount=Decimal('100.00') + Decimal(i * 37) / 100,
+                       status='active', start_date=self.as_of - timedelta(days=i % 40, hours=i % 24),
+                       end_date=self.as_of + timedelta(days=i % 35 - 5, hours=i % 7))
+            for i in range(120)
+        ])
+        self.portfolio = projection.Portfolio.load(Investment.objects.filter(user=self.user))
+
+    def test_matches_time_fields(self):
+        forecast = projection.project(self.portfolio, self.as_of, engine='python', per_investment=True)
+        for investment in Investment.objects.filter(user=self.user):
+            fields = investment.time_fields(self.as_of)
+            self.assertEqual(forecast['values'][investment.pk], {
+                'accrued': fields['current_value'] - investment.amount,
+                'remaining': investment.calculate_daily_return() * fields['days_remaining'],
+                'current_value': fields['current_value'],
+            })
+
+    @unittest.skipUnless(projection.numpy, 'NumPy is not installed')
+    def test_engines_agree(self):
+        for per_investment in [False, True]:
+            self.assertEqual(
+                projection.project(self.portfolio, self.as_of, engine='numpy', per_investment=per_investment),
+                projection.project(self.portfolio, self.as_of, engine='python', per_investment=per_investment),
+            )
+
+    def test_numpy_engine_needs_numpy(self):
+        if projection.numpy is not None:
+            self.skipTest('NumPy is installed')
+        with self.assertRaises(ValueError):
+            projection.project(self.portfolio, self.as_of, engine='numpy')
+
+
+class LiabilityForecastTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plans = make_tiered_plans()
+        self.users = [User.objects.create_user(f'investor{i}') for i in range(5)]
+        self.now = timezone.now()
+        self.seed(150)
+        # The book was last touched well before the first snapshot
+        Investment.objects.update(updated_at=self.now - timedelta(days=1))
+        Transaction.objects.bulk_create([
+            Transaction(user=self.users[i % 5], transaction_type='withdrawal', amount=Decimal('25.00') + i,
+                        status='pending')
+            for i in range(10)
+        ])
+        self.as_of = timezone.localdate(self.now)
+
+    def seed(self, count, offset=0):
+        Investment.objects.bulk_create([
+            Investment(user=self.users[i % 5], plan=self.plans[i % 3],
+                       amount=Decimal('100.00') + Decimal(i * 37 % 90000) / 100, status='active',
+                       start_date=self.now - timedelta(days=i % 40, hours=i % 24),
+                       end_date=self.now + timedelta(days=i % 45 - 5, hours=i % 11))
+            for i in range(offset, offset + count)
+        ])
+
+    def expected(self):
+        """Per-day (returns, principal, withdrawals) computed row by row from Investment"""
+        days = {self.as_of + timedelta(days=offset): [Decimal('0.00')] * 3 for offset in range(forecast.HORIZON + 1)}
+        for investment in Investment.objects.filter(status='active').select_related('plan'):
+            first = timezone.localdate(investment.start_date) + timedelta(days=1)
+            maturity = timezone.localdate(investment.end_date)
+            for date, totals in days.items():
+                if first <= date <= maturity:
+                    totals[0] += investment.calculate_daily_return()
+            due = max(maturity, self.as_of)  # overdue principal is due now
+            if due in days:
+                days[due][1] += investment.amount
+        days[self.as_of][2] = Transaction.objects.filter(
+            transaction_type='withdrawal', status='pending'
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        return [(date, *totals) for date, totals in sorted(days.items())]
+
+    def assertSnapshot(self, snapshot):
+        stored = [(day.date, day.returns, day.principal, day.withdrawals) for day in snapshot.days.all()]
+        self.assertEqual(stored, self.expected())
+
+    def test_first_snapshot(self):
+        self.assertSnapshot(forecast.take_snapshot(self.as_of))
+
+    def test_incremental_snapshot_after_changes(self):
+        forecast.take_snapshot(self.as_of)
+        active = list(Investment.objects.filter(status='active').order_by('pk')[:6])
+        for investment in active[:3]:
+            lifecycle.complete(investment)
+        for investment in active[3:]:
+            lifecycle.cancel(investment)
+        self.seed(3, offset=150)
+
+        snapshot = forecast.take_snapshot(self.as_of)
+        self.assertSnapshot(snapshot)
+        self.assertLess(snapshot.recomputed, 150)
+
+    def test_plan_rate_change(self):
+        forecast.take_snapshot(self.as_of)
+        self.plans[0].daily_return = Decimal('1.30')
+        self.plans[0].save()
+        self.assertSnapshot(forecast.take_snapshot(self.as_of))
+
+    def test_full_rebuild_replaces_the_snapshot(self):
+        forecast.take_snapshot(self.as_of)
+        self.seed(3, offset=150)
+        self.assertSnapshot(forecast.take_snapshot(self.as_of, full=True))
+        self.assertEqual(LiabilitySnapshot.objects.count(), 1)
+
+
+class WithdrawTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('investor')
+        wallet.credit(self.user, Decimal('50.00'), 'deposits')
+        self.client.force_login(self.user)
+
+    def test_checks_the_wallet_balance(self):
+        response = self.client.post(reverse('withdraw'), {'amount': '60.00', 'wallet_address': 'address'})
+        self.assertFormError(response.context['form'], 'amount', 'Insufficient balance in your wallet.')
+        response = self.client.post(reverse('withdraw'), {'amount': '50.00', 'wallet_address': 'address'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(Transaction.objects.get(user=self.user, transaction_type='withdrawal').amount,
+                         Decimal('50.00'))
+
+
+class RejectTransactionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('investor')
+        self.returns = [
+            Transaction.objects.create(user=self.user, transaction_type='return', amount=Decimal('3.00'),
+                                       status='completed')
+            for _ in range(2)
+        ]
+        self.deposit = Transaction.objects.create(user=self.user, transaction_type='deposit', amount=Decimal('50.00'))
+        ensure_rollups([self.user.pk])
+
+    def test_refreshes_lifetime_earnings(self):
+        approvals.reject_transactions(Transaction.objects.filter(pk__in=[self.returns[0].pk, self.deposit.pk]))
+        self.assertEqual(EarningsRollup.objects.get(user=self.user).lifetime_earnings, Decimal('3.00'))
+        self.assertFalse(Transaction.objects.exclude(pk=self.returns[1].pk).exclude(status='rejected').exists())
+
+    def test_dashboards_expire_after_the_update(self):
+        version = dashboard_version(self.user.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            approvals.reject_transactions(Transaction.objects.filter(pk=self.returns[0].pk))
+            self.assertEqual(dashboard_version(self.user.pk), version)
+        self.assertEqual(Transaction.objects.get(pk=self.returns[0].pk).status, 'rejected')
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(dashboard_version(self.user.pk), version)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'investor{i}') for i in range(2)]
+
+    def assertReconciled(self):
+        for user in self.users:
+            with self.subTest(user.username):
+                self.assertEqual(ledger.balance(user), UserProfile.objects.get(user=user).wallet_balance)
+        # Every journal balances
+        self.assertEqual(LedgerEntry.objects.aggregate(total=Sum('amount'))['total'], Decimal('0.00'))
+
+    def test_wallet_changes_reconcile_with_profiles(self):
+        first, second = self.users
+        wallet.credit(first, Decimal('100.00'), 'deposits')
+        wallet.debit(first, Decimal('30.00'), 'withdrawals')
+        wallet.credit_many({first.pk: Decimal('5.00'), second.pk: Decimal('10.00')}, 'earnings')
+        wallet.debit_many({first.pk: Decimal('25.00'), second.pk: Decimal('4.00')}, 'withdrawals')
+        with self.assertRaises(wallet.InsufficientFunds):
+            wallet.debit(second, Decimal('7.00'), 'withdrawals')
+
+        self.assertReconciled()
+        self.assertEqual([ledger.balance(user) for user in self.users], [Decimal('50.00'), Decimal('6.00')])
+
+    def test_snapshot_plus_tail(self):
+        first, second = self.users
+        wallet.credit(first, Decimal('100.00'), 'deposits')
+        wallet.credit(second, Decimal('20.00'), 'deposits')
+        LedgerEntry.objects.update(created_at=timezone.now() - ledger.SNAPSHOT_LAG - timedelta(minutes=1))
+        # Entries younger than SNAPSHOT_LAG are left to the tail
+        wallet.debit(first, Decimal('40.00'), 'withdrawals')
+
+        self.assertEqual(ledger.snapshot_balances(), 2)
+        self.assertEqual(BalanceSnapshot.objects.get(user=first).balance, Decimal('100.00'))
+        self.assertReconciled()
+
+        wallet.credit(first, Decimal('15.00'), 'earnings')
+        self.assertEqual(ledger.snapshot_balances(), 0)
+        self.assertEqual(ledger.balance(first), Decimal('75.00'))
+        self.assertReconciled()
@@ -24,4 +24,6 @@ urlpatterns = [
     path('deposit/history/', views.deposit_history, name='deposit_history'),
     path('admin/deposits/', views.admin_deposit_list, name='admin_deposit_list'),
     path('admin/deposits/<int:deposit_id>/', views.admin_deposit_detail, name='admin_deposit_detail'),
+    path('exports/<str:dataset>/', views.export_history, name='export_history'),
+    path('reports/liabilities/', views.liability_forecast, name='liability_forecast'),
 ]
\ No newline at end of file
@@ -0,0 +1,51 @@
+from decimal import Decimal
+from django.db.models import Case, DecimalField, F, Func, IntegerField, Value, When
+
+# Keeps each CASE statement well under SQLite's bound-parameter limit
+INCREMENT_BATCH_SIZE = 500
+
+
+def bulk_increment(queryset, key, deltas, fields, batch_size=INCREMENT_BATCH_SIZE):
+    """
+    Add per-row amounts to decimal columns with one UPDATE per batch.
+
+    `deltas` maps a value of `key` (e.g. a user id) to the Decimal to add.
+    Every column in `fields` is incremented by that amount using
+    F() + CASE, so concurrent writers never lose updates.
+    """
+    keys = list(deltas)
+    updated = 0
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        increment = Case(
+            *[When(**{key: k}, then=Value(deltas[k])) for k in batch],
+            default=Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        )
+        updated += queryset.filter(**{f'{key}__in': batch}).update(
+            **{field: F(field) + increment for field in fields}
+        )
+    return updated
+
+
+class DaysBetween(Func):
+    """Whole days from `start` to `end` in SQL, like (end - start).days for end >= start"""
+    output_field = IntegerField()
+
+    def __init__(self, start, end, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            # Django's own SQLite helper for datetime subtraction, in microseconds
+            template='(django_timestamp_diff(%(expressions)s) / 86400000000)', arg_joiner=', ',
+            **extra_context,
+        )
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='EXTRACT(DAY FROM (%(expressions)s))', arg_joiner=' - ',
+            **extra_context,
+        )
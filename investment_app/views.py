@@ -2,14 +2,22 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.db.models import Sum, Count
-from django.http import JsonResponse
-from .models import InvestmentPlan, Investment, Transaction, Referral, UserProfile, Deposit, CryptoWallet, DailyEarning
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from .models import (InvestmentPlan, Investment, Transaction, Referral, UserProfile, Deposit, CryptoWallet, DailyEarning,
+                     LiabilitySnapshot)
+from .rollups import get_rollup
+from .pagination import paginate
+from .plans import get_catalog
+from .caching import dashboard_version, fragment_timeout
+from .referrals import referral_rows, referral_summary
+from . import clock, exports, referral_graph, wallet
+from django.db import transaction as db_transaction
 from .forms import (InvestmentForm, WithdrawalForm, DepositForm, AdminDepositConfirmationForm, 
                     ProfileUpdateForm, UserUpdateForm)
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
-from django.core.paginator import Paginator
 from decimal import Decimal
 import uuid
 from django.contrib import messages
@@ -20,16 +28,16 @@ from django.contrib.auth.forms import AuthenticationForm
 
 
 def index(request):
-    plans = InvestmentPlan.objects.all()
+    plans = get_catalog().all()
     return render(request, 'investment_app/index.html', {'plans': plans})
 
 def investment_plans(request):
-    plans = InvestmentPlan.objects.filter(is_active=True)
+    plans = get_catalog().active()
     return render(request, 'investment_app/investment_plans.html', {'plans': plans})
 
 
-@login_required
-def dashboard(request):
+def dashboard_stats(request):
+    """Figures for the dashboard's stats cards and referral panel"""
     user = request.user
     
     # Get or create user profile
@@ -38,48 +46,45 @@ def dashboard(request):
     except UserProfile.DoesNotExist:
         profile = UserProfile.objects.create(user=user)
     
-    # Get investments with select_related to optimize database queries
-    active_investments = Investment.objects.filter(user=user, status='active').select_related('plan')
-    completed_investments = Investment.objects.filter(user=user, status='completed').select_related('plan')
+    # Earnings and principal totals are maintained incrementally in the rollup
+    rollup = get_rollup(user)
+    total_invested = rollup.invested_principal
+    total_earnings = rollup.lifetime_earnings
     
-    # Get transactions
-    pending_transactions = Transaction.objects.filter(user=user, status='pending')
-    
-    # Calculate total stats
-    total_invested = active_investments.aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
+    # Calculate portfolio growth percentage
+    if total_invested > 0:
+        growth_percentage = ((total_earnings / total_invested) * 100) if total_invested > 0 else 0
+    else:
+        growth_percentage = 0
     
-    # Calculate total earnings from all completed transactions of type 'return' and 'referral'
-    total_earnings = Transaction.objects.filter(
-        user=user, 
-        status='completed',
-        transaction_type__in=['return', 'referral']
-    ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
+    return {
+        'wallet_balance': profile.wallet_balance,
+        'total_invested': total_invested,
+        'total_earnings': total_earnings,
+        'today_earnings': rollup.today_earnings,
+        'weekly_earnings': rollup.weekly_earnings,
+        'total_referral_bonus': profile.total_referral_bonus,
+        'referral_count': Referral.objects.filter(referrer=user).count(),
+        'referral_link': request.build_absolute_uri(f'/register/?ref={profile.referral_code}'),
+        'growth_percentage': round(growth_percentage, 2),
+    }
+
+@login_required
+def dashboard(request):
+    user = request.user
+    today = clock.today()
     
-    # Update profile total_earnings if different
-    if profile.total_earnings != total_earnings:
-        profile.total_earnings = total_earnings
-        profile.save()
+    # Everything below is lazy: the cached template fragments only touch the
+    # database when they have to be re-rendered
+    stats = SimpleLazyObject(lambda: dashboard_stats(request))
     
-    total_referral_bonus = profile.total_referral_bonus
+    # Get investments with select_related to optimize database queries
+    # Day counts are computed in SQL against the request's as-of time
+    active_investments = clock.with_time_fields(Investment.objects.filter(user=user, status='active').select_related('plan'))
+    completed_investments = Investment.objects.filter(user=user, status='completed').select_related('plan')
     
-    # Get today's earnings from DailyEarning model
-    today = timezone.now().date()
-    try:
-        today_earning = DailyEarning.objects.get(user=user, date=today)
-        today_earnings = today_earning.amount
-    except DailyEarning.DoesNotExist:
-        today_earnings = Decimal('0.00')
-    
-    # Get weekly earnings (last 7 days) from DailyEarning model
-    week_ago = today - timezone.timedelta(days=7)
-    weekly_earnings = DailyEarning.objects.filter(
-        user=user, 
-        date__gte=week_ago
-    ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    
-    # Get referral stats
-    referral_count = Referral.objects.filter(referrer=user).count()
-    referral_link = request.build_absolute_uri(f'/register/?ref={profile.referral_code}')
+    # Get transactions
+    pending_transactions = Transaction.objects.filter(user=user, status='pending')
     
     # Get recent activities (last 5 transactions)
     recent_transactions = Transaction.objects.filter(
@@ -87,34 +92,23 @@ def dashboard(request):
     ).order_by('-created_at')[:5]
     
     # Get upcoming investment maturities (next 7 days)
-    upcoming_maturities = Investment.objects.filter(
+    upcoming_maturities = clock.with_time_fields(Investment.objects.filter(
         user=user,
         status='active',
         end_date__lte=today + timezone.timedelta(days=7),
         end_date__gte=today
-    ).order_by('end_date').select_related('plan')
-    
-    # Calculate portfolio growth percentage
-    if total_invested > 0:
-        growth_percentage = ((total_earnings / total_invested) * 100) if total_invested > 0 else 0
-    else:
-        growth_percentage = 0
+    ).order_by('end_date').select_related('plan'))
     
     context = {
-        'profile': profile,
+        'stats': stats,
         'active_investments': active_investments,
         'completed_investments': completed_investments,
         'pending_transactions': pending_transactions,
         'recent_transactions': recent_transactions,
         'upcoming_maturities': upcoming_maturities,
-        'total_invested': total_invested,
-        'total_earnings': total_earnings,
-        'today_earnings': today_earnings,
-        'weekly_earnings': weekly_earnings,
-        'total_referral_bonus': total_referral_bonus,
-        'referral_count': referral_count,
-        'referral_link': referral_link,
-        'growth_percentage': round(growth_percentage, 2),
+        'today': today,
+        'dashboard_version': dashboard_version(user.pk),
+        'fragment_timeout': fragment_timeout(),
     }
     
     return render(request, 'investment_app/dashboard.html', context)
@@ -170,14 +164,16 @@ def profile(request):
 
 @login_required
 def invest(request):
-    plans = InvestmentPlan.objects.filter(is_active=True)
+    plans = get_catalog().active()
     
     if request.method == 'POST':
         plan_id = request.POST.get('plan_id')
         amount = request.POST.get('amount')
         
         try:
-            plan = InvestmentPlan.objects.get(id=plan_id, is_active=True)
+            plan = get_catalog().get(plan_id)
+            if plan is None or not plan.is_active:
+                raise InvestmentPlan.DoesNotExist
             amount_decimal = Decimal(amount)
             
             # Validate amount
@@ -185,32 +181,27 @@ def invest(request):
                 messages.error(request, f'Minimum deposit for {plan.get_name_display()} is ${plan.min_deposit}')
                 return redirect('invest')
             
-            # Check if user has sufficient balance
-            profile = request.user.userprofile
-            if profile.wallet_balance < amount_decimal:
-                messages.error(request, 'Insufficient balance in your wallet')
-                return redirect('invest')
-            
-            # Create investment
-            investment = Investment.objects.create(
-                user=request.user,
-                plan=plan,
-                amount=amount_decimal,
-                status='active'  # Change to active immediately
-            )
-            
-            # Create transaction
-            Transaction.objects.create(
-                user=request.user,
-                transaction_type='deposit',
-                amount=amount_decimal,
-                status='completed',
-                investment=investment
-            )
-            
-            # Deduct from wallet balance
-            profile.wallet_balance -= amount_decimal
-            profile.save()
+            with db_transaction.atomic():
+                # Create investment
+                investment = Investment.objects.create(
+                    user=request.user,
+                    plan=plan,
+                    amount=amount_decimal,
+                    status='active'  # Change to active immediately
+                )
+                
+                # Create transaction
+                transaction = Transaction.objects.create(
+                    user=request.user,
+                    transaction_type='deposit',
+                    amount=amount_decimal,
+                    status='completed',
+                    investment=investment
+                )
+                
+                # Deduct from wallet balance; rolls the investment back if the balance is too low
+                wallet.debit(request.user, amount_decimal, 'investments',
+                             memo=f'Investment #{investment.pk}', transaction=transaction)
             
             messages.success(request, f'Investment in {plan.get_name_display()} created successfully.')
             return redirect('dashboard')
@@ -218,6 +209,9 @@ def invest(request):
         except InvestmentPlan.DoesNotExist:
             messages.error(request, 'Invalid investment plan selected')
             return redirect('invest')
+        except wallet.InsufficientFunds as e:
+            messages.error(request, str(e))
+            return redirect('invest')
         except Exception as e:
             messages.error(request, f'An error occurred: {str(e)}')
             return redirect('invest')
@@ -231,9 +225,9 @@ def withdraw(request):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             
-            # Check if user has sufficient balance
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.wallet_balance < amount:
+            # Check against the balance wallet.debit() takes it from on approval
+            balance = UserProfile.objects.values_list('wallet_balance', flat=True).get(user=request.user)
+            if balance < amount:
                 form.add_error('amount', 'Insufficient balance in your wallet.')
                 return render(request, 'investment_app/withdraw.html', {'form': form})
             
@@ -254,23 +248,26 @@ def withdraw(request):
 
 @login_required
 def transactions(request):
-    transactions_list = Transaction.objects.filter(user=request.user).order_by('-created_at')
-    paginator = Paginator(transactions_list, 10)  #Show 10 transactions per page
-    
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    transactions_list = Transaction.objects.filter(user=request.user)
+    page_obj = paginate(request, transactions_list, 10)  #Show 10 transactions per page
     
     return render(request, 'investment_app/transactions.html', {'transactions': page_obj})
 
 @login_required
 def referrals(request):
-    profile = UserProfile.objects.get(user=request.user)
-    user_referrals = Referral.objects.filter(referrer=request.user)
+    user = request.user
+    profile = UserProfile.objects.get(user=user)
     referral_link = request.build_absolute_uri(f'/register/?ref={profile.referral_code}')
     
     context = {
-        'referrals': user_referrals,
+        'referrals': paginate(request, referral_rows(user), 25),
         'referral_link': referral_link,
+        # Only evaluated when the cached summary fragments are re-rendered
+        'summary': SimpleLazyObject(lambda: referral_summary(user, profile)),
+        'downline_levels': SimpleLazyObject(lambda: referral_graph.downline_levels(user)),
+        'today': clock.today(),
+        'dashboard_version': dashboard_version(user.pk),
+        'fragment_timeout': fragment_timeout(),
     }
     
     return render(request, 'investment_app/referrals.html', context)
@@ -401,12 +398,11 @@ def deposit_funds(request):
 
 @login_required
 def deposit_history(request):
-    deposits = Deposit.objects.filter(user=request.user).order_by('-created_at')
+    # Each row shows the wallet's network
+    deposits = Deposit.objects.filter(user=request.user).select_related('crypto_wallet')
     
     # Pagination
-    paginator = Paginator(deposits, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, deposits, 10)
     
     context = {
         'deposits': page_obj,
@@ -418,7 +414,8 @@ def deposit_history(request):
 def admin_deposit_list(request):
     status_filter = request.GET.get('status', 'pending')
     
-    deposits = Deposit.objects.all().order_by('-created_at')
+    # Each row shows the depositor and the wallet's network
+    deposits = Deposit.objects.select_related('user', 'crypto_wallet')
     
     if status_filter != 'all':
         deposits = deposits.filter(status=status_filter)
@@ -433,9 +430,7 @@ def admin_deposit_list(request):
         )
     
     # Pagination
-    paginator = Paginator(deposits, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, deposits, 20)
     
     context = {
         'deposits': page_obj,
@@ -456,20 +451,18 @@ def admin_deposit_detail(request, deposit_id):
             if 'status' in form.changed_data:
                 if form.cleaned_data['status'] == 'confirmed':
                     updated_deposit.confirmed_by = request.user
-                    # Add deposit amount to user's wallet balance
-                    profile = updated_deposit.user.userprofile
-                    profile.wallet_balance += updated_deposit.amount
-                    profile.save()
-                    
                     # Create transaction record
-                    from .models import Transaction
-                    Transaction.objects.create(
+                    transaction = Transaction.objects.create(
                         user=updated_deposit.user,
                         transaction_type='deposit',
                         amount=updated_deposit.amount,
                         status='completed',
                         investment=None
                     )
+                    
+                    # Add deposit amount to user's wallet balance
+                    wallet.credit(updated_deposit.user, updated_deposit.amount, 'deposits',
+                                  memo=f'Deposit {updated_deposit.reference_id}', transaction=transaction)
             updated_deposit.save()
             messages.success(request, 'Deposit status updated successfully.')
             return redirect('admin_deposit_list')
@@ -502,7 +495,7 @@ def confirm_deposit(request, deposit_id):
     return redirect('admin:investment_app_deposit_changelist')
 
 def home(request):
-    plans = InvestmentPlan.objects.filter(is_active=True)
+    plans = get_catalog().active()
     return render(request, 'investment_app/home.html', {'plans': plans})
 
 def about(request):
@@ -512,4 +505,51 @@ def terms(request):
     return render(request, 'investment_app/terms.html')
 
 def privacy(request):
-    return render(request, 'investment_app/privacy.html')
\ No newline at end of file
+    return render(request, 'investment_app/privacy.html')
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def liability_forecast(request):
+    """
+    The stored liability forecast for ?date= (default: the latest); the
+    snapshots are written by `manage.py forecast_liabilities`
+    """
+    try:
+        as_of = exports.parse_date(request.GET.get('date'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    snapshots = LiabilitySnapshot.objects.all()
+    snapshot = get_object_or_404(snapshots, as_of=as_of) if as_of else snapshots.first()
+
+    context = {
+        'snapshot': snapshot,
+        'days': snapshot.days.all() if snapshot else [],
+        'recent_dates': snapshots.values_list('as_of', flat=True)[:14],
+    }
+    return render(request, 'investment_app/liability_forecast.html', context)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def export_history(request, dataset):
+    """Stream a history export; see investment_app/exports.py for the filters"""
+    if dataset not in exports.DATASETS:
+        raise Http404('Unknown export')
+    export_format = request.GET.get('format', 'csv')
+    try:
+        header, rows = exports.export_rows(
+            dataset,
+            user=request.GET.get('user'),
+            since=exports.parse_date(request.GET.get('since')),
+            until=exports.parse_date(request.GET.get('until')),
+            type=request.GET.get('type'),
+            status=request.GET.get('status'),
+        )
+        lines = exports.encode(header, rows, export_format)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(lines, content_type=exports.FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{export_format}"'
+    return response
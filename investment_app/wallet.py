@@ -0,0 +1,88 @@
+"""
+Wallet balance mutations.
+
+All changes to UserProfile.wallet_balance go through here. Each one posts
+the matching ledger journal and adjusts the profile with a single
+F()-expression UPDATE of only the affected columns, in one transaction, so
+concurrent requests can't lose each other's updates.
+"""
+from django.db import transaction as db_transaction
+from django.db.models import F
+from . import codes, ledger
+from .models import UserProfile
+from .utils import bulk_increment
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def credit(user, amount, account, memo='', transaction=None, counters=()):
+    """
+    Add `amount` to `user`'s wallet. `counters` names other profile totals
+    (e.g. 'total_earnings') to increase by the same amount.
+    """
+    with db_transaction.atomic():
+        ledger.post(user, amount, account, memo=memo, transaction=transaction)
+        updated = UserProfile.objects.filter(user=user).update(
+            wallet_balance=F('wallet_balance') + amount,
+            **{field: F(field) + amount for field in counters}
+        )
+        if not updated:
+            UserProfile.objects.create(
+                user=user, wallet_balance=amount, **{field: amount for field in counters}
+            )
+
+
+def debit(user, amount, account, memo='', transaction=None):
+    """
+    Take `amount` from `user`'s wallet, or raise InsufficientFunds. The
+    balance check and the decrement are the same conditional UPDATE, so two
+    concurrent debits can never overdraw the wallet.
+    """
+    with db_transaction.atomic():
+        updated = UserProfile.objects.filter(user=user, wallet_balance__gte=amount).update(
+            wallet_balance=F('wallet_balance') - amount
+        )
+        if not updated:
+            raise InsufficientFunds('Insufficient balance in your wallet')
+        ledger.post(user, -amount, account, memo=memo, transaction=transaction)
+
+
+def credit_many(amounts, account, memo='', counters=()):
+    """
+    Credit {user_id: amount} with one ledger INSERT and batched UPDATEs,
+    creating profiles for users that don't have one yet.
+    """
+    with db_transaction.atomic():
+        with_profile = set(
+            UserProfile.objects.filter(user_id__in=list(amounts)).values_list('user_id', flat=True)
+        )
+        missing = [user_id for user_id in amounts if user_id not in with_profile]
+        codes.reserve(codes.REFERRAL_CODE, len(missing))
+        UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in missing])
+        ledger.post_many(amounts, account, memo=memo)
+        bulk_increment(UserProfile.objects.all(), 'user_id', amounts, ['wallet_balance', *counters])
+
+
+def lock_balances(user_ids):
+    """{user_id: wallet balance}, with the profiles locked until the transaction ends"""
+    return dict(
+        UserProfile.objects.select_for_update().filter(user_id__in=list(user_ids))
+        .values_list('user_id', 'wallet_balance')
+    )
+
+
+def debit_many(amounts, account, memo=''):
+    """
+    Debit {user_id: amount} with one ledger INSERT and batched UPDATEs.
+    Raises InsufficientFunds, debiting nobody, if any balance is too low.
+    """
+    with db_transaction.atomic():
+        balances = lock_balances(amounts)
+        short = [user_id for user_id, amount in amounts.items() if balances.get(user_id, 0) < amount]
+        if short:
+            raise InsufficientFunds(f'Insufficient balance for {len(short)} user(s)')
+        negated = {user_id: -amount for user_id, amount in amounts.items()}
+        ledger.post_many(negated, account, memo=memo)
+        bulk_increment(UserProfile.objects.all(), 'user_id', negated, ['wallet_balance'])